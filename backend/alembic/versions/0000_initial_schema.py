@@ -0,0 +1,117 @@
+"""initial schema
+
+Revision ID: 0000_initial_schema
+Revises:
+Create Date: 2026-10-18 08:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0000_initial_schema'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _create_table(inspector, name, *columns):
+    # Databases from before migrations were used already have these tables
+    if inspector.has_table(name):
+        return False
+    op.create_table(name, *columns)
+    op.create_index(f'ix_{name}_id', name, ['id'])
+    return True
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if _create_table(
+        inspector, 'users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('hashed_password', sa.String(), nullable=False),
+        sa.Column('role', sa.String(), nullable=False),
+    ):
+        op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    _create_table(
+        inspector, 'classes',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('teacher_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        inspector, 'class_enrollments',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('class_id', sa.Integer(), sa.ForeignKey('classes.id'), nullable=True),
+        sa.Column('student_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('enrolled_at', sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        inspector, 'sessions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('teacher_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('class_id', sa.Integer(), sa.ForeignKey('classes.id'), nullable=True),
+        sa.Column('session_type', sa.String(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=True),
+        sa.Column('end_time', sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        inspector, 'messages',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('session_id', sa.Integer(), sa.ForeignKey('sessions.id'), nullable=True),
+        sa.Column('sender_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('message_text', sa.Text(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        inspector, 'quizzes',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('session_id', sa.Integer(), sa.ForeignKey('sessions.id'), nullable=True),
+        sa.Column('question_text', sa.Text(), nullable=False),
+        sa.Column('options', sa.JSON(), nullable=True),
+        sa.Column('correct_answer', sa.String(), nullable=False),
+        sa.Column('explanation', sa.Text(), nullable=True),
+        sa.Column('created_by', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+    )
+    _create_table(
+        inspector, 'quiz_responses',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('quiz_id', sa.Integer(), sa.ForeignKey('quizzes.id'), nullable=True),
+        sa.Column('student_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('selected_answer', sa.String(), nullable=False),
+        sa.Column('is_correct', sa.Boolean(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        inspector, 'whiteboard_data',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('session_id', sa.Integer(), sa.ForeignKey('sessions.id'), nullable=True),
+        sa.Column('data_json', sa.JSON(), nullable=False),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        inspector, 'feedback',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('from_user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('to_user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('session_id', sa.Integer(), sa.ForeignKey('sessions.id'), nullable=True),
+        sa.Column('comment', sa.Text(), nullable=False),
+        sa.Column('rating', sa.Integer(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in ('feedback', 'whiteboard_data', 'quiz_responses', 'quizzes', 'messages',
+                 'sessions', 'class_enrollments', 'classes', 'users'):
+        op.drop_table(name)
@@ -0,0 +1,42 @@
+"""unique (class_id, student_id) on class_enrollments
+
+Revision ID: 0001_unique_class_enrollment
+Revises: 0000_initial_schema
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001_unique_class_enrollment'
+down_revision: Union[str, None] = '0000_initial_schema'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CONSTRAINT = 'uq_class_enrollments_class_student'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if CONSTRAINT in {uc['name'] for uc in inspector.get_unique_constraints('class_enrollments')}:
+        return
+
+    # Keep the earliest enrollment of every duplicated (class, student) pair
+    op.execute(
+        "DELETE FROM class_enrollments "
+        "WHERE class_id IS NOT NULL AND student_id IS NOT NULL AND id NOT IN ("
+        "SELECT MIN(id) FROM class_enrollments GROUP BY class_id, student_id)"
+    )
+    with op.batch_alter_table('class_enrollments') as batch_op:
+        batch_op.create_unique_constraint(CONSTRAINT, ['class_id', 'student_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('class_enrollments') as batch_op:
+        batch_op.drop_constraint(CONSTRAINT, type_='unique')
@@ -0,0 +1,53 @@
+"""indexes for the hot query predicates
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_unique_class_enrollment
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_hot_path_indexes'
+down_revision: Union[str, None] = '0001_unique_class_enrollment'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, columns): a parent filter followed by id, the keyset
+# pagination order, so "WHERE parent = ? AND id > ? ORDER BY id LIMIT n"
+# is a single index range scan
+INDEXES = [
+    ('ix_users_role_id', 'users', ['role', 'id']),
+    ('ix_classes_teacher_id', 'classes', ['teacher_id']),
+    ('ix_class_enrollments_student_id_class_id', 'class_enrollments', ['student_id', 'class_id']),
+    ('ix_sessions_teacher_id_id', 'sessions', ['teacher_id', 'id']),
+    ('ix_sessions_class_id', 'sessions', ['class_id']),
+    ('ix_messages_session_id_id', 'messages', ['session_id', 'id']),
+    ('ix_quizzes_session_id_id', 'quizzes', ['session_id', 'id']),
+    ('ix_quiz_responses_quiz_id_id', 'quiz_responses', ['quiz_id', 'id']),
+    ('ix_whiteboard_data_session_id_id', 'whiteboard_data', ['session_id', 'id']),
+    ('ix_feedback_session_id', 'feedback', ['session_id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    concurrently = bind.dialect.name == 'postgresql'
+    # CREATE INDEX CONCURRENTLY keeps live tables writable but cannot run in a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            if name in {ix['name'] for ix in inspector.get_indexes(table)}:
+                continue
+            op.create_index(name, table, columns, postgresql_concurrently=concurrently)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,82 @@
+"""aggregate tables for quiz analytics
+
+Revision ID: 0003_quiz_analytics
+Revises: 0002_hot_path_indexes
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_quiz_analytics'
+down_revision: Union[str, None] = '0002_hot_path_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'quiz_stats' not in existing:
+        op.create_table(
+            'quiz_stats',
+            sa.Column('quiz_id', sa.Integer(), sa.ForeignKey('quizzes.id'), primary_key=True),
+            sa.Column('session_id', sa.Integer(), sa.ForeignKey('sessions.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('responses', sa.Integer(), nullable=False),
+            sa.Column('correct', sa.Integer(), nullable=False),
+        )
+        op.create_index('ix_quiz_stats_session_id', 'quiz_stats', ['session_id'])
+    if 'quiz_answer_stats' not in existing:
+        op.create_table(
+            'quiz_answer_stats',
+            sa.Column('quiz_id', sa.Integer(), sa.ForeignKey('quizzes.id'), primary_key=True),
+            sa.Column('selected_answer', sa.String(), primary_key=True),
+            sa.Column('responses', sa.Integer(), nullable=False),
+        )
+    if 'student_session_stats' not in existing:
+        op.create_table(
+            'student_session_stats',
+            sa.Column('session_id', sa.Integer(), sa.ForeignKey('sessions.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('student_id', sa.Integer(), sa.ForeignKey('users.id'), primary_key=True),
+            sa.Column('responses', sa.Integer(), nullable=False),
+            sa.Column('correct', sa.Integer(), nullable=False),
+        )
+        op.create_index('ix_student_session_stats_student_id', 'student_session_stats', ['student_id'])
+
+    # Backfill from the responses recorded so far; from here on app.analytics
+    # keeps the aggregates current
+    op.execute("DELETE FROM quiz_stats")
+    op.execute("DELETE FROM quiz_answer_stats")
+    op.execute("DELETE FROM student_session_stats")
+    op.execute(
+        "INSERT INTO quiz_stats (quiz_id, session_id, responses, correct) "
+        "SELECT q.id, q.session_id, COUNT(*), SUM(CASE WHEN r.is_correct THEN 1 ELSE 0 END) "
+        "FROM quiz_responses r JOIN quizzes q ON q.id = r.quiz_id "
+        "WHERE q.session_id IS NOT NULL GROUP BY q.id, q.session_id"
+    )
+    op.execute(
+        "INSERT INTO quiz_answer_stats (quiz_id, selected_answer, responses) "
+        "SELECT r.quiz_id, r.selected_answer, COUNT(*) "
+        "FROM quiz_responses r JOIN quizzes q ON q.id = r.quiz_id "
+        "WHERE q.session_id IS NOT NULL GROUP BY r.quiz_id, r.selected_answer"
+    )
+    op.execute(
+        "INSERT INTO student_session_stats (session_id, student_id, responses, correct) "
+        "SELECT q.session_id, r.student_id, COUNT(*), SUM(CASE WHEN r.is_correct THEN 1 ELSE 0 END) "
+        "FROM quiz_responses r JOIN quizzes q ON q.id = r.quiz_id "
+        "WHERE q.session_id IS NOT NULL AND r.student_id IS NOT NULL GROUP BY q.session_id, r.student_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_student_session_stats_student_id', table_name='student_session_stats')
+    op.drop_table('student_session_stats')
+    op.drop_table('quiz_answer_stats')
+    op.drop_index('ix_quiz_stats_session_id', table_name='quiz_stats')
+    op.drop_table('quiz_stats')
@@ -0,0 +1,40 @@
+"""cache table for AI generated question sets
+
+Revision ID: 0004_ai_question_sets
+Revises: 0003_quiz_analytics
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_ai_question_sets'
+down_revision: Union[str, None] = '0003_quiz_analytics'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if 'ai_question_sets' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'ai_question_sets',
+        sa.Column('key', sa.String(length=64), primary_key=True),
+        sa.Column('subject', sa.String(), nullable=False),
+        sa.Column('grade_level', sa.String(), nullable=False),
+        sa.Column('difficulty', sa.String(), nullable=False),
+        sa.Column('topic', sa.String(), nullable=True),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('questions', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('ai_question_sets')
@@ -0,0 +1,65 @@
+"""unique (quiz_id, student_id) on quiz_responses
+
+Revision ID: 0005_unique_quiz_response
+Revises: 0004_ai_question_sets
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005_unique_quiz_response'
+down_revision: Union[str, None] = '0004_ai_question_sets'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CONSTRAINT = 'uq_quiz_responses_quiz_student'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if CONSTRAINT in {uc['name'] for uc in inspector.get_unique_constraints('quiz_responses')}:
+        return
+
+    # Keep each student's first answer to a quiz
+    op.execute(
+        "DELETE FROM quiz_responses "
+        "WHERE quiz_id IS NOT NULL AND student_id IS NOT NULL AND id NOT IN ("
+        "SELECT MIN(id) FROM quiz_responses GROUP BY quiz_id, student_id)"
+    )
+    with op.batch_alter_table('quiz_responses') as batch_op:
+        batch_op.create_unique_constraint(CONSTRAINT, ['quiz_id', 'student_id'])
+
+    # The aggregates counted the duplicates just removed; rebuild them
+    op.execute("DELETE FROM quiz_stats")
+    op.execute("DELETE FROM quiz_answer_stats")
+    op.execute("DELETE FROM student_session_stats")
+    op.execute(
+        "INSERT INTO quiz_stats (quiz_id, session_id, responses, correct) "
+        "SELECT q.id, q.session_id, COUNT(*), SUM(CASE WHEN r.is_correct THEN 1 ELSE 0 END) "
+        "FROM quiz_responses r JOIN quizzes q ON q.id = r.quiz_id "
+        "WHERE q.session_id IS NOT NULL GROUP BY q.id, q.session_id"
+    )
+    op.execute(
+        "INSERT INTO quiz_answer_stats (quiz_id, selected_answer, responses) "
+        "SELECT r.quiz_id, r.selected_answer, COUNT(*) "
+        "FROM quiz_responses r JOIN quizzes q ON q.id = r.quiz_id "
+        "WHERE q.session_id IS NOT NULL GROUP BY r.quiz_id, r.selected_answer"
+    )
+    op.execute(
+        "INSERT INTO student_session_stats (session_id, student_id, responses, correct) "
+        "SELECT q.session_id, r.student_id, COUNT(*), SUM(CASE WHEN r.is_correct THEN 1 ELSE 0 END) "
+        "FROM quiz_responses r JOIN quizzes q ON q.id = r.quiz_id "
+        "WHERE q.session_id IS NOT NULL AND r.student_id IS NOT NULL GROUP BY q.session_id, r.student_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('quiz_responses') as batch_op:
+        batch_op.drop_constraint(CONSTRAINT, type_='unique')
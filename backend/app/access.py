@@ -0,0 +1,179 @@
+"""Who may use a session or class, decided once and cached.
+
+The rules are the ones the endpoints and the WebSocket handshake have always
+applied: a teacher may use the sessions and classes they own; a student may
+use a class they are enrolled in, and a session that is either standalone
+or belongs to such a class. A decision costs one query on a miss and none
+while cached.
+
+Decisions are dropped when a student's enrollments change or a session is
+created, changed or deleted (see the listeners in crud). Like the principal
+cache this is per worker, so `ACCESS_CACHE_TTL` bounds how long another
+worker may act on a revoked enrollment.
+"""
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional
+from fastapi import HTTPException
+from sqlalchemy import select, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+from .cache import TTLCache
+
+# REST error details by reason; the WebSocket handshake has its own wording
+DETAILS = {
+    'session_not_found': (404, "Session not found"),
+    'class_not_found': (404, "Class not found"),
+    'not_session_owner': (403, "Not authorized to access this session"),
+    'not_class_owner': (403, "Not authorized to access this class"),
+    'not_enrolled': (403, "Not enrolled in this class"),
+}
+
+
+@dataclass(frozen=True)
+class Access:
+    allowed: bool
+    relation: Optional[str] = None  # "teacher" (owner) or "student" when allowed
+    reason: Optional[str] = None  # a DETAILS key when not allowed
+    teacher_id: Optional[int] = None
+    class_id: Optional[int] = None
+
+    @property
+    def found(self) -> bool:
+        return self.reason not in ('session_not_found', 'class_not_found')
+
+    def require(self) -> "Access":
+        """Raise the endpoint's HTTP error unless allowed"""
+        if not self.allowed:
+            status_code, detail = DETAILS[self.reason]
+            raise HTTPException(status_code=status_code, detail=detail)
+        return self
+
+
+class AccessCache:
+    """TTLCache of decisions, invalidated per student and per session.
+
+    Invalidating records when it happened; a decision made before the last
+    invalidation of its student or session is stale. Those records are only
+    kept for `ttl` seconds, after which every decision older than them has
+    expired anyway, so memory follows the invalidation rate rather than
+    every id ever invalidated.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.decisions = TTLCache(maxsize, ttl)
+        # ('student', id) or ('session', id) -> monotonic time, oldest first
+        self._invalidated: "OrderedDict[tuple, float]" = OrderedDict()
+
+    def _stale(self, made_at: float, user_id: int, session_id: Optional[int]) -> bool:
+        for mark in (('student', user_id), ('session', session_id)):
+            invalidated_at = self._invalidated.get(mark)
+            if invalidated_at is not None and made_at <= invalidated_at:
+                return True
+        return False
+
+    def get(self, key: Hashable, user_id: int, session_id: Optional[int] = None) -> Optional[Access]:
+        entry = self.decisions.get(key)
+        if entry is None:
+            return None
+        access, made_at = entry
+        if self._stale(made_at, user_id, session_id):
+            self.decisions.invalidate(key)
+            return None
+        return access
+
+    def set(self, key: Hashable, access: Access, made_at: float):
+        """Cache a decision read from the database at `made_at` (see now())"""
+        self.decisions.set(key, (access, made_at))
+
+    @staticmethod
+    def now() -> float:
+        return time.monotonic()
+
+    def _invalidate(self, mark: tuple):
+        now = time.monotonic()
+        self._invalidated[mark] = now
+        self._invalidated.move_to_end(mark)
+        cutoff = now - self.decisions.ttl
+        while self._invalidated and next(iter(self._invalidated.values())) < cutoff:
+            self._invalidated.popitem(last=False)
+
+    def invalidate_student(self, student_id: int):
+        self._invalidate(('student', student_id))
+
+    def invalidate_session(self, session_id: int):
+        self._invalidate(('session', session_id))
+
+    def clear(self):
+        self.decisions.clear()
+
+    def stats(self) -> dict:
+        return {**self.decisions.stats(), 'invalidation_marks': len(self._invalidated)}
+
+
+access_cache = AccessCache(
+    maxsize=int(os.getenv("ACCESS_CACHE_SIZE", "50000")),
+    ttl=float(os.getenv("ACCESS_CACHE_TTL", "60")),
+)
+
+
+async def session_access(db: AsyncSession, user, session_id: int) -> Access:
+    key = ('session', session_id, user.id)
+    access = access_cache.get(key, user.id, session_id)
+    if access is not None:
+        return access
+    # Before the query, so an invalidation while it runs makes the result stale
+    made_at = access_cache.now()
+
+    # Session and, for students, their enrollment in its class in one query
+    enrollment = models.ClassEnrollment
+    result = await db.execute(
+        select(models.Session.teacher_id, models.Session.class_id, enrollment.id)
+        .outerjoin(enrollment, and_(enrollment.class_id == models.Session.class_id,
+                                    enrollment.student_id == user.id))
+        .where(models.Session.id == session_id)
+    )
+    row = result.first()
+    if row is None:
+        # Not cached: the id may belong to a session created a moment later
+        return Access(False, reason='session_not_found')
+    teacher_id, class_id, enrollment_id = row
+    if user.role == "teacher":
+        owner = teacher_id == user.id
+        access = Access(owner, 'teacher' if owner else None, None if owner else 'not_session_owner', teacher_id, class_id)
+    elif class_id is None or enrollment_id is not None:
+        access = Access(True, 'student', None, teacher_id, class_id)
+    else:
+        access = Access(False, None, 'not_enrolled', teacher_id, class_id)
+    access_cache.set(key, access, made_at)
+    return access
+
+
+async def class_access(db: AsyncSession, user, class_id: int) -> Access:
+    key = ('class', class_id, user.id)
+    access = access_cache.get(key, user.id)
+    if access is not None:
+        return access
+    made_at = access_cache.now()
+
+    enrollment = models.ClassEnrollment
+    result = await db.execute(
+        select(models.Class.teacher_id, enrollment.id)
+        .outerjoin(enrollment, and_(enrollment.class_id == models.Class.id, enrollment.student_id == user.id))
+        .where(models.Class.id == class_id)
+    )
+    row = result.first()
+    if row is None:
+        return Access(False, reason='class_not_found')
+    teacher_id, enrollment_id = row
+    if user.role == "teacher":
+        owner = teacher_id == user.id
+        access = Access(owner, 'teacher' if owner else None, None if owner else 'not_class_owner', teacher_id, class_id)
+    elif enrollment_id is not None:
+        access = Access(True, 'student', None, teacher_id, class_id)
+    else:
+        access = Access(False, None, 'not_enrolled', teacher_id, class_id)
+    access_cache.set(key, access, made_at)
+    return access
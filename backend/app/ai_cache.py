@@ -0,0 +1,166 @@
+"""Caching and deduplication for AI question generation.
+
+A question set is stored under a hash of everything that shapes the prompt
+(model, subject, grade level, difficulty, topic, count). Lookups try this
+worker's LRU, then the ai_question_sets table shared by all workers, and
+only then the model. Identical requests that arrive while a set is being
+generated wait for that one call instead of starting their own.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from . import crud, ai_quiz, metrics
+from .ai_quiz import QuestionGenerationRequest, QuestionGenerationResponse
+from .cache import TTLCache
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "256"))
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", "3600"))
+# Seconds a stored set is reused; 0 keeps them indefinitely
+AI_CACHE_DB_TTL = float(os.getenv("AI_CACHE_DB_TTL", str(7 * 86400)))
+# Comma-separated subject:grade_level pairs generated at startup, e.g. "math:primary,science:middle"
+AI_PREWARM = os.getenv("AI_PREWARM", "")
+AI_PREWARM_COUNT = int(os.getenv("AI_PREWARM_COUNT", "10"))
+
+
+def cache_key(request: QuestionGenerationRequest) -> str:
+    topic = " ".join((request.topic or "").split()).casefold()
+    fields = [ai_quiz.MODEL, request.subject, request.grade_level, request.difficulty, topic, request.count]
+    return hashlib.sha256(json.dumps(fields).encode()).hexdigest()
+
+
+def parse_prewarm(spec: str) -> List[Tuple[str, str]]:
+    pairs = []
+    for item in spec.split(","):
+        subject, _, grade_level = item.strip().partition(":")
+        if subject and grade_level:
+            pairs.append((subject, grade_level))
+    return pairs
+
+
+class QuestionSetCache:
+    def __init__(self, generate: Callable[[QuestionGenerationRequest], QuestionGenerationResponse] = None,
+                 memory: TTLCache = None, db_ttl: float = AI_CACHE_DB_TTL):
+        # Looked up at call time so ai_quiz.set_client() and test doubles take effect
+        self.generate = generate or (lambda request: ai_quiz.generate_quiz_questions(request))
+        self.memory = memory or TTLCache(AI_CACHE_SIZE, AI_CACHE_TTL)
+        self.db_ttl = db_ttl
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._prewarm: Optional[asyncio.Task] = None
+        self.db_hits = 0
+        self.generations = 0
+        self.coalesced = 0
+
+    async def get(self, request: QuestionGenerationRequest) -> QuestionGenerationResponse:
+        if not request.refresh:
+            response = await self.lookup(request)
+            if response is not None:
+                return response
+        return await self._generate_once(cache_key(request), request)
+
+    async def lookup(self, request: QuestionGenerationRequest) -> Optional[QuestionGenerationResponse]:
+        """The cached set for a request, from memory or the database, or None"""
+        key = cache_key(request)
+        response = self.memory.get(key)
+        if response is None:
+            response = await self._load(key)
+        return response.model_copy(update={"cached": True}) if response is not None else None
+
+    async def store(self, request: QuestionGenerationRequest, response: QuestionGenerationResponse):
+        key = cache_key(request)
+        self.memory.set(key, response)
+        try:
+            async with SessionLocal() as db:
+                await crud.save_question_set(db, key, {
+                    "subject": response.subject,
+                    "grade_level": request.grade_level,
+                    "difficulty": response.difficulty,
+                    "topic": response.topic,
+                    "count": response.count,
+                    "questions": response.questions,
+                })
+        except Exception:
+            logger.exception("Failed to store generated question set %s", key[:12])
+
+    async def _generate_once(self, key: str, request: QuestionGenerationRequest) -> QuestionGenerationResponse:
+        task = self._inflight.get(key)
+        if task is None:
+            self.generations += 1
+            task = self._inflight[key] = asyncio.create_task(self._generate(request))
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        # A caller that disconnects must not cancel the generation others wait for
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every waiter has gone
+
+    async def _generate(self, request: QuestionGenerationRequest) -> QuestionGenerationResponse:
+        # The OpenAI client is synchronous and takes seconds
+        start = time.perf_counter()
+        try:
+            response = await asyncio.to_thread(self.generate, request)
+        except Exception:
+            metrics.ai_generation_latency.observe(time.perf_counter() - start, path="request", outcome="error")
+            raise
+        metrics.ai_generation_latency.observe(time.perf_counter() - start, path="request", outcome="ok")
+        await self.store(request, response)
+        return response
+
+    async def _load(self, key: str) -> Optional[QuestionGenerationResponse]:
+        not_before = datetime.utcnow() - timedelta(seconds=self.db_ttl) if self.db_ttl > 0 else None
+        async with SessionLocal() as db:
+            row = await crud.get_question_set(db, key, not_before)
+        if row is None:
+            return None
+        self.db_hits += 1
+        response = QuestionGenerationResponse(
+            questions=row.questions, subject=row.subject, topic=row.topic,
+            difficulty=row.difficulty, count=row.count,
+        )
+        self.memory.set(key, response)
+        return response
+
+    def start_prewarm(self, pairs: List[Tuple[str, str]], count: int = AI_PREWARM_COUNT):
+        if pairs and self._prewarm is None:
+            self._prewarm = asyncio.create_task(self.prewarm(pairs, count))
+
+    async def prewarm(self, pairs: List[Tuple[str, str]], count: int = AI_PREWARM_COUNT):
+        """Make sure a default set exists for each (subject, grade level), one at a time"""
+        for subject, grade_level in pairs:
+            request = QuestionGenerationRequest(subject=subject, grade_level=grade_level, count=count)
+            try:
+                await self.get(request)
+            except Exception as e:
+                logger.warning("Prewarming %s/%s failed: %s", subject, grade_level, getattr(e, "detail", e))
+
+    async def close(self):
+        if self._prewarm is not None:
+            self._prewarm.cancel()
+            try:
+                await self._prewarm
+            except asyncio.CancelledError:
+                pass
+            self._prewarm = None
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "db_hits": self.db_hits,
+            "generations": self.generations,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+
+question_cache = QuestionSetCache()
@@ -0,0 +1,277 @@
+"""Background AI question generation jobs.
+
+POST /ai/jobs starts a job and returns its id at once. The job streams the
+completion from the async OpenAI client and parses the JSON array as it
+arrives, so each valid question is available, through GET /ai/jobs/{id} or
+the server-sent events of GET /ai/jobs/{id}/stream, as soon as its closing
+brace is received. At most AI_JOB_CONCURRENCY jobs call the model at once.
+Each attempt may take AI_JOB_TIMEOUT seconds; a failed or short attempt is
+retried for the questions still missing, keeping those already received.
+
+Jobs live in the memory of the worker that created them for AI_JOB_TTL
+seconds after they finish, and at most AI_JOB_MAX_FINISHED finished jobs are
+kept. A worker accepts AI_JOB_QUEUE unfinished jobs; past that, new jobs are
+refused with 429 until some finish.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
+from fastapi import HTTPException
+from pydantic import BaseModel
+from . import ai_quiz, metrics
+from .ai_quiz import QuestionGenerationRequest, QuestionGenerationResponse, build_messages, is_valid_question
+from .ai_cache import QuestionSetCache, question_cache
+
+logger = logging.getLogger(__name__)
+
+AI_JOB_CONCURRENCY = int(os.getenv("AI_JOB_CONCURRENCY", "4"))
+AI_JOB_TIMEOUT = float(os.getenv("AI_JOB_TIMEOUT", "60"))
+AI_JOB_RETRIES = int(os.getenv("AI_JOB_RETRIES", "2"))
+AI_JOB_TTL = float(os.getenv("AI_JOB_TTL", "900"))
+AI_JOB_QUEUE = int(os.getenv("AI_JOB_QUEUE", "32"))
+AI_JOB_MAX_FINISHED = int(os.getenv("AI_JOB_MAX_FINISHED", "1000"))
+# Seconds between SSE comments that keep idle proxies from closing the stream
+SSE_KEEPALIVE = 15
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str  # queued, running, completed, failed
+    requested: int
+    questions: List[dict]
+    error: Optional[str] = None
+    cached: bool = False
+    attempts: int = 0
+
+
+class QuestionStreamParser:
+    """Pulls complete objects out of a JSON array that arrives in pieces.
+
+    Anything before the opening bracket (such as a ```json fence) is
+    skipped, and an object that does not parse is dropped without affecting
+    the ones after it.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer: List[str] = []
+
+    def feed(self, text: str) -> List[object]:
+        objects = []
+        for ch in text:
+            if not self._started:
+                self._started = ch == "["
+                continue
+            if self._depth == 0:
+                # Between elements: commas, whitespace, the closing bracket
+                if ch == "{":
+                    self._depth = 1
+                    self._buffer = [ch]
+                continue
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        objects.append(json.loads("".join(self._buffer)))
+                    except ValueError:
+                        pass
+                    self._buffer = []
+        return objects
+
+
+class Job:
+    def __init__(self, owner_id: int, request: QuestionGenerationRequest):
+        self.id = uuid.uuid4().hex
+        self.owner_id = owner_id
+        self.request = request
+        self.status = "queued"
+        self.questions: List[dict] = []
+        self.error: Optional[str] = None
+        self.cached = False
+        self.attempts = 0
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def notify(self):
+        # Wake everyone waiting on the current event; later waiters get a new one
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.monotonic()
+        self.notify()
+
+    def snapshot(self, questions: bool = True) -> dict:
+        return JobStatus(
+            job_id=self.id, status=self.status, requested=self.request.count,
+            questions=self.questions if questions else [], error=self.error,
+            cached=self.cached, attempts=self.attempts,
+        ).model_dump()
+
+    async def events(self) -> AsyncIterator[str]:
+        """Server-sent events: one `question` per question, then `done` with the final status"""
+        sent = 0
+        while True:
+            changed = self._changed
+            while sent < len(self.questions):
+                data = {"index": sent, "question": self.questions[sent]}
+                sent += 1
+                yield f"event: question\ndata: {json.dumps(data)}\n\n"
+            if self.finished:
+                yield f"event: done\ndata: {json.dumps(self.snapshot(questions=False))}\n\n"
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+
+
+class AIJobs:
+    def __init__(self, concurrency: int = AI_JOB_CONCURRENCY, timeout: float = AI_JOB_TIMEOUT,
+                 retries: int = AI_JOB_RETRIES, ttl: float = AI_JOB_TTL, cache: QuestionSetCache = question_cache,
+                 queue: int = AI_JOB_QUEUE, max_finished: int = AI_JOB_MAX_FINISHED):
+        self.timeout = timeout
+        self.retries = retries
+        self.ttl = ttl
+        self.cache = cache
+        self.queue = queue
+        self.max_finished = max_finished
+        self._slots = asyncio.Semaphore(concurrency)
+        self._jobs: Dict[str, Job] = {}
+        # Finished jobs in the order they finished, so the oldest expire first
+        self._finished: deque = deque()
+
+    def submit(self, owner_id: int, request: QuestionGenerationRequest) -> Job:
+        if ai_quiz.async_client is None:
+            raise HTTPException(status_code=503, detail="AI service not configured. Please set OPENAI_API_KEY environment variable.")
+        build_messages(request)  # unknown subject or grade: 400 now rather than a failed job
+        self._sweep()
+        if len(self._jobs) - len(self._finished) >= self.queue:
+            raise HTTPException(status_code=429, detail="Too many generation jobs in progress, please retry shortly",
+                                headers={"Retry-After": "5"})
+        job = Job(owner_id, request)
+        self._jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str, owner_id: int) -> Optional[Job]:
+        self._sweep()
+        job = self._jobs.get(job_id)
+        return job if job and job.owner_id == owner_id else None
+
+    def _sweep(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._finished and (self._finished[0].finished_at < cutoff or len(self._finished) > self.max_finished):
+            del self._jobs[self._finished.popleft().id]
+
+    async def _run(self, job: Job):
+        try:
+            if not job.request.refresh:
+                cached = await self.cache.lookup(job.request)
+                if cached is not None:
+                    job.cached = True
+                    job.questions = list(cached.questions)
+                    job.finish("completed")
+                    return
+
+            async with self._slots:
+                job.status = "running"
+                job.notify()
+                error = None
+                while len(job.questions) < job.request.count and job.attempts <= self.retries:
+                    job.attempts += 1
+                    started, outcome = time.perf_counter(), "error"
+                    try:
+                        await asyncio.wait_for(self._attempt(job), self.timeout)
+                        error, outcome = None, "ok"
+                    except asyncio.TimeoutError:
+                        error, outcome = f"Timed out after {self.timeout:g}s", "timeout"
+                    except Exception as e:
+                        error = str(getattr(e, "detail", e)) or type(e).__name__
+                    metrics.ai_generation_latency.observe(time.perf_counter() - started, path="job", outcome=outcome)
+                    if error:
+                        logger.warning("AI job %s attempt %d: %s", job.id, job.attempts, error)
+
+            if not job.questions:
+                job.finish("failed", error or "No valid questions generated")
+                return
+            if len(job.questions) >= job.request.count:
+                await self.cache.store(job.request, QuestionGenerationResponse(
+                    questions=job.questions, subject=job.request.subject, topic=job.request.topic,
+                    difficulty=job.request.difficulty, count=len(job.questions),
+                ))
+            # Short of the requested count only when every attempt fell short
+            job.finish("completed", error)
+        except asyncio.CancelledError:
+            job.finish("failed", "Cancelled")
+            raise
+        except Exception as e:
+            logger.exception("AI job %s failed", job.id)
+            job.finish("failed", str(e))
+        finally:
+            self._finished.append(job)
+
+    async def _attempt(self, job: Job):
+        request = job.request.model_copy(update={"count": job.request.count - len(job.questions)})
+        stream = await ai_quiz.async_client.chat.completions.create(
+            model=ai_quiz.MODEL,
+            messages=build_messages(request),
+            temperature=0.7,
+            max_tokens=2000,
+            stream=True,
+        )
+        parser = QuestionStreamParser()
+        seen = {q["question"] for q in job.questions}
+        async for chunk in stream:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if not text:
+                continue
+            for question in parser.feed(text):
+                if (is_valid_question(question) and question["question"] not in seen
+                        and len(job.questions) < job.request.count):
+                    seen.add(question["question"])
+                    job.questions.append(question)
+                    job.notify()
+        if len(job.questions) < job.request.count:
+            raise ValueError(f"Completion ended with {len(job.questions)} of {job.request.count} questions")
+
+    async def close(self):
+        tasks = [job.task for job in self._jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        self._sweep()
+        statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "completed", "failed")}
+
+
+ai_jobs = AIJobs()
@@ -1,27 +1,100 @@
 import os
+import re
+import time
+import asyncio
+import logging
 from fastapi import HTTPException
 from pydantic import BaseModel
-import traceback
 import json
+from types import SimpleNamespace
 from typing import List, Optional
 
-# Create the OpenAI client only if API key is available
+logger = logging.getLogger(__name__)
+
+MODEL = "gpt-3.5-turbo"
+
+
+def _fake_completion(messages, batch: int) -> str:
+    match = re.search(r"Generate exactly (\d+) questions", messages[-1]["content"])
+    count = int(match.group(1)) if match else 10
+    return json.dumps([
+        {
+            "question": f"Sample question {n + 1} of set {batch}?",
+            "options": ["Option A", "Option B", "Option C", "Option D"],
+            "correct_answer": "Option A",
+            "explanation": "Generated by the offline question client.",
+        }
+        for n in range(count)
+    ])
+
+
+class FakeQuestionClient:
+    """Offline stand-in for the OpenAI client, selected with AI_CLIENT=fake.
+
+    Answers chat.completions.create() with well-formed questions after
+    `delay` seconds, so caching and load can be exercised without an API key.
+    """
+
+    def __init__(self, delay: float = float(os.getenv("AI_FAKE_DELAY", "0.5"))):
+        self.delay = delay
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        message = SimpleNamespace(content=_fake_completion(messages, self.calls))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class FakeAsyncQuestionClient(FakeQuestionClient):
+    """Async counterpart of FakeQuestionClient; with stream=True the completion
+    arrives in small chunks spread over `delay` seconds"""
+
+    async def _create(self, model, messages, stream=False, **kwargs):
+        self.calls += 1
+        text = _fake_completion(messages, self.calls)
+        if not stream:
+            await asyncio.sleep(self.delay)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+        return self._stream(text)
+
+    async def _stream(self, text: str, size: int = 40):
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        for piece in pieces:
+            await asyncio.sleep(self.delay / len(pieces))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+
+def set_client(new_client, new_async_client=None):
+    """Swap the clients used for generation (None disables AI features)"""
+    global client, async_client
+    client = new_client
+    async_client = new_async_client
+
+
+# Create the OpenAI clients only if API key is available; async_client
+# streams completions for background jobs (see ai_jobs)
 client = None
+async_client = None
 api_key = os.getenv("OPENAI_API_KEY")
-print(f"DEBUG: OpenAI API Key found: {bool(api_key)}")
-print(f"DEBUG: API Key length: {len(api_key) if api_key else 0}")
 
-if api_key:
+if os.getenv("AI_CLIENT", "openai").lower() == "fake":
+    client = FakeQuestionClient()
+    async_client = FakeAsyncQuestionClient()
+    logger.info("Using the offline fake question client")
+elif api_key:
     try:
-        from openai import OpenAI
+        from openai import OpenAI, AsyncOpenAI
         client = OpenAI(api_key=api_key)
-        print("DEBUG: OpenAI client created successfully")
+        async_client = AsyncOpenAI(api_key=api_key)
+        logger.info("OpenAI client created")
     except ImportError:
-        print("Warning: OpenAI package not installed. AI features will be disabled.")
+        logger.warning("OpenAI package not installed. AI features will be disabled.")
     except Exception as e:
-        print(f"Warning: Failed to create OpenAI client: {e}")
+        logger.warning("Failed to create OpenAI client: %s", e)
 else:
-    print("Warning: OPENAI_API_KEY not found in environment. AI features will be disabled.")
+    logger.warning("OPENAI_API_KEY not found in environment. AI features will be disabled.")
 
 class QuestionGenerationRequest(BaseModel):
     subject: str
@@ -29,6 +102,7 @@ class QuestionGenerationRequest(BaseModel):
     difficulty: str = "medium"  # easy, medium, hard
     count: int = 10
     grade_level: str = "primary"  # primary, middle, high
+    refresh: bool = False  # skip cached sets and generate a new one
 
 class QuestionGenerationResponse(BaseModel):
     questions: List[dict]
@@ -36,14 +110,10 @@ class QuestionGenerationResponse(BaseModel):
     topic: Optional[str] = None
     difficulty: str
     count: int
+    cached: bool = False  # served from the question cache (see ai_cache)
 
-def generate_quiz_questions(request: QuestionGenerationRequest) -> QuestionGenerationResponse:
-    """
-    Generate quiz questions using OpenAI
-    """
-    if not client:
-        raise HTTPException(status_code=503, detail="AI service not configured. Please set OPENAI_API_KEY environment variable.")
-    
+def build_messages(request: QuestionGenerationRequest) -> List[dict]:
+    """Chat messages asking for `request.count` questions; 400 for an unknown subject or grade"""
     # Define subject-specific prompts
     subject_prompts = {
         "science": {
@@ -110,21 +180,43 @@ Where 'correct_answer' is the exact text of the correct option."""
     
     user_msg = f"{base_prompt} Generate exactly {request.count} questions. Make sure questions are age-appropriate, cover various aspects of the topic, and have clear correct answers. Return ONLY the JSON array with no additional text."
     
+    return [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": user_msg},
+    ]
+
+def is_valid_question(q) -> bool:
+    """Four options, one of which is exactly the correct answer"""
+    return (isinstance(q, dict) and 
+            'question' in q and 
+            'options' in q and 
+            'correct_answer' in q and
+            isinstance(q['options'], list) and 
+            len(q['options']) == 4 and
+            q['correct_answer'] in q['options'])
+
+def generate_quiz_questions(request: QuestionGenerationRequest) -> QuestionGenerationResponse:
+    """
+    Generate quiz questions using OpenAI
+    """
+    if not client:
+        raise HTTPException(status_code=503, detail="AI service not configured. Please set OPENAI_API_KEY environment variable.")
+    
+    messages = build_messages(request)
+    
     try:
-        print(f"Generating {request.count} questions for subject: {request.subject}, grade: {request.grade_level}, difficulty: {request.difficulty}")
+        logger.info("Generating %d questions for subject: %s, grade: %s, difficulty: %s",
+                    request.count, request.subject, request.grade_level, request.difficulty)
         
         resp = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_msg},
-                {"role": "user", "content": user_msg},
-            ],
+            model=MODEL,
+            messages=messages,
             temperature=0.7,
             max_tokens=2000,
         )
         
         response_text = resp.choices[0].message.content.strip()
-        print("Raw OpenAI response:", response_text[:200] + "..." if len(response_text) > 200 else response_text)
+        logger.debug("Raw OpenAI response: %s", response_text[:200] + "..." if len(response_text) > 200 else response_text)
         
         # Try to parse the JSON response
         try:
@@ -142,21 +234,12 @@ Where 'correct_answer' is the exact text of the correct option."""
             if not isinstance(questions, list):
                 raise ValueError("Response is not a list")
             
-            valid_questions = []
-            for q in questions:
-                if (isinstance(q, dict) and 
-                    'question' in q and 
-                    'options' in q and 
-                    'correct_answer' in q and
-                    isinstance(q['options'], list) and 
-                    len(q['options']) == 4 and
-                    q['correct_answer'] in q['options']):
-                    valid_questions.append(q)
+            valid_questions = [q for q in questions if is_valid_question(q)]
             
             if len(valid_questions) < min(5, request.count):
                 raise ValueError(f"Not enough valid questions generated: {len(valid_questions)}")
             
-            print(f"Generated {len(valid_questions)} valid questions")
+            logger.info("Generated %d valid questions", len(valid_questions))
             return QuestionGenerationResponse(
                 questions=valid_questions[:request.count],
                 subject=request.subject,
@@ -166,14 +249,13 @@ Where 'correct_answer' is the exact text of the correct option."""
             )
             
         except json.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            print(f"Response text: {response_text}")
+            logger.warning("JSON decode error: %s", e)
+            logger.debug("Response text: %s", response_text)
             raise HTTPException(status_code=500, detail="Failed to parse generated questions")
         except ValueError as e:
-            print(f"Validation error: {e}")
+            logger.warning("Validation error: %s", e)
             raise HTTPException(status_code=500, detail=str(e))
             
     except Exception as e:
-        print("Exception in generate_quiz_questions:")
-        traceback.print_exc()
+        logger.exception("Exception in generate_quiz_questions")
         raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""Quiz analytics served from aggregate tables.
+
+record() folds newly stored quiz responses into quiz_stats,
+quiz_answer_stats and student_session_stats with upserts, inside the
+caller's transaction. The summaries below then read one row per quiz,
+answer option or (session, student) pair, however many responses exist.
+"""
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+
+
+def _totals(responses, correct) -> dict:
+    responses, correct = int(responses or 0), int(correct or 0)
+    return {
+        "responses": responses,
+        "correct": correct,
+        "accuracy": round(correct / responses, 4) if responses else None,
+    }
+
+
+def _increment(db: AsyncSession, model, keys: List[str], counters: List[str]):
+    """INSERT ... ON CONFLICT (keys) DO UPDATE adding the new counter values"""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(model)
+    return stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in counters},
+    )
+
+
+async def record(db: AsyncSession, rows: Iterable[dict], sessions: Optional[Dict[int, int]] = None):
+    """Add quiz response rows (quiz_id, student_id, selected_answer, is_correct) to the aggregates.
+
+    `sessions` maps quiz id to session id when the caller already knows it;
+    otherwise it is looked up with one query. Does not commit.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    sessions = dict(sessions or {})
+    missing = {row["quiz_id"] for row in rows} - sessions.keys()
+    if missing:
+        result = await db.execute(select(models.Quiz.id, models.Quiz.session_id).where(models.Quiz.id.in_(missing)))
+        sessions.update(result.all())
+
+    quizzes, answers, students = Counter(), Counter(), Counter()
+    quiz_correct, student_correct = Counter(), Counter()
+    for row in rows:
+        session_id = sessions.get(row["quiz_id"])
+        if session_id is None:
+            continue
+        correct = int(bool(row["is_correct"]))
+        quizzes[(row["quiz_id"], session_id)] += 1
+        quiz_correct[(row["quiz_id"], session_id)] += correct
+        answers[(row["quiz_id"], row["selected_answer"])] += 1
+        if row.get("student_id") is not None:
+            students[(session_id, row["student_id"])] += 1
+            student_correct[(session_id, row["student_id"])] += correct
+
+    # Keys are unique within each statement, as ON CONFLICT DO UPDATE requires
+    if quizzes:
+        await db.execute(_increment(db, models.QuizStats, ["quiz_id"], ["responses", "correct"]), [
+            {"quiz_id": quiz_id, "session_id": session_id, "responses": n, "correct": quiz_correct[(quiz_id, session_id)]}
+            for (quiz_id, session_id), n in quizzes.items()
+        ])
+        await db.execute(_increment(db, models.QuizAnswerStats, ["quiz_id", "selected_answer"], ["responses"]), [
+            {"quiz_id": quiz_id, "selected_answer": answer, "responses": n}
+            for (quiz_id, answer), n in answers.items()
+        ])
+    if students:
+        await db.execute(_increment(db, models.StudentSessionStats, ["session_id", "student_id"], ["responses", "correct"]), [
+            {"session_id": session_id, "student_id": student_id, "responses": n,
+             "correct": student_correct[(session_id, student_id)]}
+            for (session_id, student_id), n in students.items()
+        ])
+
+
+async def quiz_summary(db: AsyncSession, quiz: models.Quiz) -> dict:
+    stats = await db.get(models.QuizStats, quiz.id)
+    result = await db.execute(
+        select(models.QuizAnswerStats.selected_answer, models.QuizAnswerStats.responses)
+        .where(models.QuizAnswerStats.quiz_id == quiz.id)
+    )
+    answers = {option: 0 for option in quiz.options or ()}
+    answers.update(result.all())
+    return {
+        "quiz_id": quiz.id,
+        "question_text": quiz.question_text,
+        **_totals(stats and stats.responses, stats and stats.correct),
+        "answers": answers,
+    }
+
+
+async def _student_scores(db: AsyncSession, *where) -> List[dict]:
+    stats = models.StudentSessionStats
+    result = await db.execute(
+        select(stats.student_id, models.User.name, func.sum(stats.responses), func.sum(stats.correct))
+        .join(models.User, models.User.id == stats.student_id)
+        .join(models.Session, models.Session.id == stats.session_id)
+        .where(*where)
+        .group_by(stats.student_id, models.User.name)
+        .order_by(stats.student_id)
+    )
+    return [
+        {"student_id": student_id, "name": name, **_totals(responses, correct)}
+        for student_id, name, responses, correct in result.all()
+    ]
+
+
+async def session_summary(db: AsyncSession, session_id: int) -> dict:
+    result = await db.execute(
+        select(models.Quiz.id, models.Quiz.question_text, models.QuizStats.responses, models.QuizStats.correct)
+        .outerjoin(models.QuizStats, models.QuizStats.quiz_id == models.Quiz.id)
+        .where(models.Quiz.session_id == session_id)
+        .order_by(models.Quiz.id)
+    )
+    quizzes = [
+        {"quiz_id": quiz_id, "question_text": text, **_totals(responses, correct)}
+        for quiz_id, text, responses, correct in result.all()
+    ]
+    return {
+        "session_id": session_id,
+        **_totals(sum(q["responses"] for q in quizzes), sum(q["correct"] for q in quizzes)),
+        "quizzes": quizzes,
+        "students": await _student_scores(db, models.StudentSessionStats.session_id == session_id),
+    }
+
+
+async def class_summary(db: AsyncSession, class_id: int) -> dict:
+    class_sessions = select(models.Session.id).where(models.Session.class_id == class_id)
+    per_session = (
+        select(models.QuizStats.session_id,
+               func.sum(models.QuizStats.responses).label("responses"),
+               func.sum(models.QuizStats.correct).label("correct"))
+        .where(models.QuizStats.session_id.in_(class_sessions))
+        .group_by(models.QuizStats.session_id)
+        .subquery()
+    )
+    result = await db.execute(
+        select(models.Session.id, models.Session.title, per_session.c.responses, per_session.c.correct)
+        .outerjoin(per_session, per_session.c.session_id == models.Session.id)
+        .where(models.Session.class_id == class_id)
+        .order_by(models.Session.id)
+    )
+    sessions = [
+        {"session_id": session_id, "title": title, **_totals(responses, correct)}
+        for session_id, title, responses, correct in result.all()
+    ]
+    return {
+        "class_id": class_id,
+        **_totals(sum(s["responses"] for s in sessions), sum(s["correct"] for s in sessions)),
+        "sessions": sessions,
+        "students": await _student_scores(db, models.Session.class_id == class_id),
+    }
+
+
+async def student_summary(db: AsyncSession, student_id: int, teacher_id: Optional[int] = None) -> dict:
+    """Per-session scores of one student; limited to a teacher's own sessions when teacher_id is given"""
+    stats = models.StudentSessionStats
+    stmt = (
+        select(stats.session_id, models.Session.title, stats.responses, stats.correct)
+        .join(models.Session, models.Session.id == stats.session_id)
+        .where(stats.student_id == student_id)
+        .order_by(stats.session_id)
+    )
+    if teacher_id is not None:
+        stmt = stmt.where(models.Session.teacher_id == teacher_id)
+    sessions = [
+        {"session_id": session_id, "title": title, **_totals(responses, correct)}
+        for session_id, title, responses, correct in (await db.execute(stmt)).all()
+    ]
+    return {
+        "student_id": student_id,
+        **_totals(sum(s["responses"] for s in sessions), sum(s["correct"] for s in sessions)),
+        "sessions": sessions,
+    }
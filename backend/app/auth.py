@@ -1,12 +1,26 @@
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import Optional, Tuple
+import asyncio
 import jwt
+import logging
 import os
+from sqlalchemy import select
 from . import models
+from .cache import principal_cache
 
-pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+# Raising BCRYPT_ROUNDS makes existing hashes below it get rehashed on next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_ctx = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
 SECRET_KEY = os.getenv("SECRET_KEY")
-print(f"AUTH_MODULE_LOAD: SECRET_KEY is: {SECRET_KEY[:5]}...") if SECRET_KEY else print("AUTH_MODULE_LOAD: SECRET_KEY is NOT set.")
 if not SECRET_KEY:
     raise ValueError("SECRET_KEY environment variable is not set")
 
@@ -22,6 +36,55 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_ctx.verify(plain, hashed)
 
 
+class PasswordPoolSaturated(Exception):
+    """Too many password hashes are already running or queued"""
+
+
+class PasswordPool:
+    """Dedicated threads for bcrypt, with a cap on work waiting for them.
+
+    bcrypt releases the GIL, so a few threads hash in parallel without
+    competing with the event loop or the shared request threadpool. Once
+    `workers + queue_limit` hashes are in flight, new ones fail fast with
+    PasswordPoolSaturated instead of queueing behind a login storm.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.limit = workers + queue_limit
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            raise PasswordPoolSaturated()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_pool = PasswordPool(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    queue_limit=int(os.getenv("PASSWORD_HASH_QUEUE", "32")),
+)
+
+
+async def hash_password_async(password: str) -> str:
+    return await password_pool.run(hash_password, password)
+
+
+async def verify_password_async(plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Check a password; also returns a new hash when the stored one is outdated"""
+    return await password_pool.run(pwd_ctx.verify_and_update, plain, hashed)
+
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -30,31 +93,52 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 
 def decode_token(token: str) -> dict:
-    print(f"AUTH: Attempting to decode token. SECRET_KEY used: {SECRET_KEY[:5]}...")
     return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
 
+def _principal(user: models.User) -> models.User:
+    """Detached copy of the fields requests read from the current user.
+
+    It belongs to no session, so it can be shared between requests, and it
+    leaves out the password hash.
+    """
+    return models.User(id=user.id, name=user.name, email=user.email, role=user.role)
+
+
+async def load_principal(db, email: str):
+    """The user a token's subject refers to, from principal_cache when possible"""
+    user = principal_cache.get(email)
+    if user is None:
+        result = await db.execute(select(models.User).where(models.User.email == email))
+        row = result.scalars().first()
+        if row is None:
+            return None
+        user = _principal(row)
+        principal_cache.set(email, user)
+    return user
+
+
 async def get_current_user_ws(token: str, db):
     """Get current user for WebSocket connections"""
     try:
         payload = decode_token(token)
         email = payload.get("sub")
         if email is None:
-            print("AUTH_WS_DEBUG: User email (sub) not found in token payload.")
+            logger.debug("WebSocket token has no subject")
             return None
         
-        user = db.query(models.User).filter(models.User.email == email).first()
+        user = await load_principal(db, email)
         if user is None:
-            print(f"AUTH_WS_DEBUG: User with email {email} not found in DB.")
+            logger.debug("WebSocket token subject is not a known user")
             return None
         
         return user
     except jwt.ExpiredSignatureError:
-        print("AUTH_WS_DEBUG: Token has expired.")
+        logger.debug("WebSocket token has expired")
         return None
     except jwt.InvalidTokenError as e:
-        print(f"AUTH_WS_DEBUG: Invalid token error: {e}")
+        logger.debug("Invalid WebSocket token: %s", e)
         return None
     except Exception as e:
-        print(f"AUTH_WS_DEBUG: An unexpected error occurred during WebSocket user authentication: {e}")
+        logger.exception("Unexpected error authenticating a WebSocket")
         return None
@@ -0,0 +1,205 @@
+import json
+import os
+import uuid
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Handler called with (session_id, envelope) for every message that must be
+# delivered to the sockets held by this worker
+DeliveryHandler = Callable[[int, dict], Awaitable[None]]
+
+
+class Backplane:
+    """Fan-out transport and participant registry shared by all workers.
+
+    The ConnectionManager only ever talks to the backplane, so swapping the
+    implementation is enough to go from one process to many.
+    """
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self._handler: Optional[DeliveryHandler] = None
+
+    async def start(self, handler: DeliveryHandler):
+        self._handler = handler
+
+    async def close(self):
+        self._handler = None
+
+    async def subscribe(self, session_id: int):
+        """Start receiving messages for a session this worker now serves"""
+
+    async def unsubscribe(self, session_id: int):
+        """Stop receiving messages for a session with no local sockets left"""
+
+    async def publish(self, session_id: int, envelope: dict):
+        raise NotImplementedError
+
+    async def add_participant(self, session_id: int, participant: dict) -> List[dict]:
+        raise NotImplementedError
+
+    async def remove_participant(self, session_id: int, user_id: int) -> List[dict]:
+        raise NotImplementedError
+
+    async def get_participants(self, session_id: int) -> List[dict]:
+        raise NotImplementedError
+
+
+class InMemoryBackplane(Backplane):
+    """Single-process backplane: publishing is a direct local delivery"""
+
+    def __init__(self):
+        super().__init__()
+        # session_id -> user_id -> participant info
+        self._participants: Dict[int, Dict[int, dict]] = {}
+        # session_id -> user_id -> number of open sockets for that user
+        self._connection_counts: Dict[int, Dict[int, int]] = {}
+
+    async def publish(self, session_id: int, envelope: dict):
+        if self._handler:
+            await self._handler(session_id, envelope)
+
+    async def add_participant(self, session_id: int, participant: dict) -> List[dict]:
+        user_id = participant['userId']
+        counts = self._connection_counts.setdefault(session_id, {})
+        counts[user_id] = counts.get(user_id, 0) + 1
+        self._participants.setdefault(session_id, {})[user_id] = participant
+        return list(self._participants[session_id].values())
+
+    async def remove_participant(self, session_id: int, user_id: int) -> List[dict]:
+        counts = self._connection_counts.get(session_id, {})
+        participants = self._participants.get(session_id, {})
+        if user_id in counts:
+            counts[user_id] -= 1
+            if counts[user_id] <= 0:
+                del counts[user_id]
+                participants.pop(user_id, None)
+        if not counts:
+            self._connection_counts.pop(session_id, None)
+            self._participants.pop(session_id, None)
+        return list(participants.values())
+
+    async def get_participants(self, session_id: int) -> List[dict]:
+        return list(self._participants.get(session_id, {}).values())
+
+
+class RedisBackplane(Backplane):
+    """Backplane over Redis pub/sub with the participant registry in hashes.
+
+    `client` may be any object exposing the redis.asyncio API (publish,
+    pubsub, pipeline, hgetall), which lets tests pass an in-process stand-in.
+    Unix socket deployments work through a ``unix://`` URL.
+    """
+
+    def __init__(self, url: str = None, client=None, prefix: str = "codecrew", participant_ttl: int = 86400):
+        super().__init__()
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("redis package is required for WS_BACKPLANE_URL=" + str(url))
+            client = redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+        self.participant_ttl = participant_ttl
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    def _channel(self, session_id: int) -> str:
+        return f"{self.prefix}:ws:session:{session_id}"
+
+    def _participants_key(self, session_id: int) -> str:
+        return f"{self.prefix}:ws:session:{session_id}:participants"
+
+    def _counts_key(self, session_id: int) -> str:
+        return f"{self.prefix}:ws:session:{session_id}:connections"
+
+    async def start(self, handler: DeliveryHandler):
+        await super().start(handler)
+        self._pubsub = self.client.pubsub()
+        # Always hold one subscription so the reader has a live connection
+        await self._pubsub.subscribe(f"{self.prefix}:ws:workers")
+        self._reader = asyncio.create_task(self._read_loop())
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.close()
+            self._pubsub = None
+        await super().close()
+
+    async def subscribe(self, session_id: int):
+        await self._pubsub.subscribe(self._channel(session_id))
+
+    async def unsubscribe(self, session_id: int):
+        await self._pubsub.unsubscribe(self._channel(session_id))
+
+    async def publish(self, session_id: int, envelope: dict):
+        # Deliver to our own sockets without a round trip; the reader skips
+        # our echo by origin
+        if self._handler:
+            await self._handler(session_id, envelope)
+        payload = json.dumps({'origin': self.worker_id, 'session_id': session_id, 'envelope': envelope})
+        await self.client.publish(self._channel(session_id), payload)
+
+    async def _read_loop(self):
+        async for item in self._pubsub.listen():
+            if item.get('type') != 'message':
+                continue
+            try:
+                data = json.loads(item['data'])
+                if data.get('origin') == self.worker_id or not self._handler:
+                    continue
+                await self._handler(data['session_id'], data['envelope'])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to deliver backplane message")
+
+    async def add_participant(self, session_id: int, participant: dict) -> List[dict]:
+        user_id = str(participant['userId'])
+        participants_key = self._participants_key(session_id)
+        counts_key = self._counts_key(session_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hincrby(counts_key, user_id, 1)
+        pipe.hset(participants_key, user_id, json.dumps(participant))
+        # Entries left behind by a crashed worker age out eventually
+        pipe.expire(counts_key, self.participant_ttl)
+        pipe.expire(participants_key, self.participant_ttl)
+        pipe.hgetall(participants_key)
+        results = await pipe.execute()
+        return [json.loads(p) for p in results[-1].values()]
+
+    async def remove_participant(self, session_id: int, user_id: int) -> List[dict]:
+        participants_key = self._participants_key(session_id)
+        counts_key = self._counts_key(session_id)
+        remaining = await self.client.hincrby(counts_key, str(user_id), -1)
+        if remaining <= 0:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.hdel(counts_key, str(user_id))
+            pipe.hdel(participants_key, str(user_id))
+            await pipe.execute()
+        return await self.get_participants(session_id)
+
+    async def get_participants(self, session_id: int) -> List[dict]:
+        participants = await self.client.hgetall(self._participants_key(session_id))
+        return [json.loads(p) for p in participants.values()]
+
+
+def create_backplane(url: str = None) -> Backplane:
+    """Build the backplane configured by WS_BACKPLANE_URL (in-memory by default)"""
+    url = url if url is not None else os.getenv("WS_BACKPLANE_URL", "")
+    if not url or url.startswith("memory://"):
+        return InMemoryBackplane()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackplane(url=url)
+    raise ValueError(f"Unsupported WS_BACKPLANE_URL scheme: {url}")
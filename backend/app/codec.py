@@ -0,0 +1,82 @@
+import json
+from typing import Dict, Optional, Union
+
+# Binary encoders are optional; a format is only offered if its package is installed
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+# WebSocket subprotocol names, e.g. new WebSocket(url, ['codecrew.msgpack'])
+SUBPROTOCOL_PREFIX = "codecrew."
+
+
+class JsonCodec:
+    name = "json"
+    binary = False
+
+    def encode(self, message: dict) -> str:
+        return json.dumps(message, separators=(',', ':'))
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message: dict) -> bytes:
+        # Single-precision floats are ample for canvas coordinates and keep
+        # whiteboard frames smaller than their JSON text
+        return msgpack.packb(message, use_bin_type=True, use_single_float=True)
+
+    def decode(self, data: bytes) -> dict:
+        return msgpack.unpackb(data, raw=False)
+
+
+class CborCodec:
+    name = "cbor"
+    binary = True
+
+    def encode(self, message: dict) -> bytes:
+        return cbor2.dumps(message)
+
+    def decode(self, data: bytes) -> dict:
+        return cbor2.loads(data)
+
+
+JSON = JsonCodec()
+
+CODECS: Dict[str, object] = {'json': JSON}
+if msgpack is not None:
+    CODECS['msgpack'] = MsgpackCodec()
+if cbor2 is not None:
+    CODECS['cbor'] = CborCodec()
+
+
+def negotiate(format: Optional[str], subprotocols) -> tuple:
+    """Pick the codec for a connection: ?format= wins, then the subprotocol list.
+
+    Returns (codec or None if the requested format is unavailable, subprotocol to accept).
+    """
+    if format:
+        return CODECS.get(format.lower()), None
+    for subprotocol in subprotocols or ():
+        if subprotocol.startswith(SUBPROTOCOL_PREFIX):
+            codec = CODECS.get(subprotocol[len(SUBPROTOCOL_PREFIX):])
+            if codec is not None:
+                return codec, subprotocol
+    return JSON, None
+
+
+def decode_frame(codec, frame: dict) -> dict:
+    """Decode a websocket.receive frame; text frames are always JSON"""
+    if frame.get('bytes') is not None:
+        return codec.decode(frame['bytes'])
+    return JSON.decode(frame['text'])
@@ -1,134 +1,301 @@
-from sqlalchemy.orm import Session
-from . import models, schemas
+from sqlalchemy import select, insert, delete, func, event, inspect, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session as OrmSession, object_session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from . import models, schemas, analytics
 from datetime import datetime
-from .auth import hash_password
+from typing import Dict, List, Optional, Tuple
+from email_validator import validate_email, EmailNotValidError
+from .auth import hash_password_async
+from .cache import principal_cache
+from .access import access_cache
+
+
+def _keyset(stmt, model, after_id: Optional[int], limit: Optional[int]):
+    """Order by id and return the rows after `after_id`, at most `limit` of them"""
+    if after_id is not None:
+        stmt = stmt.where(model.id > after_id)
+    stmt = stmt.order_by(model.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
 
 # --- User CRUD ---
-def create_user(db: Session, user: schemas.UserCreate):
+
+# Any ORM change to a user drops its cached principal, under its old email
+# as well if the email changed. Bulk update()/delete() statements bypass
+# these events and must call invalidate_user themselves.
+def invalidate_user(email: str):
+    principal_cache.invalidate(email)
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_user_on_change(mapper, connection, target):
+    invalidate_user(target.email)
+    for old_email in inspect(target).attrs.email.history.deleted:
+        invalidate_user(old_email)
+
+# Cached access decisions (see access.py) follow enrollment and session
+# changes; Core statements on either table call access_cache themselves,
+# after committing. ORM changes are flushed before COMMIT, and a check
+# between the two still reads the old rows, so they are only noted at flush
+# and invalidated once the transaction has committed.
+def _note_access_change(target, kind: str, key: int):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('access_changes', set()).add((kind, key))
+
+@event.listens_for(models.ClassEnrollment, "after_insert")
+@event.listens_for(models.ClassEnrollment, "after_delete")
+def _invalidate_access_on_enrollment(mapper, connection, target):
+    _note_access_change(target, 'student', target.student_id)
+
+@event.listens_for(models.Session, "after_insert")
+@event.listens_for(models.Session, "after_update")
+@event.listens_for(models.Session, "after_delete")
+def _invalidate_access_on_session(mapper, connection, target):
+    _note_access_change(target, 'session', target.id)
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_access_after_commit(session):
+    for kind, key in session.info.pop('access_changes', ()):
+        if kind == 'student':
+            access_cache.invalidate_student(key)
+        else:
+            access_cache.invalidate_session(key)
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_access_changes(session):
+    session.info.pop('access_changes', None)
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
     db_user = models.User(
         name=user.name,
         email=user.email,
-        hashed_password=hash_password(user.password),
+        hashed_password=await hash_password_async(user.password),
         role=user.role
     )
-    db.add(db_user); db.commit(); db.refresh(db_user)
+    db.add(db_user); await db.commit(); await db.refresh(db_user)
     return db_user
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
+
+async def update_password_hash(db: AsyncSession, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
+    await db.commit()
 
 # --- Class CRUD ---
-def create_class(db: Session, teacher_id: int, class_data: schemas.ClassCreate):
+async def create_class(db: AsyncSession, teacher_id: int, class_data: schemas.ClassCreate):
     db_class = models.Class(
         name=class_data.name,
         description=class_data.description,
         teacher_id=teacher_id
     )
     db.add(db_class)
-    db.commit()
-    db.refresh(db_class)
+    await db.commit()
+    await db.refresh(db_class)
+    # A new class has no sessions; set it so serialization never lazy-loads
+    set_committed_value(db_class, 'sessions', [])
     return db_class
 
-def update_class(db: Session, class_id: int, teacher_id: int, class_data: schemas.ClassUpdate):
-    db_class = db.query(models.Class).filter(
+async def update_class(db: AsyncSession, class_id: int, teacher_id: int, class_data: schemas.ClassUpdate):
+    result = await db.execute(select(models.Class).options(selectinload(models.Class.sessions)).where(
         models.Class.id == class_id,
         models.Class.teacher_id == teacher_id
-    ).first()
-    
+    ))
+    db_class = result.scalars().first()
+
     if not db_class:
         return None
-    
+
     # Update only the fields that are provided
     if class_data.name is not None:
         db_class.name = class_data.name
     if class_data.description is not None:
         db_class.description = class_data.description
-    
-    db.commit()
-    db.refresh(db_class)
+
+    await db.commit()
     return db_class
 
-def get_teacher_classes(db: Session, teacher_id: int):
-    classes = db.query(models.Class).filter(models.Class.teacher_id == teacher_id).all()
-    # Add student count and sessions to each class
-    for class_obj in classes:
-        student_count = db.query(models.ClassEnrollment).filter(
-            models.ClassEnrollment.class_id == class_obj.id
-        ).count()
+async def get_teacher_classes(db: AsyncSession, teacher_id: int):
+    # Student counts come from one GROUP BY over this teacher's classes and
+    # sessions from one selectin query, however many classes the teacher has
+    teacher_classes = select(models.Class.id).where(models.Class.teacher_id == teacher_id)
+    counts = select(
+        models.ClassEnrollment.class_id,
+        func.count().label('student_count')
+    ).where(models.ClassEnrollment.class_id.in_(teacher_classes)).group_by(models.ClassEnrollment.class_id).subquery()
+    result = await db.execute(
+        select(models.Class, func.coalesce(counts.c.student_count, 0))
+        .outerjoin(counts, counts.c.class_id == models.Class.id)
+        .where(models.Class.teacher_id == teacher_id)
+        .options(selectinload(models.Class.sessions))
+    )
+    classes = []
+    for class_obj, student_count in result.all():
         class_obj.student_count = student_count
-        
-        # Get sessions for this class
-        sessions = db.query(models.Session).filter(models.Session.class_id == class_obj.id).all()
-        class_obj.sessions = sessions
+        classes.append(class_obj)
     return classes
 
-def get_student_classes(db: Session, student_id: int):
-    enrollments = db.query(models.ClassEnrollment).filter(
-        models.ClassEnrollment.student_id == student_id
-    ).all()
-    class_ids = [enrollment.class_id for enrollment in enrollments]
-    classes = db.query(models.Class).filter(models.Class.id.in_(class_ids)).all()
-    
-    # Add sessions to each class
-    for class_obj in classes:
-        sessions = db.query(models.Session).filter(models.Session.class_id == class_obj.id).all()
-        class_obj.sessions = sessions
-    return classes
+async def get_student_classes(db: AsyncSession, student_id: int):
+    result = await db.execute(
+        select(models.Class)
+        .join(models.ClassEnrollment, models.ClassEnrollment.class_id == models.Class.id)
+        .where(models.ClassEnrollment.student_id == student_id)
+        .options(selectinload(models.Class.sessions))
+    )
+    return result.scalars().unique().all()
 
-def get_class_by_id(db: Session, class_id: int):
-    return db.query(models.Class).filter(models.Class.id == class_id).first()
+async def get_class_by_id(db: AsyncSession, class_id: int):
+    result = await db.execute(select(models.Class).options(selectinload(models.Class.sessions)).where(models.Class.id == class_id))
+    return result.scalars().first()
 
-def enroll_student_in_class(db: Session, class_id: int, student_id: int):
-    # Check if already enrolled
-    existing_enrollment = db.query(models.ClassEnrollment).filter(
+async def get_enrollment(db: AsyncSession, class_id: int, student_id: int):
+    result = await db.execute(select(models.ClassEnrollment).where(
         models.ClassEnrollment.class_id == class_id,
         models.ClassEnrollment.student_id == student_id
-    ).first()
-    
-    if existing_enrollment:
-        return existing_enrollment
-    
-    db_enrollment = models.ClassEnrollment(
-        class_id=class_id,
-        student_id=student_id
-    )
-    db.add(db_enrollment)
-    db.commit()
-    db.refresh(db_enrollment)
-    return db_enrollment
+    ))
+    return result.scalars().first()
+
+def insert_ignoring_conflicts(db: AsyncSession, model, index_elements: List[str]):
+    """INSERT that skips rows violating the unique key on `index_elements` (Postgres and SQLite)"""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model).on_conflict_do_nothing(index_elements=index_elements)
+
+async def enroll_student_in_class(db: AsyncSession, class_id: int, student_id: int):
+    # A no-op if already enrolled, even when two requests race
+    stmt = insert_ignoring_conflicts(db, models.ClassEnrollment, ['class_id', 'student_id'])
+    await db.execute(stmt.values(class_id=class_id, student_id=student_id, enrolled_at=datetime.utcnow()))
+    await db.commit()
+    access_cache.invalidate_student(student_id)
+    return await get_enrollment(db, class_id, student_id)
+
+async def remove_student_from_class(db: AsyncSession, class_id: int, student_id: int):
+    enrollment = await get_enrollment(db, class_id, student_id)
 
-def remove_student_from_class(db: Session, class_id: int, student_id: int):
-    enrollment = db.query(models.ClassEnrollment).filter(
-        models.ClassEnrollment.class_id == class_id,
-        models.ClassEnrollment.student_id == student_id
-    ).first()
-    
     if enrollment:
-        db.delete(enrollment)
-        db.commit()
+        await db.delete(enrollment)
+        await db.commit()
         return True
     return False
 
-def get_class_students(db: Session, class_id: int):
-    enrollments = db.query(models.ClassEnrollment).filter(
+async def _resolve_students(db: AsyncSession, student_ids: List[int], emails: List[str]) -> Tuple[List[dict], List[int]]:
+    """One outcome per distinct requested id/email, plus the student ids they resolve to.
+
+    Unresolved entries already carry their final status; resolved ones get
+    theirs from the caller. Emails are normalized the way signup stores them.
+    """
+    outcomes: List[dict] = []
+    seen = set()
+    for student_id in student_ids:
+        if ('id', student_id) not in seen:
+            seen.add(('id', student_id))
+            outcomes.append({'student_id': student_id, 'email': None, 'status': None})
+    for email in emails:
+        try:
+            normalized = validate_email(email.strip(), check_deliverability=False).normalized
+        except EmailNotValidError:
+            outcomes.append({'student_id': None, 'email': email, 'status': 'invalid'})
+            continue
+        if ('email', normalized) not in seen:
+            seen.add(('email', normalized))
+            outcomes.append({'student_id': None, 'email': normalized, 'status': None})
+
+    wanted_ids = [o['student_id'] for o in outcomes if o['student_id'] is not None]
+    wanted_emails = [o['email'] for o in outcomes if o['status'] is None and o['email'] is not None]
+    conditions = []
+    if wanted_ids:
+        conditions.append(models.User.id.in_(wanted_ids))
+    if wanted_emails:
+        conditions.append(models.User.email.in_(wanted_emails))
+    by_id: Dict[int, str] = {}
+    if conditions:
+        result = await db.execute(select(models.User.id, models.User.email).where(
+            models.User.role == "student", or_(*conditions)
+        ))
+        by_id = dict(result.all())
+    by_email = {email: student_id for student_id, email in by_id.items()}
+
+    for outcome in outcomes:
+        if outcome['status'] is not None:
+            continue
+        if outcome['student_id'] is not None and outcome['student_id'] in by_id:
+            outcome['email'] = by_id[outcome['student_id']]
+        elif outcome['student_id'] is None and outcome['email'] in by_email:
+            outcome['student_id'] = by_email[outcome['email']]
+        else:
+            outcome['status'] = 'not_found'
+    resolved = list({o['student_id'] for o in outcomes if o['status'] is None})
+    return outcomes, resolved
+
+async def bulk_enroll_students(db: AsyncSession, class_id: int, student_ids: List[int], emails: List[str]) -> List[dict]:
+    """Enroll many students in one transaction; existing enrollments are left as they are"""
+    outcomes, resolved = await _resolve_students(db, student_ids, emails)
+    inserted = set()
+    if resolved:
+        now = datetime.utcnow()
+        rows = [{'class_id': class_id, 'student_id': student_id, 'enrolled_at': now} for student_id in resolved]
+        stmt = insert_ignoring_conflicts(db, models.ClassEnrollment, ['class_id', 'student_id'])
+        result = await db.execute(stmt.values(rows).returning(models.ClassEnrollment.student_id))
+        inserted = set(result.scalars().all())
+        await db.commit()
+        for student_id in inserted:
+            access_cache.invalidate_student(student_id)
+    for outcome in outcomes:
+        if outcome['status'] is None:
+            outcome['status'] = 'enrolled' if outcome['student_id'] in inserted else 'already_enrolled'
+    return outcomes
+
+async def bulk_remove_students(db: AsyncSession, class_id: int, student_ids: List[int], emails: List[str]) -> List[dict]:
+    """Remove many students from a class with a single DELETE"""
+    outcomes, resolved = await _resolve_students(db, student_ids, emails)
+    removed = set()
+    if resolved:
+        result = await db.execute(delete(models.ClassEnrollment).where(
+            models.ClassEnrollment.class_id == class_id,
+            models.ClassEnrollment.student_id.in_(resolved)
+        ).returning(models.ClassEnrollment.student_id))
+        removed = set(result.scalars().all())
+        await db.commit()
+        for student_id in removed:
+            access_cache.invalidate_student(student_id)
+    for outcome in outcomes:
+        if outcome['status'] is None:
+            outcome['status'] = 'removed' if outcome['student_id'] in removed else 'not_enrolled'
+    return outcomes
+
+async def get_class_students(db: AsyncSession, class_id: int):
+    enrollments = await db.execute(select(models.ClassEnrollment).where(
         models.ClassEnrollment.class_id == class_id
-    ).all()
-    student_ids = [enrollment.student_id for enrollment in enrollments]
-    return db.query(models.User).filter(models.User.id.in_(student_ids)).all()
+    ))
+    student_ids = [enrollment.student_id for enrollment in enrollments.scalars().all()]
+    result = await db.execute(select(models.User).where(models.User.id.in_(student_ids)))
+    return result.scalars().all()
+
+async def get_all_students(db: AsyncSession, after_id: Optional[int] = None, limit: Optional[int] = None):
+    stmt = select(models.User).where(models.User.role == "student")
+    result = await db.execute(_keyset(stmt, models.User, after_id, limit))
+    return result.scalars().all()
 
-def get_all_students(db: Session):
-    return db.query(models.User).filter(models.User.role == "student").all()
+async def get_student(db: AsyncSession, student_id: int):
+    result = await db.execute(select(models.User).where(models.User.id == student_id, models.User.role == "student"))
+    return result.scalars().first()
 
 # --- Session CRUD ---
-def get_user_sessions(db: Session, user_id: int):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_sessions(db: AsyncSession, user_id: int, after_id: Optional[int] = None, limit: Optional[int] = None):
+    user = await db.get(models.User, user_id)
     if user.role == "teacher":
-        return db.query(models.Session).filter(models.Session.teacher_id == user_id).all()
+        stmt = select(models.Session).where(models.Session.teacher_id == user_id)
     else:
         # For students, return all sessions they can access
-        return db.query(models.Session).all()
+        stmt = select(models.Session)
+    result = await db.execute(_keyset(stmt, models.Session, after_id, limit))
+    return result.scalars().all()
 
-def create_session(db: Session, teacher_id: int, sc: schemas.SessionCreate):
+async def create_session(db: AsyncSession, teacher_id: int, sc: schemas.SessionCreate):
     db_sess = models.Session(
         title=sc.title,
         teacher_id=teacher_id,
@@ -136,60 +303,74 @@ def create_session(db: Session, teacher_id: int, sc: schemas.SessionCreate):
         session_type=sc.session_type,
         start_time=datetime.utcnow()
     )
-    db.add(db_sess); db.commit(); db.refresh(db_sess)
+    db.add(db_sess); await db.commit(); await db.refresh(db_sess)
     return db_sess
 
-def update_session(db: Session, session_id: int, teacher_id: int, session_data: schemas.SessionUpdate):
-    db_session = db.query(models.Session).filter(
+async def update_session(db: AsyncSession, session_id: int, teacher_id: int, session_data: schemas.SessionUpdate):
+    result = await db.execute(select(models.Session).where(
         models.Session.id == session_id,
         models.Session.teacher_id == teacher_id
-    ).first()
-    
+    ))
+    db_session = result.scalars().first()
+
     if not db_session:
         return None
-    
+
     # Update only the fields that are provided
     if session_data.title is not None:
         db_session.title = session_data.title
     if session_data.session_type is not None:
         db_session.session_type = session_data.session_type
-    
-    db.commit()
-    db.refresh(db_session)
+
+    await db.commit()
+    await db.refresh(db_session)
     return db_session
 
-def delete_session(db: Session, session_id: int, teacher_id: int):
-    db_session = db.query(models.Session).filter(
+async def delete_session(db: AsyncSession, session_id: int, teacher_id: int):
+    result = await db.execute(select(models.Session).where(
         models.Session.id == session_id,
         models.Session.teacher_id == teacher_id
-    ).first()
-    
+    ))
+    db_session = result.scalars().first()
+
     if not db_session:
         return False
-    
-    db.delete(db_session)
-    db.commit()
+
+    # The analytics aggregates have no ORM relationship to the session; the
+    # foreign keys cascade, but SQLite only enforces them when asked to
+    for model in (models.QuizStats, models.StudentSessionStats):
+        await db.execute(delete(model).where(model.session_id == session_id))
+    await db.delete(db_session)
+    await db.commit()
     return True
 
-def get_session(db: Session, session_id: int):
-    return db.query(models.Session).filter(models.Session.id == session_id).first()
+async def get_session(db: AsyncSession, session_id: int):
+    result = await db.execute(select(models.Session).where(models.Session.id == session_id))
+    return result.scalars().first()
 
 # --- Message CRUD ---
-def create_message(db: Session, session_id: int, sender_id: int, mc: schemas.MessageCreate):
+async def create_message(db: AsyncSession, session_id: int, sender_id: int, mc: schemas.MessageCreate):
     msg = models.Message(
         session_id=session_id,
         sender_id=sender_id,
         message_text=mc.message_text,
         timestamp=datetime.utcnow()
     )
-    db.add(msg); db.commit(); db.refresh(msg)
+    db.add(msg); await db.commit(); await db.refresh(msg)
     return msg
 
-def get_messages(db: Session, session_id: int):
-    return db.query(models.Message).filter(models.Message.session_id == session_id).all()
+async def append_messages(db: AsyncSession, rows: List[dict]):
+    """Insert many message rows (session_id, sender_id, message_text, timestamp) with one executemany"""
+    await db.execute(insert(models.Message), rows)
+    await db.commit()
+
+async def get_messages(db: AsyncSession, session_id: int, after_id: Optional[int] = None, limit: Optional[int] = None):
+    stmt = select(models.Message).where(models.Message.session_id == session_id)
+    result = await db.execute(_keyset(stmt, models.Message, after_id, limit))
+    return result.scalars().all()
 
 # --- Quiz CRUD ---
-def create_quiz(db: Session, session_id: int, user_id: int, qc: schemas.QuizCreate):
+async def create_quiz(db: AsyncSession, session_id: int, user_id: int, qc: schemas.QuizCreate):
     q = models.Quiz(
         session_id=session_id,
         question_text=qc.question_text,
@@ -198,43 +379,133 @@ def create_quiz(db: Session, session_id: int, user_id: int, qc: schemas.QuizCrea
         explanation=qc.explanation,
         created_by=user_id
     )
-    db.add(q); db.commit(); db.refresh(q)
+    db.add(q); await db.commit(); await db.refresh(q)
     return q
 
-def get_quizzes(db: Session, session_id: int):
-    return db.query(models.Quiz).filter(models.Quiz.session_id == session_id).all()
+async def get_quizzes(db: AsyncSession, session_id: int, after_id: Optional[int] = None, limit: Optional[int] = None):
+    stmt = select(models.Quiz).where(models.Quiz.session_id == session_id)
+    result = await db.execute(_keyset(stmt, models.Quiz, after_id, limit))
+    return result.scalars().all()
+
+async def get_session_quiz(db: AsyncSession, session_id: int, quiz_id: int):
+    result = await db.execute(select(models.Quiz).where(models.Quiz.id == quiz_id, models.Quiz.session_id == session_id))
+    return result.scalars().first()
 
 # --- QuizResponse CRUD ---
-def record_response(db: Session, quiz_id: int, student_id: int, rc: schemas.QuizResponseCreate):
-    correct = db.query(models.Quiz).get(quiz_id).correct_answer == rc.selected_answer
-    resp = models.QuizResponse(
+async def record_response(db: AsyncSession, quiz_id: int, student_id: int, rc: schemas.QuizResponseCreate):
+    """Store a student's answer; returns None if they already answered this quiz"""
+    quiz = await db.get(models.Quiz, quiz_id)
+    correct = quiz.correct_answer == rc.selected_answer
+    stmt = insert_ignoring_conflicts(db, models.QuizResponse, ['quiz_id', 'student_id'])
+    resp = (await db.execute(stmt.values(
         quiz_id=quiz_id,
         student_id=student_id,
         selected_answer=rc.selected_answer,
         is_correct=correct,
         timestamp=datetime.utcnow()
-    )
-    db.add(resp); db.commit(); db.refresh(resp)
+    ).returning(models.QuizResponse))).scalars().first()
+    if resp is None:
+        await db.rollback()
+        return None
+    # Aggregates change in the same transaction as the response itself
+    await analytics.record(db, [{'quiz_id': quiz_id, 'student_id': student_id,
+                                 'selected_answer': rc.selected_answer, 'is_correct': correct}],
+                           {quiz_id: quiz.session_id})
+    await db.commit(); await db.refresh(resp)
     return resp
 
-def get_responses(db: Session, quiz_id: int):
-    return db.query(models.QuizResponse).filter(models.QuizResponse.quiz_id == quiz_id).all()
+async def append_responses(db: AsyncSession, rows: List[dict]):
+    """Insert many quiz response rows with one executemany, skipping second
+    answers to a quiz; only the rows stored are added to the aggregates"""
+    stmt = insert_ignoring_conflicts(db, models.QuizResponse, ['quiz_id', 'student_id'])
+    result = await db.execute(stmt.returning(models.QuizResponse.quiz_id, models.QuizResponse.student_id,
+                                             models.QuizResponse.selected_answer, models.QuizResponse.is_correct), rows)
+    await analytics.record(db, [row._asdict() for row in result.all()])
+    await db.commit()
+
+async def get_responses(db: AsyncSession, quiz_id: int, after_id: Optional[int] = None, limit: Optional[int] = None):
+    stmt = select(models.QuizResponse).where(models.QuizResponse.quiz_id == quiz_id)
+    result = await db.execute(_keyset(stmt, models.QuizResponse, after_id, limit))
+    return result.scalars().all()
+
+# --- AI question set CRUD ---
+async def get_question_set(db: AsyncSession, key: str, not_before: Optional[datetime] = None):
+    stmt = select(models.AIQuestionSet).where(models.AIQuestionSet.key == key)
+    if not_before is not None:
+        stmt = stmt.where(models.AIQuestionSet.created_at >= not_before)
+    result = await db.execute(stmt)
+    return result.scalars().first()
+
+async def save_question_set(db: AsyncSession, key: str, values: dict):
+    """Insert or replace the question set stored under `key`"""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    values = {**values, 'key': key, 'created_at': datetime.utcnow()}
+    stmt = dialect.insert(models.AIQuestionSet).values(**values)
+    stmt = stmt.on_conflict_do_update(index_elements=['key'], set_={
+        name: getattr(stmt.excluded, name) for name in values if name != 'key'
+    })
+    await db.execute(stmt)
+    await db.commit()
 
 # --- Whiteboard CRUD ---
-def save_whiteboard(db: Session, session_id: int, wb: schemas.WhiteboardCreate):
+async def save_whiteboard(db: AsyncSession, session_id: int, wb: schemas.WhiteboardCreate):
     entry = models.WhiteboardData(
         session_id=session_id,
         data_json=wb.data_json,
         timestamp=datetime.utcnow()
     )
-    db.add(entry); db.commit(); db.refresh(entry)
+    db.add(entry); await db.commit(); await db.refresh(entry)
     return entry
 
-def get_whiteboard(db: Session, session_id: int):
-    return db.query(models.WhiteboardData).filter(models.WhiteboardData.session_id == session_id).all()
+async def get_whiteboard(db: AsyncSession, session_id: int):
+    result = await db.execute(select(models.WhiteboardData).where(models.WhiteboardData.session_id == session_id))
+    return result.scalars().all()
+
+async def get_whiteboard_tail(db: AsyncSession, session_id: int):
+    """Latest snapshot row (or None) and the delta rows written after it"""
+    result = await db.execute(select(models.WhiteboardData).where(
+        models.WhiteboardData.session_id == session_id
+    ).order_by(models.WhiteboardData.id.desc()))
+    snapshots = result.scalars().all()
+    snapshot = next((row for row in snapshots if row.data_json.get('kind') == 'snapshot'), None)
+    upto = snapshot.data_json.get('upto', snapshot.id) if snapshot else 0
+    deltas = [
+        row for row in reversed(snapshots)
+        if row.id > upto and row.data_json.get('kind') != 'snapshot'
+    ]
+    return snapshot, deltas
+
+async def append_whiteboard_rows(db: AsyncSession, entries: list):
+    """Insert (session_id, data_json) pairs. Does not commit"""
+    now = datetime.utcnow()
+    db.add_all([
+        models.WhiteboardData(session_id=session_id, data_json=data_json, timestamp=now)
+        for session_id, data_json in entries
+    ])
+    await db.flush()
+
+async def replace_whiteboard_history(db: AsyncSession, session_id: int, strokes: list, upto: int):
+    """Store a snapshot covering every row up to `upto` and drop those rows. Does not commit"""
+    db.add(models.WhiteboardData(
+        session_id=session_id,
+        data_json={'kind': 'snapshot', 'strokes': strokes, 'upto': upto},
+        timestamp=datetime.utcnow()
+    ))
+    # Insert first so the snapshot's id is always above `upto`
+    await db.flush()
+    await db.execute(delete(models.WhiteboardData).where(
+        models.WhiteboardData.session_id == session_id,
+        models.WhiteboardData.id <= upto
+    ))
+
+async def max_whiteboard_id(db: AsyncSession, session_id: int) -> int:
+    max_id = await db.scalar(select(func.max(models.WhiteboardData.id)).where(
+        models.WhiteboardData.session_id == session_id
+    ))
+    return max_id or 0
 
 # --- Feedback CRUD ---
-def create_feedback(db: Session, from_user: int, session_id: int, fc: schemas.FeedbackCreate):
+async def create_feedback(db: AsyncSession, from_user: int, session_id: int, fc: schemas.FeedbackCreate):
     fb = models.Feedback(
         from_user_id=from_user,
         to_user_id=fc.to_user_id,
@@ -243,8 +514,9 @@ def create_feedback(db: Session, from_user: int, session_id: int, fc: schemas.Fe
         rating=fc.rating,
         timestamp=datetime.utcnow()
     )
-    db.add(fb); db.commit(); db.refresh(fb)
+    db.add(fb); await db.commit(); await db.refresh(fb)
     return fb
 
-def get_feedback(db: Session, session_id: int):
-    return db.query(models.Feedback).filter(models.Feedback.session_id == session_id).all()
+async def get_feedback(db: AsyncSession, session_id: int):
+    result = await db.execute(select(models.Feedback).where(models.Feedback.session_id == session_id))
+    return result.scalars().all()
@@ -1,12 +1,66 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+
+# DB_LOCAL=true runs without a database server: with DATABASE_URL unset the
+# API uses the SQLite file DB_LOCAL_PATH and creates its tables at startup.
+# For development, tests and benchmarks only
+DB_LOCAL = os.getenv("DB_LOCAL", "false").lower() == "true"
+DB_LOCAL_PATH = os.getenv("DB_LOCAL_PATH", "codecrew-local.db")
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
-    raise ValueError("DATABASE_URL environment variable is not set")
+    if not DB_LOCAL:
+        raise ValueError("DATABASE_URL environment variable is not set (or set DB_LOCAL=true for a local SQLite database)")
+    DATABASE_URL = f"sqlite:///{DB_LOCAL_PATH}"
+
+# Connections held open per worker, extra connections allowed under bursts,
+# and seconds a request waits for a free connection before failing
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+def async_database_url(url: str) -> str:
+    """Map a plain DATABASE_URL onto its asyncio driver (asyncpg / aiosqlite)"""
+    for prefix, driver in (("postgresql://", "postgresql+asyncpg://"),
+                           ("postgres://", "postgresql+asyncpg://"),
+                           ("sqlite://", "sqlite+aiosqlite://")):
+        if url.startswith(prefix):
+            return driver + url[len(prefix):]
+    return url
+
+
+def is_memory_sqlite(url: str) -> bool:
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+ASYNC_DATABASE_URL = async_database_url(DATABASE_URL)
+# aiosqlite gives every session the one connection of an in-memory database,
+# so concurrent requests would interleave their transactions on it
+if is_memory_sqlite(ASYNC_DATABASE_URL):
+    raise ValueError("In-memory SQLite is not supported; use a database file instead, e.g. /tmp/codecrew.db")
+
+engine_options = {"pool_pre_ping": True}
+if not ASYNC_DATABASE_URL.startswith("sqlite"):
+    engine_options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+
+engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside the single writer; waiting on a
+        # locked database beats failing under concurrent requests
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay usable after commit, so nothing lazily reloads outside the session
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
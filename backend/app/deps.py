@@ -1,22 +1,24 @@
+import os
+import secrets
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from .database import SessionLocal
-from .crud import get_user_by_email
-from .auth import verify_password, decode_token
+from .auth import verify_password, decode_token, load_principal
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
+# Lets a metrics scraper, which cannot log in, read the operational endpoints
+# with `Authorization: Bearer <METRICS_TOKEN>`; unset, only teachers can
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
-def get_db():
-    db = SessionLocal()
-    try:
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     try:
         payload = decode_token(token)
         email = payload.get("sub")
@@ -24,7 +26,18 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
     except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
-    user = get_user_by_email(db, email)
+    # Served from the principal cache; the session only connects on a miss
+    user = await load_principal(db, email)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
     return user
+
+
+async def require_operator(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    """Guard for /metrics and the stats endpoints: a teacher, or the METRICS_TOKEN bearer"""
+    if METRICS_TOKEN and secrets.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        return None
+    user = await get_current_user(token, db)
+    if user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can view server statistics")
+    return user
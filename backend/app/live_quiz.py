@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Called with (session_id, quiz_id, partial) to share this worker's tally
+PublishTally = Callable[[int, int, dict], Awaitable[None]]
+# Called with (session_id, teacher_id, quiz_results frame) for local teacher sockets
+PushResults = Callable[[int, int, dict], Awaitable[None]]
+
+
+class LiveQuiz:
+    """One running quiz round in a session, as seen by this worker"""
+
+    def __init__(self, started: dict, quiz: dict):
+        self.quiz_id: int = started['quizId']
+        self.started = started
+        self.options = started.get('options') or None
+        self.correct_answer: str = quiz['correct_answer']
+        self.teacher_id: int = quiz['teacher_id']
+        self.closed = False
+        # Students who answered through this worker, in any run of this round
+        self.answered: Set[int] = set()
+        # Answers received here, not yet shared with the other workers
+        self.local: Counter = Counter()
+        self.local_correct = 0
+        self.local_dirty = False
+        # worker_id -> {'counts': {...}, 'correct': n}, including our own
+        self.partials: Dict[str, dict] = {}
+        self.results_dirty = False
+
+    def reopen(self, started: dict, quiz: dict):
+        self.started = started
+        self.options = started.get('options') or None
+        self.correct_answer = quiz['correct_answer']
+        self.teacher_id = quiz['teacher_id']
+        self.closed = False
+        self.results_dirty = True
+
+    def results(self) -> dict:
+        counts: Counter = Counter({option: 0 for option in self.options or ()})
+        correct = 0
+        for partial in self.partials.values():
+            counts.update(partial['counts'])
+            correct += partial['correct']
+        return {
+            'type': 'quiz_results',
+            'quizId': self.quiz_id,
+            'counts': dict(counts),
+            'total': sum(counts.values()),
+            'correct': correct,
+            'closed': self.closed,
+        }
+
+
+class LiveQuizzes:
+    """In-memory tallies for live quiz rounds, pushed to the teacher on a timer.
+
+    Each worker counts the answers its own sockets submit. Every
+    `push_interval` seconds it shares its counts through the backplane (the
+    quiz_tally envelope) and sends the merged totals to any teacher socket it
+    holds, so a burst of answers turns into a few pushes a second however many
+    students answer at once.
+
+    Starting a quiz that already ran in the session resumes its round, with
+    the same totals, so a student's second answer is refused. That is only
+    known per worker, for as long as the session has sockets on it: a second
+    answer through another worker, or after this worker forgot the session,
+    is accepted and shows in the live totals. Storage keeps one answer per
+    student and quiz (uq_quiz_responses_quiz_student), so it is neither
+    stored nor counted in the analytics.
+    """
+
+    def __init__(self, push_interval: float, publish_tally: PublishTally, push_results: PushResults):
+        self.push_interval = push_interval
+        self.publish_tally = publish_tally
+        self.push_results = push_results
+        # The current round per session, and every round run in it
+        self._quizzes: Dict[int, LiveQuiz] = {}
+        self._rounds: Dict[int, Dict[int, LiveQuiz]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.push()
+
+    def get(self, session_id: int) -> Optional[LiveQuiz]:
+        return self._quizzes.get(session_id)
+
+    def open(self, session_id: int, started: dict, quiz: dict):
+        # Starting another round replaces the previous one as the current round
+        rounds = self._rounds.setdefault(session_id, {})
+        live = rounds.get(started['quizId'])
+        if live is None:
+            live = rounds[started['quizId']] = LiveQuiz(started, quiz)
+        else:
+            live.reopen(started, quiz)
+        self._quizzes[session_id] = live
+
+    def end(self, session_id: int, quiz_id: int):
+        quiz = self._quizzes.get(session_id)
+        if quiz and quiz.quiz_id == quiz_id:
+            # Kept until the next round so late tallies still reach the teacher
+            quiz.closed = True
+            quiz.results_dirty = True
+
+    def forget(self, session_id: int):
+        self._quizzes.pop(session_id, None)
+        self._rounds.pop(session_id, None)
+
+    def answer(self, session_id: int, quiz_id, student_id: int, answer) -> Optional[bool]:
+        """Count an answer; returns whether it is correct, or None if it was not accepted"""
+        quiz = self._quizzes.get(session_id)
+        if not quiz or quiz.closed or quiz.quiz_id != quiz_id or not isinstance(answer, str):
+            return None
+        if quiz.options and answer not in quiz.options:
+            return None
+        if student_id in quiz.answered:
+            return None
+        quiz.answered.add(student_id)
+        quiz.local[answer] += 1
+        correct = answer == quiz.correct_answer
+        quiz.local_correct += correct
+        quiz.local_dirty = True
+        return correct
+
+    def merge(self, session_id: int, quiz_id: int, worker_id: str, partial: dict):
+        quiz = self._quizzes.get(session_id)
+        if quiz and quiz.quiz_id == quiz_id:
+            quiz.partials[worker_id] = partial
+            quiz.results_dirty = True
+
+    async def push(self):
+        for session_id, quiz in list(self._quizzes.items()):
+            try:
+                if quiz.local_dirty:
+                    quiz.local_dirty = False
+                    await self.publish_tally(session_id, quiz.quiz_id,
+                                             {'counts': dict(quiz.local), 'correct': quiz.local_correct})
+                if quiz.results_dirty:
+                    quiz.results_dirty = False
+                    await self.push_results(session_id, quiz.teacher_id, quiz.results())
+            except Exception:
+                logger.exception("Failed to push live quiz results for session %s", session_id)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.push_interval)
+            await self.push()
+
+    def stats(self) -> dict:
+        return {
+            'rounds': len(self._quizzes),
+            'open_rounds': sum(not quiz.closed for quiz in self._quizzes.values()),
+        }
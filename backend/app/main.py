@@ -1,26 +1,54 @@
 from dotenv import load_dotenv
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Response, UploadFile, File, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from datetime import datetime, timedelta
-from .database import engine, Base, SessionLocal
-from . import models, deps, auth, crud, schemas
+from collections import Counter
+import csv
+import io
+import logging
+from .database import engine, Base, DB_LOCAL
+from . import models, deps, auth, crud, schemas, analytics
 from .deps import get_db
-from .crud import create_user, get_user_by_email, create_session, get_session, get_messages, get_user_sessions, get_quizzes, create_quiz, create_class, get_teacher_classes, get_student_classes, get_class_by_id, enroll_student_in_class, remove_student_from_class, get_class_students, get_all_students, update_session, delete_session, update_class, record_response, get_responses
-from .schemas import UserCreate, UserOut, SessionCreate, SessionOut, MessageCreate, MessageOut, QuizOut, QuizCreate, QuizResponseCreate, QuizResponseOut, ClassCreate, ClassOut, SessionUpdate, ClassUpdate
+from .crud import create_user, get_user_by_email, create_session, get_session, get_messages, get_user_sessions, get_quizzes, create_quiz, create_class, get_teacher_classes, get_student_classes, get_class_by_id, enroll_student_in_class, remove_student_from_class, get_class_students, get_all_students, update_session, delete_session, update_class, record_response, get_responses, get_student, get_session_quiz
+from .schemas import UserCreate, UserOut, SessionCreate, SessionOut, MessageCreate, MessageOut, QuizOut, QuizCreate, QuizResponseCreate, QuizResponseOut, ClassCreate, ClassOut, SessionUpdate, ClassUpdate, BulkEnrollmentRequest, BulkEnrollmentResponse, MAX_BULK_ENROLLMENT, QuizAnalytics, SessionAnalytics, ClassAnalytics, StudentAnalytics
 from .deps import get_current_user
-from .auth import create_access_token, verify_password
+from .pagination import Page, NEXT_CURSOR_HEADER, ndjson_export
+from .cache import principal_cache
+from .access import access_cache, session_access, class_access
+from .auth import create_access_token, verify_password_async, password_pool, PasswordPoolSaturated
 from .ws import router as ws_router
-from .ai_quiz import generate_quiz_questions, QuestionGenerationRequest, QuestionGenerationResponse
+from .websocket import manager as ws_manager
+from .user_import import import_users, read_rows, detect_format
+from . import user_import
+from .ai_quiz import QuestionGenerationRequest, QuestionGenerationResponse
+from . import ai_quiz
+from .ai_cache import question_cache, parse_prewarm, AI_PREWARM
+from .ai_jobs import ai_jobs, JobStatus
+from . import metrics, profiler
 import os
 
 load_dotenv()
 
-Base.metadata.create_all(bind=engine)
+# LOG_LEVEL=DEBUG adds per-connection and per-request detail
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
 app = FastAPI(title="CodeCrew")
 
+metrics.instrument_engine(engine)
+metrics.instrument_pool(engine)
+app.add_middleware(metrics.MetricsMiddleware)
+# Opt-in, as it walks the stack for every statement; see profiler.py
+if profiler.PROFILE_REQUESTS:
+    profiler.instrument_engine(engine)
+    app.add_middleware(profiler.ProfilerMiddleware)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -28,34 +56,52 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
-# Attach DB session to state
+# The schema is managed by Alembic (start.sh runs `alembic upgrade head`);
+# DB_CREATE_ALL=true (implied by DB_LOCAL) creates missing tables directly, e.g. for throwaway databases
 @app.on_event("startup")
-def startup_event():
-    app.state.db = SessionLocal()
-    print(f"APP_STARTUP: SECRET_KEY loaded: {os.getenv('SECRET_KEY')}")
+async def startup_event():
+    if DB_LOCAL or os.getenv("DB_CREATE_ALL", "false").lower() == "true":
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    if ai_quiz.client is not None:
+        question_cache.start_prewarm(parse_prewarm(AI_PREWARM))
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@app.on_event("shutdown")
+async def shutdown_event():
+    await ws_manager.shutdown()
+    await question_cache.close()
+    await ai_jobs.close()
+    await engine.dispose()
+    password_pool.shutdown()
+    user_import.shutdown_pool()
+
+@app.exception_handler(PasswordPoolSaturated)
+async def password_pool_saturated_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "Too many sign-ins in progress, please retry shortly"},
+        headers={"Retry-After": "1"},
+    )
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Auth routes
 @app.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = get_user_by_email(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await get_user_by_email(db, form_data.username)
+    verified, new_hash = (await verify_password_async(form_data.password, user.hashed_password)) if user else (False, None)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash predates the current bcrypt cost; upgrade it now we know the password
+        await crud.update_password_hash(db, user, new_hash)
     access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
         data={"sub": user.email}, expires_delta=access_token_expires
@@ -63,251 +109,329 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     return {"access_token": access_token, "token_type": "bearer", "role": user.role}
 
 @app.post("/users", response_model=UserOut)
-def create_user_endpoint(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = get_user_by_email(db, email=user.email)
+async def create_user_endpoint(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return create_user(db=db, user=user)
+    return await create_user(db=db, user=user)
 
 @app.post("/signup", response_model=UserOut)
-def signup_endpoint(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = get_user_by_email(db, email=user.email)
+async def signup_endpoint(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return create_user(db=db, user=user)
+    return await create_user(db=db, user=user)
+
+@app.post("/users/import")
+async def import_users_endpoint(
+    file: UploadFile = File(...),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Create accounts from a CSV (name,email,password[,role]) or JSONL upload.
+
+    Existing emails and repeated rows are skipped and reported, never updated.
+    """
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can import users")
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        return await import_users(db, read_rows(stream, detect_format(file.filename)))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Import file must be UTF-8")
+    finally:
+        stream.detach()
 
 @app.get("/users/me", response_model=UserOut)
-def read_users_me(current_user: models.User = Depends(get_current_user)):
+async def read_users_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
 # Class endpoints
 @app.post("/classes", response_model=ClassOut)
-def create_class_endpoint(
+async def create_class_endpoint(
     class_data: ClassCreate,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can create classes")
-    return create_class(db, current_user.id, class_data)
+    return await create_class(db, current_user.id, class_data)
 
 @app.put("/classes/{class_id}", response_model=ClassOut)
-def update_class_endpoint(
+async def update_class_endpoint(
     class_id: int,
     class_data: ClassUpdate,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can update classes")
     
-    updated_class = update_class(db, class_id, current_user.id, class_data)
+    updated_class = await update_class(db, class_id, current_user.id, class_data)
     if not updated_class:
         raise HTTPException(status_code=404, detail="Class not found or not authorized")
     
     return updated_class
 
 @app.get("/classes", response_model=List[ClassOut])
-def get_classes(
+async def get_classes(
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user.role == "teacher":
-        return get_teacher_classes(db, current_user.id)
+        return await get_teacher_classes(db, current_user.id)
     else:
-        return get_student_classes(db, current_user.id)
+        return await get_student_classes(db, current_user.id)
 
 @app.get("/classes/{class_id}", response_model=ClassOut)
-def get_class_endpoint(
+async def get_class_endpoint(
     class_id: int,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    class_obj = get_class_by_id(db, class_id)
-    if not class_obj:
-        raise HTTPException(status_code=404, detail="Class not found")
-    
-    # Check if user has access to this class
-    if current_user.role == "teacher" and class_obj.teacher_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to access this class")
-    elif current_user.role == "student":
-        # Check if student is enrolled
-        enrollment = db.query(models.ClassEnrollment).filter(
-            models.ClassEnrollment.class_id == class_id,
-            models.ClassEnrollment.student_id == current_user.id
-        ).first()
-        if not enrollment:
-            raise HTTPException(status_code=403, detail="Not enrolled in this class")
-    
-    return class_obj
+    # Owner or enrolled student; see access.py
+    (await class_access(db, current_user, class_id)).require()
+    return await get_class_by_id(db, class_id)
 
 @app.post("/classes/{class_id}/enroll/{student_id}")
-def enroll_student_endpoint(
+async def enroll_student_endpoint(
     class_id: int,
     student_id: int,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can enroll students")
     
-    class_obj = get_class_by_id(db, class_id)
+    class_obj = await get_class_by_id(db, class_id)
     if not class_obj or class_obj.teacher_id != current_user.id:
         raise HTTPException(status_code=404, detail="Class not found")
     
-    student = db.query(models.User).filter(models.User.id == student_id, models.User.role == "student").first()
+    student = await get_student(db, student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
-    return enroll_student_in_class(db, class_id, student_id)
+    return await enroll_student_in_class(db, class_id, student_id)
 
 @app.delete("/classes/{class_id}/enroll/{student_id}")
-def remove_student_endpoint(
+async def remove_student_endpoint(
     class_id: int,
     student_id: int,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can remove students")
     
-    class_obj = get_class_by_id(db, class_id)
+    class_obj = await get_class_by_id(db, class_id)
     if not class_obj or class_obj.teacher_id != current_user.id:
         raise HTTPException(status_code=404, detail="Class not found")
     
-    success = remove_student_from_class(db, class_id, student_id)
+    success = await remove_student_from_class(db, class_id, student_id)
     if not success:
         raise HTTPException(status_code=404, detail="Student not enrolled in this class")
     
     return {"message": "Student removed from class"}
 
+async def _owned_class_or_404(db: AsyncSession, class_id: int, current_user: models.User, action: str):
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail=f"Only teachers can {action} students")
+    class_obj = await get_class_by_id(db, class_id)
+    if not class_obj or class_obj.teacher_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Class not found")
+    return class_obj
+
+def _bulk_response(outcomes: list) -> dict:
+    return {"counts": dict(Counter(o["status"] for o in outcomes)), "results": outcomes}
+
+@app.post("/classes/{class_id}/enrollments", response_model=BulkEnrollmentResponse)
+async def bulk_enroll_endpoint(
+    class_id: int,
+    roster: BulkEnrollmentRequest,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Enroll students by id and/or email; already enrolled students are reported, not duplicated"""
+    await _owned_class_or_404(db, class_id, current_user, "enroll")
+    return _bulk_response(await crud.bulk_enroll_students(db, class_id, roster.student_ids, roster.emails))
+
+@app.post("/classes/{class_id}/enrollments/csv", response_model=BulkEnrollmentResponse)
+async def bulk_enroll_csv_endpoint(
+    class_id: int,
+    file: UploadFile = File(...),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Enroll the students listed in a CSV roster.
+
+    Every cell that is a number is taken as a student id and every cell
+    containing @ as an email, so header rows and extra columns are ignored.
+    """
+    await _owned_class_or_404(db, class_id, current_user, "enroll")
+    try:
+        text = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Roster must be a UTF-8 CSV file")
+    student_ids, emails = [], []
+    for row in csv.reader(io.StringIO(text)):
+        for cell in row:
+            cell = cell.strip()
+            if cell.isdigit():
+                student_ids.append(int(cell))
+            elif "@" in cell:
+                emails.append(cell)
+    if len(student_ids) + len(emails) > MAX_BULK_ENROLLMENT:
+        raise HTTPException(status_code=413, detail=f"Roster exceeds {MAX_BULK_ENROLLMENT} students")
+    return _bulk_response(await crud.bulk_enroll_students(db, class_id, student_ids, emails))
+
+@app.post("/classes/{class_id}/enrollments/remove", response_model=BulkEnrollmentResponse)
+async def bulk_remove_endpoint(
+    class_id: int,
+    roster: BulkEnrollmentRequest,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Remove students by id and/or email in one statement"""
+    await _owned_class_or_404(db, class_id, current_user, "remove")
+    return _bulk_response(await crud.bulk_remove_students(db, class_id, roster.student_ids, roster.emails))
+
 @app.get("/classes/{class_id}/students", response_model=List[UserOut])
-def get_class_students_endpoint(
+async def get_class_students_endpoint(
     class_id: int,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can view class students")
     
-    class_obj = get_class_by_id(db, class_id)
+    class_obj = await get_class_by_id(db, class_id)
     if not class_obj or class_obj.teacher_id != current_user.id:
         raise HTTPException(status_code=404, detail="Class not found")
     
-    return get_class_students(db, class_id)
+    return await get_class_students(db, class_id)
 
 @app.get("/students", response_model=List[UserOut])
-def get_all_students_endpoint(
+async def get_all_students_endpoint(
+    response: Response,
+    page: Page = Depends(),
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can view all students")
     
-    return get_all_students(db)
+    return page.respond(response, await get_all_students(db, page.cursor, page.limit))
+
+@app.get("/students/export")
+async def export_students_endpoint(current_user: models.User = Depends(get_current_user)):
+    """All students as NDJSON, one UserOut per line"""
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can view all students")
+
+    return ndjson_export(get_all_students, UserOut, "students.ndjson")
 
 # Session endpoints
 @app.get("/sessions", response_model=List[SessionOut])
-def get_sessions_endpoint(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return get_user_sessions(db, current_user.id)
+async def get_sessions_endpoint(
+    response: Response,
+    page: Page = Depends(),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    return page.respond(response, await get_user_sessions(db, current_user.id, page.cursor, page.limit))
 
 @app.get("/sessions/{session_id}", response_model=SessionOut)
-def get_session_endpoint(
+async def get_session_endpoint(
     session_id: int,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    session = get_session(db, session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    # Check if user has access to this session
-    if current_user.role == "teacher":
-        if session.teacher_id != current_user.id:
-            raise HTTPException(status_code=403, detail="Not authorized to access this session")
-    else:
-        # Check if student is enrolled in the class
-        if session.class_id:
-            enrollment = db.query(models.ClassEnrollment).filter(
-                models.ClassEnrollment.class_id == session.class_id,
-                models.ClassEnrollment.student_id == current_user.id
-            ).first()
-            if not enrollment:
-                raise HTTPException(status_code=403, detail="Not enrolled in this class")
-    
-    return session
+    # Owning teacher or enrolled student; see access.py
+    (await session_access(db, current_user, session_id)).require()
+    return await get_session(db, session_id)
 
 @app.post("/sessions", response_model=SessionOut)
-def post_session_endpoint(sc: SessionCreate,
+async def post_session_endpoint(sc: SessionCreate,
                   current_user=Depends(get_current_user),
                   db=Depends(get_db)):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can create sessions")
-    return create_session(db, current_user.id, sc)
+    return await create_session(db, current_user.id, sc)
 
 @app.put("/sessions/{session_id}", response_model=SessionOut)
-def update_session_endpoint(
+async def update_session_endpoint(
     session_id: int,
     session_data: SessionUpdate,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can update sessions")
     
-    updated_session = update_session(db, session_id, current_user.id, session_data)
+    updated_session = await update_session(db, session_id, current_user.id, session_data)
     if not updated_session:
         raise HTTPException(status_code=404, detail="Session not found or not authorized")
     
     return updated_session
 
 @app.delete("/sessions/{session_id}")
-def delete_session_endpoint(
+async def delete_session_endpoint(
     session_id: int,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can delete sessions")
     
-    success = delete_session(db, session_id, current_user.id)
+    success = await delete_session(db, session_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="Session not found or not authorized")
     
     return {"message": "Session deleted successfully"}
 
 @app.get("/sessions/{session_id}/messages", response_model=List[MessageOut])
-def read_messages_endpoint(session_id: int,
+async def read_messages_endpoint(session_id: int,
+                   response: Response,
+                   page: Page = Depends(),
                    db=Depends(get_db),
                    current_user=Depends(get_current_user)):
-    sess = get_session(db, session_id)
-    if not sess:
-        raise HTTPException(status_code=404)
-    return get_messages(db, session_id)
+    (await session_access(db, current_user, session_id)).require()
+    return page.respond(response, await get_messages(db, session_id, page.cursor, page.limit))
+
+@app.get("/sessions/{session_id}/messages/export")
+async def export_messages_endpoint(session_id: int,
+                     db=Depends(get_db),
+                     current_user=Depends(get_current_user)):
+    """Full chat history of a session as NDJSON, one MessageOut per line"""
+    (await session_access(db, current_user, session_id)).require()
+    return ndjson_export(
+        lambda db, after_id, limit: get_messages(db, session_id, after_id, limit),
+        MessageOut, f"session-{session_id}-messages.ndjson"
+    )
 
 @app.get("/sessions/{session_id}/quizzes", response_model=List[QuizOut])
-def read_quizzes_endpoint(session_id: int,
+async def read_quizzes_endpoint(session_id: int,
+                 response: Response,
+                 page: Page = Depends(),
                  db=Depends(get_db),
                  current_user=Depends(get_current_user)):
-    sess = get_session(db, session_id)
-    if not sess:
-        raise HTTPException(status_code=404)
-    return get_quizzes(db, session_id)
+    (await session_access(db, current_user, session_id)).require()
+    return page.respond(response, await get_quizzes(db, session_id, page.cursor, page.limit))
 
 @app.post("/sessions/{session_id}/quizzes", response_model=QuizOut)
-def create_session_quiz_endpoint(session_id: int,
+async def create_session_quiz_endpoint(session_id: int,
                        quiz: QuizCreate,
                        db=Depends(get_db),
                        current_user=Depends(get_current_user)):
-    sess = get_session(db, session_id)
+    sess = await get_session(db, session_id)
     if not sess:
         raise HTTPException(status_code=404)
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can create quizzes")
-    return create_quiz(db, session_id, current_user.id, quiz)
+    return await create_quiz(db, session_id, current_user.id, quiz)
 
 @app.post("/sessions/{session_id}/quizzes/{quiz_id}/responses", response_model=QuizResponseOut)
-def submit_quiz_response_endpoint(
+async def submit_quiz_response_endpoint(
     session_id: int,
     quiz_id: int,
     response: QuizResponseCreate,
@@ -318,31 +442,29 @@ def submit_quiz_response_endpoint(
     if current_user.role != "student":
         raise HTTPException(status_code=403, detail="Only students can submit quiz responses")
     
-    # Check if session exists
-    sess = get_session(db, session_id)
-    if not sess:
-        raise HTTPException(status_code=404, detail="Session not found")
+    # Session exists and the student is enrolled in its class, if it has one
+    access = await session_access(db, current_user, session_id)
+    if not access.found:
+        access.require()
     
     # Check if quiz exists
-    quiz = db.query(models.Quiz).filter(models.Quiz.id == quiz_id, models.Quiz.session_id == session_id).first()
+    quiz = await get_session_quiz(db, session_id, quiz_id)
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
-    # Check if student is enrolled in the class (if session is part of a class)
-    if sess.class_id:
-        enrollment = db.query(models.ClassEnrollment).filter(
-            models.ClassEnrollment.class_id == sess.class_id,
-            models.ClassEnrollment.student_id == current_user.id
-        ).first()
-        if not enrollment:
-            raise HTTPException(status_code=403, detail="Not enrolled in this class")
+    access.require()
     
-    return record_response(db, quiz_id, current_user.id, response)
+    stored = await record_response(db, quiz_id, current_user.id, response)
+    if stored is None:
+        raise HTTPException(status_code=409, detail="Quiz already answered")
+    return stored
 
 @app.get("/sessions/{session_id}/quizzes/{quiz_id}/responses", response_model=List[QuizResponseOut])
-def get_quiz_responses_endpoint(
+async def get_quiz_responses_endpoint(
     session_id: int,
     quiz_id: int,
+    response: Response,
+    page: Page = Depends(),
     db=Depends(get_db),
     current_user=Depends(get_current_user)
 ):
@@ -351,41 +473,192 @@ def get_quiz_responses_endpoint(
         raise HTTPException(status_code=403, detail="Only teachers can view quiz responses")
     
     # Check if session exists and belongs to teacher
-    sess = get_session(db, session_id)
-    if not sess or sess.teacher_id != current_user.id:
+    if (await session_access(db, current_user, session_id)).relation != "teacher":
         raise HTTPException(status_code=404, detail="Session not found")
     
     # Check if quiz exists
-    quiz = db.query(models.Quiz).filter(models.Quiz.id == quiz_id, models.Quiz.session_id == session_id).first()
+    quiz = await get_session_quiz(db, session_id, quiz_id)
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    
+    return page.respond(response, await get_responses(db, quiz_id, page.cursor, page.limit))
+
+@app.get("/sessions/{session_id}/quizzes/{quiz_id}/responses/export")
+async def export_quiz_responses_endpoint(
+    session_id: int,
+    quiz_id: int,
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """All responses for a quiz as NDJSON, one QuizResponseOut per line (teachers only)"""
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can view quiz responses")
+    
+    if (await session_access(db, current_user, session_id)).relation != "teacher":
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    quiz = await get_session_quiz(db, session_id, quiz_id)
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    
+    return ndjson_export(
+        lambda db, after_id, limit: get_responses(db, quiz_id, after_id, limit),
+        QuizResponseOut, f"quiz-{quiz_id}-responses.ndjson"
+    )
+
+# Quiz analytics, read from aggregates maintained as responses are recorded
+@app.get("/sessions/{session_id}/quizzes/{quiz_id}/analytics", response_model=QuizAnalytics)
+async def quiz_analytics_endpoint(
+    session_id: int,
+    quiz_id: int,
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Response count, accuracy and answer distribution of one quiz (teachers only)"""
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can view analytics")
+    
+    if (await session_access(db, current_user, session_id)).relation != "teacher":
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    quiz = await get_session_quiz(db, session_id, quiz_id)
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
-    return get_responses(db, quiz_id)
+    return await analytics.quiz_summary(db, quiz)
+
+@app.get("/sessions/{session_id}/analytics", response_model=SessionAnalytics)
+async def session_analytics_endpoint(
+    session_id: int,
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Per-quiz accuracy and per-student scores of a session (teachers only)"""
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can view analytics")
+    
+    if (await session_access(db, current_user, session_id)).relation != "teacher":
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return await analytics.session_summary(db, session_id)
+
+@app.get("/classes/{class_id}/analytics", response_model=ClassAnalytics)
+async def class_analytics_endpoint(
+    class_id: int,
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Per-session accuracy and per-student scores across a class (teachers only)"""
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can view analytics")
+    
+    class_obj = await get_class_by_id(db, class_id)
+    if not class_obj or class_obj.teacher_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Class not found")
+    
+    return await analytics.class_summary(db, class_id)
+
+@app.get("/students/{student_id}/analytics", response_model=StudentAnalytics)
+async def student_analytics_endpoint(
+    student_id: int,
+    db=Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """A student's per-session scores: their own, or those in a teacher's sessions"""
+    if current_user.role == "teacher":
+        if not await get_student(db, student_id):
+            raise HTTPException(status_code=404, detail="Student not found")
+        return await analytics.student_summary(db, student_id, teacher_id=current_user.id)
+    
+    if current_user.id != student_id:
+        raise HTTPException(status_code=403, detail="Students can only view their own analytics")
+    return await analytics.student_summary(db, student_id)
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(deps.require_operator)])
+def metrics_endpoint():
+    """This worker's metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+def _require_profiler(current_user):
+    if not profiler.PROFILE_REQUESTS:
+        raise HTTPException(status_code=404, detail="Profiling is disabled; set PROFILE_REQUESTS=true")
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can view request profiles")
+
+@app.get("/debug/profiles")
+def list_profiles_endpoint(current_user=Depends(get_current_user)):
+    """Slow and flagged request traces kept by this worker, newest first"""
+    _require_profiler(current_user)
+    return {"stats": profiler.stats(), "traces": [trace.summary() for trace in reversed(profiler.traces)]}
+
+@app.get("/debug/profiles/{trace_id}")
+def get_profile_endpoint(trace_id: int, current_user=Depends(get_current_user)):
+    """Every statement of one trace, with its caller, and the N+1/duplicate flags"""
+    _require_profiler(current_user)
+    trace = profiler.find(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace.detail()
+
+@app.get("/cache/stats", dependencies=[Depends(deps.require_operator)])
+def cache_stats():
+    """Hit/miss counters of this worker's authenticated-user and access-decision caches"""
+    return {"principals": principal_cache.stats(), "access": access_cache.stats()}
 
 # AI Quiz Generation endpoints
 @app.post("/ai/generate-questions", response_model=QuestionGenerationResponse)
-def generate_questions_endpoint(
+async def generate_questions_endpoint(
     request: QuestionGenerationRequest,
     current_user: models.User = Depends(get_current_user)
 ):
-    """Generate quiz questions using AI"""
+    """Generate quiz questions using AI; identical requests share a cached set unless `refresh` is set"""
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can generate AI questions")
     
-    return generate_quiz_questions(request)
+    return await question_cache.get(request)
+
+@app.post("/ai/jobs", response_model=JobStatus, status_code=status.HTTP_202_ACCEPTED)
+async def create_ai_job_endpoint(
+    request: QuestionGenerationRequest,
+    current_user: models.User = Depends(get_current_user)
+):
+    """Start generating questions in the background; poll or stream the job for results"""
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can generate AI questions")
+    
+    return ai_jobs.submit(current_user.id, request).snapshot()
+
+@app.get("/ai/jobs/{job_id}", response_model=JobStatus)
+async def get_ai_job_endpoint(job_id: str, current_user: models.User = Depends(get_current_user)):
+    """Status of a generation job and the questions received so far"""
+    job = ai_jobs.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.snapshot()
+
+@app.get("/ai/jobs/{job_id}/stream")
+async def stream_ai_job_endpoint(job_id: str, current_user: models.User = Depends(get_current_user)):
+    """Server-sent events: each question as soon as it is parsed, then the final status"""
+    job = ai_jobs.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(job.events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/ai/status")
 def ai_status_endpoint():
     """Check AI service status"""
     api_key = os.getenv("OPENAI_API_KEY")
     has_api_key = bool(api_key)
-    client_available = client is not None
+    client_available = ai_quiz.client is not None
     
     return {
         "has_api_key": has_api_key,
         "api_key_length": len(api_key) if api_key else 0,
         "client_available": client_available,
-        "status": "available" if client_available else "unavailable"
+        "status": "available" if client_available else "unavailable",
+        "cache": question_cache.stats(),
+        "jobs": ai_jobs.stats()
     }
 
 # Mount WebSocket router
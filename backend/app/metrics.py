@@ -0,0 +1,299 @@
+"""Prometheus metrics for this worker, served as text at GET /metrics.
+
+The counters, gauges and histograms here render the Prometheus text
+exposition format themselves, so no client library is needed. Recording a
+value is a dictionary update (plus a bisect for histograms) and safe to do
+on hot paths. Every worker keeps its own values; scrape each worker, or
+aggregate them in Prometheus.
+
+Request latency is labelled with the route template (`/sessions/{session_id}`),
+never the raw path, so the number of series stays bounded.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+Labels = Tuple[str, ...]
+
+# Seconds; from sub-millisecond cache hits to slow AI calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels: Labels = tuple(labels)
+
+    def _key(self, labels: dict) -> Labels:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in self.values.items()]
+
+
+class Gauge(_Metric):
+    """A value set by the code, or read from `collect` at scrape time.
+
+    `collect` returns a number for an unlabelled gauge, or a dict of label
+    value tuples to numbers.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), collect: Callable = None):
+        super().__init__(name, help, labels)
+        self.values: Dict[Labels, float] = {}
+        self.collect = collect
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[str]:
+        values = self.values
+        if self.collect is not None:
+            collected = self.collect()
+            values = collected if isinstance(collected, dict) else {(): collected}
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in values.items() if value is not None]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (last is +Inf)], sum
+        self.values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = Registry()
+
+# HTTP
+http_requests = registry.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_latency = registry.histogram("http_request_duration_seconds", "Time to the response headers, by route",
+                                  ("method", "route"))
+http_db_queries = registry.histogram("http_request_db_queries", "SQL statements issued per request, by route",
+                                     ("method", "route"), buckets=QUERY_COUNT_BUCKETS)
+http_in_progress = registry.gauge("http_requests_in_progress", "HTTP requests being handled")
+
+# Database
+db_queries = registry.counter("db_queries_total", "SQL statements executed, by statement type", ("statement",))
+db_query_latency = registry.histogram("db_query_duration_seconds", "SQL statement execution time", ("statement",))
+
+# WebSocket
+ws_frames = registry.counter("ws_outbound_frames_total", "WebSocket frames sent, by message type", ("type",))
+ws_bytes = registry.counter("ws_outbound_bytes_total", "WebSocket payload bytes sent, by message type", ("type",))
+ws_dropped = registry.counter("ws_dropped_frames_total", "Outbound frames shed or superseded, by message type", ("type",))
+ws_fanout_latency = registry.histogram("ws_fanout_latency_seconds",
+                                       "Time from a frame being queued for a socket to being sent, by message type",
+                                       ("type",))
+
+# AI
+ai_generation_latency = registry.histogram("ai_generation_duration_seconds",
+                                           "Question generation time, by path and outcome", ("path", "outcome"))
+
+
+class _RequestStats:
+    __slots__ = ("queries",)
+
+    def __init__(self):
+        self.queries = 0
+
+
+# The stats of the HTTP request being handled; a mutable holder, so SQL run
+# from SQLAlchemy's greenlets counts towards the request that caused it
+_request_stats: ContextVar[Optional[_RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def _statement_type(statement: str) -> str:
+    word = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    return word if word in ("select", "insert", "update", "delete") else "other"
+
+
+def instrument_engine(engine):
+    """Count and time every statement the engine executes"""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+        if context is not None:
+            context._metrics_timing = True
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        if context is not None:
+            context._metrics_timing = False
+        kind = _statement_type(statement)
+        db_queries.inc(statement=kind)
+        db_query_latency.observe(time.perf_counter() - started, statement=kind)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        # after_cursor_execute never fires for a statement that raised; errors
+        # while fetching its rows come after it did
+        execution = context.execution_context
+        if execution is not None and getattr(execution, "_metrics_timing", False):
+            execution._metrics_timing = False
+            context.connection.info["query_start"].pop()
+
+
+def instrument_pool(engine):
+    """Gauges of the engine's connection pool, read at scrape time.
+
+    SQLite's pools report nothing; QueuePool (Postgres) reports all of them.
+    """
+    pool = getattr(engine, "sync_engine", engine).pool
+
+    def connections():
+        figures = {}
+        for state, name in (("checked_out", "checkedout"), ("idle", "checkedin"), ("overflow", "overflow")):
+            method = getattr(pool, name, None)
+            if callable(method):
+                figures[(state,)] = max(method(), 0)
+        return figures
+
+    size = getattr(pool, "size", None)
+    registry.gauge("db_pool_connections", "Pooled connections by state", ("state",), collect=connections)
+    registry.gauge("db_pool_size", "Connections the pool keeps open", collect=size if callable(size) else lambda: None)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and SQL statements per HTTP route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        status = 500
+        observed = False
+
+        def record():
+            nonlocal observed
+            if observed:
+                return
+            observed = True
+            # Set by the router once a route matched; unmatched paths share one series
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            http_latency.observe(time.perf_counter() - start, method=method, route=route)
+            http_db_queries.observe(stats.queries, method=method, route=route)
+            http_requests.inc(method=method, route=route, status=status)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                record()
+            await send(message)
+
+        http_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_progress.dec()
+            record()
+            _request_stats.reset(token)
@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, JSON, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, JSON, Text, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
 
+# Composite indexes below match the hot predicates: a parent id filter plus
+# the id ordering used by keyset pagination (see crud._keyset)
+
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (Index("ix_users_role_id", "role", "id"),)
     id             = Column(Integer, primary_key=True, index=True)
     name           = Column(String, nullable=False)
     email          = Column(String, unique=True, index=True, nullable=False)
@@ -22,6 +26,7 @@ class User(Base):
 
 class Class(Base):
     __tablename__ = "classes"
+    __table_args__ = (Index("ix_classes_teacher_id", "teacher_id"),)
     id          = Column(Integer, primary_key=True, index=True)
     name        = Column(String, nullable=False)
     description = Column(Text, nullable=True)
@@ -34,6 +39,11 @@ class Class(Base):
 
 class ClassEnrollment(Base):
     __tablename__ = "class_enrollments"
+    __table_args__ = (
+        # Also serves lookups by class_id alone
+        UniqueConstraint("class_id", "student_id", name="uq_class_enrollments_class_student"),
+        Index("ix_class_enrollments_student_id_class_id", "student_id", "class_id"),
+    )
     id        = Column(Integer, primary_key=True, index=True)
     class_id  = Column(Integer, ForeignKey("classes.id"))
     student_id= Column(Integer, ForeignKey("users.id"))
@@ -44,6 +54,10 @@ class ClassEnrollment(Base):
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (
+        Index("ix_sessions_teacher_id_id", "teacher_id", "id"),
+        Index("ix_sessions_class_id", "class_id"),
+    )
     id         = Column(Integer, primary_key=True, index=True)
     title      = Column(String, nullable=False)
     teacher_id = Column(Integer, ForeignKey("users.id"))
@@ -61,6 +75,7 @@ class Session(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (Index("ix_messages_session_id_id", "session_id", "id"),)
     id           = Column(Integer, primary_key=True, index=True)
     session_id   = Column(Integer, ForeignKey("sessions.id"))
     sender_id    = Column(Integer, ForeignKey("users.id"))
@@ -72,6 +87,7 @@ class Message(Base):
 
 class Quiz(Base):
     __tablename__ = "quizzes"
+    __table_args__ = (Index("ix_quizzes_session_id_id", "session_id", "id"),)
     id              = Column(Integer, primary_key=True, index=True)
     session_id      = Column(Integer, ForeignKey("sessions.id"))
     question_text   = Column(Text, nullable=False)
@@ -85,6 +101,10 @@ class Quiz(Base):
 
 class QuizResponse(Base):
     __tablename__ = "quiz_responses"
+    __table_args__ = (
+        Index("ix_quiz_responses_quiz_id_id", "quiz_id", "id"),
+        UniqueConstraint("quiz_id", "student_id", name="uq_quiz_responses_quiz_student"),
+    )
     id              = Column(Integer, primary_key=True, index=True)
     quiz_id         = Column(Integer, ForeignKey("quizzes.id"))
     student_id      = Column(Integer, ForeignKey("users.id"))
@@ -95,8 +115,44 @@ class QuizResponse(Base):
     quiz    = relationship("Quiz", back_populates="responses")
     student = relationship("User", back_populates="quiz_responses")
 
+# Quiz analytics, kept up to date as responses are recorded (see app.analytics)
+class QuizStats(Base):
+    __tablename__ = "quiz_stats"
+    __table_args__ = (Index("ix_quiz_stats_session_id", "session_id"),)
+    quiz_id    = Column(Integer, ForeignKey("quizzes.id"), primary_key=True)
+    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
+    responses  = Column(Integer, default=0, nullable=False)
+    correct    = Column(Integer, default=0, nullable=False)
+
+class QuizAnswerStats(Base):
+    __tablename__ = "quiz_answer_stats"
+    quiz_id         = Column(Integer, ForeignKey("quizzes.id"), primary_key=True)
+    selected_answer = Column(String, primary_key=True)
+    responses       = Column(Integer, default=0, nullable=False)
+
+class StudentSessionStats(Base):
+    __tablename__ = "student_session_stats"
+    __table_args__ = (Index("ix_student_session_stats_student_id", "student_id"),)
+    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+    student_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    responses  = Column(Integer, default=0, nullable=False)
+    correct    = Column(Integer, default=0, nullable=False)
+
+# Generated question sets by content hash of the request (see app.ai_cache)
+class AIQuestionSet(Base):
+    __tablename__ = "ai_question_sets"
+    key         = Column(String(64), primary_key=True)
+    subject     = Column(String, nullable=False)
+    grade_level = Column(String, nullable=False)
+    difficulty  = Column(String, nullable=False)
+    topic       = Column(String, nullable=True)
+    count       = Column(Integer, nullable=False)
+    questions   = Column(JSON, nullable=False)
+    created_at  = Column(DateTime, default=datetime.utcnow, nullable=False)
+
 class WhiteboardData(Base):
     __tablename__ = "whiteboard_data"
+    __table_args__ = (Index("ix_whiteboard_data_session_id_id", "session_id", "id"),)
     id         = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("sessions.id"))
     data_json  = Column(JSON, nullable=False)
@@ -106,6 +162,7 @@ class WhiteboardData(Base):
 
 class Feedback(Base):
     __tablename__ = "feedback"
+    __table_args__ = (Index("ix_feedback_session_id", "session_id"),)
     id            = Column(Integer, primary_key=True, index=True)
     from_user_id  = Column(Integer, ForeignKey("users.id"))
     to_user_id    = Column(Integer, ForeignKey("users.id"))
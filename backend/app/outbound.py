@@ -0,0 +1,139 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Union
+from fastapi import WebSocket
+from . import metrics
+
+# Delivery policies for queued frames
+CRITICAL = "critical"        # never dropped; a client that falls this far behind is evicted
+DROP_OLDEST = "drop_oldest"  # under pressure the oldest queued frame of this kind is dropped (else of any droppable kind)
+LATEST = "latest"            # a newer frame of the same type replaces the queued one
+
+DEFAULT_POLICIES: Dict[str, str] = {
+    'offer': CRITICAL,
+    'answer': CRITICAL,
+    'ice_candidate': CRITICAL,
+    'chat_message': CRITICAL,
+    'user_joined': CRITICAL,
+    'user_left': CRITICAL,
+    'whiteboard_clear': CRITICAL,
+    'whiteboard_draw': DROP_OLDEST,
+    'whiteboard_batch': DROP_OLDEST,
+    'participants_list': LATEST,
+}
+
+Payload = Union[str, bytes]
+
+
+class ConnectionWriter:
+    """Owns all writes to one WebSocket.
+
+    Senders only ever append to a bounded queue, so a lagging client costs
+    at most `max_queue` frames of memory and never slows anyone else down.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_queue: int,
+        send_timeout: float,
+        on_failure: Callable[[], None],
+        policies: Optional[Dict[str, str]] = None,
+    ):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.on_failure = on_failure
+        self.policies = policies if policies is not None else DEFAULT_POLICIES
+        self.queue = deque()
+        self.closed = False
+        # Metrics
+        self.sent = 0
+        self.dropped = 0
+        self.high_water = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    @property
+    def depth(self) -> int:
+        return len(self.queue)
+
+    def enqueue(self, message_type: str, payload: Payload) -> bool:
+        """Queue a frame; returns False if the connection should be evicted"""
+        if self.closed:
+            return False
+        policy = self.policies.get(message_type, CRITICAL)
+
+        if policy == LATEST:
+            self._remove_type(message_type)
+        if len(self.queue) >= self.max_queue and not self._drop_oldest(message_type):
+            if policy != CRITICAL:
+                self.dropped += 1
+                metrics.ws_dropped.inc(type=message_type)
+                return True
+            # Nothing left to shed and this frame must not be lost
+            self.closed = True
+            return False
+
+        self.queue.append((message_type, payload, time.perf_counter()))
+        self.high_water = max(self.high_water, len(self.queue))
+        self._wakeup.set()
+        return True
+
+    def _remove_type(self, message_type: str):
+        for entry in self.queue:
+            if entry[0] == message_type:
+                self._drop(entry)
+                return
+
+    def _drop_oldest(self, message_type: str) -> bool:
+        """Shed the oldest queued frame of `message_type` if that type may be
+        dropped, otherwise the oldest frame of any droppable type"""
+        if self.policies.get(message_type, CRITICAL) != CRITICAL:
+            for entry in self.queue:
+                if entry[0] == message_type:
+                    return self._drop(entry)
+        for entry in self.queue:
+            if self.policies.get(entry[0], CRITICAL) != CRITICAL:
+                return self._drop(entry)
+        return False
+
+    def _drop(self, entry) -> bool:
+        self.queue.remove(entry)
+        self.dropped += 1
+        metrics.ws_dropped.inc(type=entry[0])
+        return True
+
+    async def _run(self):
+        while not self.closed:
+            if not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            message_type, payload, queued_at = self.queue.popleft()
+            try:
+                if isinstance(payload, bytes):
+                    await asyncio.wait_for(self.websocket.send_bytes(payload), timeout=self.send_timeout)
+                else:
+                    await asyncio.wait_for(self.websocket.send_text(payload), timeout=self.send_timeout)
+                self.sent += 1
+                # JSON text is ASCII, so its length is its size in bytes
+                metrics.ws_frames.inc(type=message_type)
+                metrics.ws_bytes.inc(len(payload), type=message_type)
+                metrics.ws_fanout_latency.observe(time.perf_counter() - queued_at, type=message_type)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.closed = True
+                self.on_failure()
+                return
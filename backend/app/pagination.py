@@ -0,0 +1,62 @@
+import os
+from typing import AsyncIterator, Awaitable, Callable, Optional, Sequence
+from fastapi import Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from .database import SessionLocal
+
+# Rows per page when the client does not ask for a size, and the most it may ask for
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "100"))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "1000"))
+# Rows fetched per query while streaming an NDJSON export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Called as fetch(db, after_id, limit) and returns rows ordered by id
+PageFetcher = Callable[..., Awaitable[Sequence]]
+
+
+class Page:
+    """Keyset pagination parameters: rows with id > cursor, at most `limit` of them.
+
+    The cursor is the id of the last row of the previous page, handed out in
+    the X-Next-Cursor response header; it is absent on the last page.
+    """
+
+    def __init__(
+        self,
+        cursor: Optional[int] = Query(None, ge=0, description="Value of X-Next-Cursor from the previous page"),
+        limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+
+    def respond(self, response: Response, rows: Sequence):
+        """Return `rows` as the page body, advertising the next cursor if there may be more"""
+        if len(rows) == self.limit:
+            response.headers[NEXT_CURSOR_HEADER] = str(rows[-1].id)
+        return rows
+
+
+async def _ndjson_lines(fetch: PageFetcher, schema: type[BaseModel]) -> AsyncIterator[str]:
+    after_id = None
+    while True:
+        # A short-lived session per batch: a slow reader never pins a connection
+        async with SessionLocal() as db:
+            rows = await fetch(db, after_id, EXPORT_BATCH_SIZE)
+        if not rows:
+            return
+        yield "".join(schema.model_validate(row).model_dump_json() + "\n" for row in rows)
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+        after_id = rows[-1].id
+
+
+def ndjson_export(fetch: PageFetcher, schema: type[BaseModel], filename: str) -> StreamingResponse:
+    """Stream every row `fetch` pages through as newline-delimited JSON"""
+    return StreamingResponse(
+        _ndjson_lines(fetch, schema),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
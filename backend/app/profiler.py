@@ -0,0 +1,208 @@
+"""Opt-in per-request SQL profiler.
+
+With PROFILE_REQUESTS=true every HTTP request records the SQL statements it
+runs: their text, duration and the app functions that issued them (e.g.
+`crud.get_session` called from `main.get_session_endpoint`). A request is
+flagged when one caller runs the same statement PROFILE_REPEAT_THRESHOLD
+times or more (an N+1 pattern), or runs the same statement with the same
+parameters twice (a redundant query). Requests slower than PROFILE_SLOW_MS,
+and flagged ones, are kept in a ring buffer of the last PROFILE_BUFFER_SIZE
+traces on this worker, viewable at GET /debug/profiles.
+
+Walking the stack for every statement is not free, so leave this off in
+production. Parameters are never stored, only compared.
+"""
+import itertools
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional
+
+try:
+    import greenlet
+except ImportError:  # only needed to see past SQLAlchemy's async bridge
+    greenlet = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "false").lower() == "true"
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "200"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "200"))
+PROFILE_REPEAT_THRESHOLD = int(os.getenv("PROFILE_REPEAT_THRESHOLD", "3"))
+# Longest statement text kept in a trace
+MAX_STATEMENT_LENGTH = 2000
+
+# Modules whose frames say nothing about who issued a statement
+_SKIP_MODULES = ("app.profiler", "app.metrics", "app.database", "app.deps")
+_IN_LIST = re.compile(r"\bIN \((?:\s*(?:\?|%\(\w+\)s|\$\d+)\s*,)+\s*(?:\?|%\(\w+\)s|\$\d+)\s*\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    """Statement text with whitespace collapsed and IN lists of any length made equal"""
+    return _IN_LIST.sub("IN (?)", _SPACE.sub(" ", statement).strip())
+
+
+def callers(limit: int = 2) -> List[str]:
+    """The innermost app functions on the stack, as "module.function"
+
+    SQLAlchemy's async engine runs the driver in a child greenlet, whose
+    stack ends at the bridge; the coroutines that awaited the query are
+    suspended in the parent greenlet.
+    """
+    frame = sys._getframe(1)
+    if greenlet is not None:
+        current = greenlet.getcurrent()
+        if current.parent is not None and current.parent.gr_frame is not None:
+            frame = current.parent.gr_frame
+    found = []
+    while frame is not None and len(found) < limit:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("app.") and not module.startswith(_SKIP_MODULES):
+            found.append(f"{module[4:]}.{frame.f_code.co_name}")
+        frame = frame.f_back
+    return found
+
+
+class Trace:
+    _ids = itertools.count(1)
+
+    def __init__(self, method: str, path: str):
+        self.id = next(self._ids)
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.started_at = datetime.utcnow()
+        self.duration_ms = 0.0
+        self.queries: List[dict] = []
+        self.flags: List[dict] = []
+        self._seen: Counter = Counter()
+
+    def add(self, statement: str, parameters, duration_ms: float, origin: List[str]):
+        normalized = normalize(statement)
+        try:
+            repeat_key = (normalized, hash(repr(parameters)))
+        except Exception:
+            repeat_key = None
+        duplicate = repeat_key is not None and self._seen[repeat_key] > 0
+        if repeat_key is not None:
+            self._seen[repeat_key] += 1
+        self.queries.append({
+            "statement": normalized[:MAX_STATEMENT_LENGTH],
+            "duration_ms": round(duration_ms, 3),
+            "caller": origin[0] if origin else None,
+            "via": origin[1] if len(origin) > 1 else None,
+            "duplicate": duplicate,
+        })
+
+    def analyze(self):
+        """Flag repeated statements per caller, and exact duplicates"""
+        repeats = Counter((q["statement"], q["caller"]) for q in self.queries)
+        for (statement, caller), count in repeats.items():
+            if count >= PROFILE_REPEAT_THRESHOLD:
+                self.flags.append({"kind": "n_plus_one", "caller": caller, "count": count, "statement": statement})
+        duplicates = Counter((q["statement"], q["caller"]) for q in self.queries if q["duplicate"])
+        for (statement, caller), count in duplicates.items():
+            self.flags.append({"kind": "duplicate", "caller": caller, "count": count + 1, "statement": statement})
+
+    @property
+    def db_ms(self) -> float:
+        return round(sum(q["duration_ms"] for q in self.queries), 3)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id, "method": self.method, "path": self.path, "route": self.route, "status": self.status,
+            "started_at": self.started_at.isoformat(), "duration_ms": round(self.duration_ms, 3),
+            "queries": len(self.queries), "db_ms": self.db_ms, "flags": len(self.flags),
+        }
+
+    def detail(self) -> dict:
+        return {**self.summary(), "flags": self.flags, "queries": self.queries}
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("profile_trace", default=None)
+traces: deque = deque(maxlen=PROFILE_BUFFER_SIZE)
+recorded = Counter()
+
+
+def instrument_engine(engine):
+    """Attach every statement the engine runs to the current request's trace"""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+        if context is not None:
+            context._profile_timing = True
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["profile_start"].pop()
+        if context is not None:
+            context._profile_timing = False
+        trace = _current.get()
+        if trace is not None:
+            trace.add(statement, parameters, (time.perf_counter() - started) * 1000, callers())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        # A statement that raised never reaches after_cursor_execute
+        execution = context.execution_context
+        if execution is not None and getattr(execution, "_profile_timing", False):
+            execution._profile_timing = False
+            context.connection.info["profile_start"].pop()
+
+
+class ProfilerMiddleware:
+    """ASGI middleware giving each HTTP request a trace and keeping the slow or flagged ones"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/debug/profiles"):
+            return await self.app(scope, receive, send)
+
+        trace = Trace(scope["method"], scope["path"])
+        token = _current.set(trace)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            trace.duration_ms = (time.perf_counter() - start) * 1000
+            trace.route = getattr(scope.get("route"), "path", None)
+            trace.analyze()
+            recorded["requests"] += 1
+            if trace.flags:
+                recorded["flagged"] += 1
+                for flag in trace.flags:
+                    logger.warning("%s %s: %s ran %d times from %s: %s", trace.method, trace.route or trace.path,
+                                   flag["kind"], flag["count"], flag["caller"], flag["statement"][:200])
+            if trace.duration_ms >= PROFILE_SLOW_MS:
+                recorded["slow"] += 1
+            if trace.flags or trace.duration_ms >= PROFILE_SLOW_MS:
+                traces.append(trace)
+
+
+def find(trace_id: int) -> Optional[Trace]:
+    return next((trace for trace in traces if trace.id == trace_id), None)
+
+
+def stats() -> dict:
+    return {"enabled": PROFILE_REQUESTS, "slow_ms": PROFILE_SLOW_MS, "buffered": len(traces),
+            "buffer_size": PROFILE_BUFFER_SIZE, **{key: recorded[key] for key in ("requests", "slow", "flagged")}}
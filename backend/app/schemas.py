@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, ConfigDict
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, ConfigDict, Field
+from typing import Optional, List, Dict
 from datetime import datetime
 
 # --- User Schemas ---
@@ -58,6 +58,23 @@ class ClassEnrollmentOut(ClassEnrollmentBase):
     id: int
     enrolled_at: datetime
 
+# Entries accepted in each list of one bulk enrollment request
+MAX_BULK_ENROLLMENT = 5000
+
+class BulkEnrollmentRequest(BaseModel):
+    student_ids: List[int] = Field(default_factory=list, max_length=MAX_BULK_ENROLLMENT)
+    emails: List[str] = Field(default_factory=list, max_length=MAX_BULK_ENROLLMENT)
+
+class EnrollmentOutcome(BaseModel):
+    student_id: Optional[int] = None
+    email: Optional[str] = None
+    # enrolled, already_enrolled, removed, not_enrolled, not_found or invalid
+    status: str
+
+class BulkEnrollmentResponse(BaseModel):
+    counts: Dict[str, int]
+    results: List[EnrollmentOutcome]
+
 # --- Session Schemas ---
 
 
@@ -143,6 +160,49 @@ class QuizResponseOut(QuizResponseBase):
     timestamp: datetime
 
 
+# --- Quiz Analytics Schemas ---
+class AnalyticsTotals(BaseModel):
+    responses: int
+    correct: int
+    accuracy: Optional[float]  # correct / responses; null before the first response
+
+
+class QuizScore(AnalyticsTotals):
+    quiz_id: int
+    question_text: str
+
+
+class QuizAnalytics(QuizScore):
+    answers: Dict[str, int]
+
+
+class StudentScore(AnalyticsTotals):
+    student_id: int
+    name: str
+
+
+class SessionScore(AnalyticsTotals):
+    session_id: int
+    title: str
+
+
+class SessionAnalytics(AnalyticsTotals):
+    session_id: int
+    quizzes: List[QuizScore]
+    students: List[StudentScore]
+
+
+class ClassAnalytics(AnalyticsTotals):
+    class_id: int
+    sessions: List[SessionScore]
+    students: List[StudentScore]
+
+
+class StudentAnalytics(AnalyticsTotals):
+    student_id: int
+    sessions: List[SessionScore]
+
+
 # --- Whiteboard Data Schemas ---
 class WhiteboardDataBase(BaseModel):
     data_json: dict
@@ -0,0 +1,221 @@
+"""Bulk user provisioning from CSV or JSONL.
+
+Rows are read as a stream and handled in batches. Each batch is validated,
+deduplicated against existing users with one query, has its passwords hashed
+across a process pool, and is inserted with a single executemany. Used by
+POST /users/import and from the command line:
+
+    python -m app.user_import users.csv [--format jsonl] [--processes 8]
+
+CSV files need a header with name, email and password columns and an
+optional role column (student by default); JSONL lines carry the same keys.
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from email_validator import validate_email, EmailNotValidError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+from .auth import hash_password
+from .crud import insert_ignoring_conflicts
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_HASH_PROCESSES = int(os.getenv("IMPORT_HASH_PROCESSES", str(os.cpu_count() or 1)))
+# Rejected rows listed in a summary; the counts cover all of them
+IMPORT_MAX_REJECTED = int(os.getenv("IMPORT_MAX_REJECTED", "1000"))
+ROLES = ("student", "teacher")
+
+# One import at a time per worker; each already uses every hashing process
+_import_lock = asyncio.Lock()
+# Started on the first import and kept until shutdown_pool()
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def read_rows(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Optional[dict]]]:
+    """Yield (line number, row) pairs; row is None when the line cannot be parsed"""
+    if fmt == "jsonl":
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_no, row if isinstance(row, dict) else None
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, {k.strip().lower(): v for k, v in row.items() if k}
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """Runs in a pool process"""
+    return [hash_password(password) for password in passwords]
+
+
+def _validate(row: Optional[dict]) -> Tuple[Optional[dict], Optional[str]]:
+    if row is None:
+        return None, "unparseable"
+    name = str(row.get("name") or "").strip()
+    password = str(row.get("password") or "")
+    role = str(row.get("role") or "student").strip().lower()
+    if not name or not password or role not in ROLES:
+        return None, "invalid"
+    try:
+        email = validate_email(str(row.get("email") or "").strip(), check_deliverability=False).normalized
+    except EmailNotValidError:
+        return None, "invalid"
+    return {"name": name, "email": email, "password": password, "role": role}, None
+
+
+def hash_pool(processes: int = IMPORT_HASH_PROCESSES) -> ProcessPoolExecutor:
+    """The long-lived hashing pool, started on first use (or again if a process died).
+
+    Its processes are spawned, not forked: a fork of the server would copy
+    the locks its threads hold at that moment.
+    """
+    global _pool
+    if _pool is None or getattr(_pool, "_broken", False):
+        _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+class UserImporter:
+    def __init__(self, db: AsyncSession, pool: ProcessPoolExecutor, processes: int,
+                 max_rejected: int = IMPORT_MAX_REJECTED):
+        self.db = db
+        self.pool = pool
+        self.processes = processes
+        self.max_rejected = max_rejected
+        self.counts: Dict[str, int] = {"created": 0, "exists": 0, "duplicate": 0, "invalid": 0, "unparseable": 0}
+        # The first `max_rejected` rows that were not created, with the reason
+        self.rejected: List[dict] = []
+        self.rejected_omitted = 0
+        self._seen = set()
+
+    def _reject(self, line: int, email: Optional[str], status: str):
+        self.counts[status] += 1
+        if len(self.rejected) < self.max_rejected:
+            self.rejected.append({"line": line, "email": email, "status": status})
+        else:
+            self.rejected_omitted += 1
+
+    async def run(self, rows: Iterable[Tuple[int, Optional[dict]]], batch_size: int = IMPORT_BATCH_SIZE):
+        # Reading and parsing the file blocks, so it happens in a thread, a batch at a time
+        rows = iter(rows)
+        loop = asyncio.get_running_loop()
+        batch: List[Tuple[int, dict]] = []
+        while True:
+            chunk = await loop.run_in_executor(None, list, itertools.islice(rows, batch_size))
+            if not chunk:
+                break
+            for line, raw in chunk:
+                user, error = _validate(raw)
+                if error:
+                    self._reject(line, (raw or {}).get("email"), error)
+                elif user["email"] in self._seen:
+                    self._reject(line, user["email"], "duplicate")
+                else:
+                    self._seen.add(user["email"])
+                    batch.append((line, user))
+                    if len(batch) >= batch_size:
+                        await self._import_batch(batch)
+                        batch = []
+        if batch:
+            await self._import_batch(batch)
+        return {"counts": self.counts, "rejected": self.rejected, "rejected_omitted": self.rejected_omitted}
+
+    async def _hash(self, passwords: List[str]) -> List[str]:
+        loop = asyncio.get_running_loop()
+        size = -(-len(passwords) // self.processes)
+        slices = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+        hashed = await asyncio.gather(*(loop.run_in_executor(self.pool, hash_passwords, s) for s in slices))
+        return [h for part in hashed for h in part]
+
+    async def _import_batch(self, batch: List[Tuple[int, dict]]):
+        emails = [user["email"] for _, user in batch]
+        existing = await self.db.execute(select(models.User.email).where(models.User.email.in_(emails)))
+        existing = set(existing.scalars().all())
+        fresh = []
+        for line, user in batch:
+            if user["email"] in existing:
+                self._reject(line, user["email"], "exists")
+            else:
+                fresh.append((line, user))
+        if not fresh:
+            return
+
+        hashes = await self._hash([user["password"] for _, user in fresh])
+        values = [
+            {"name": user["name"], "email": user["email"], "role": user["role"], "hashed_password": hashed}
+            for (_, user), hashed in zip(fresh, hashes)
+        ]
+        # executemany; ON CONFLICT covers accounts created since the lookup above
+        stmt = insert_ignoring_conflicts(self.db, models.User, ["email"])
+        result = await self.db.execute(stmt.returning(models.User.email), values)
+        inserted = set(result.scalars().all())
+        await self.db.commit()
+        for line, user in fresh:
+            if user["email"] in inserted:
+                self.counts["created"] += 1
+            else:
+                self._reject(line, user["email"], "exists")
+
+
+async def import_users(db: AsyncSession, rows: Iterable[Tuple[int, Optional[dict]]],
+                       processes: int = IMPORT_HASH_PROCESSES, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    async with _import_lock:
+        summary = await UserImporter(db, hash_pool(processes), processes).run(rows, batch_size)
+    logger.info("User import finished: %s", summary["counts"])
+    return summary
+
+
+def detect_format(filename: Optional[str]) -> str:
+    return "jsonl" if filename and filename.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+
+async def _main(args):
+    from .database import SessionLocal, engine
+    fmt = args.format or detect_format(args.path)
+    with open(args.path, encoding="utf-8-sig", newline="") as stream:
+        async with SessionLocal() as db:
+            summary = await import_users(db, read_rows(stream, fmt), args.processes, args.batch_size)
+    await engine.dispose()
+    shutdown_pool()
+    print(json.dumps(summary["counts"]))
+    for row in summary["rejected"]:
+        print(f"line {row['line']}: {row['status']} {row['email'] or ''}", file=sys.stderr)
+    if summary["rejected_omitted"]:
+        print(f"... and {summary['rejected_omitted']} more rows not created", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"))
+    parser.add_argument("--processes", type=int, default=IMPORT_HASH_PROCESSES)
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,136 @@
 import json
 import asyncio
-from typing import Dict, Set
+import logging
+from datetime import datetime
+from typing import Dict, Set, Tuple
 from fastapi import WebSocket, WebSocketDisconnect, HTTPException
 from .auth import get_current_user_ws
-from sqlalchemy.orm import Session
-from . import models
+from . import crud
+from .access import session_access
+from .database import SessionLocal
+from .backplane import Backplane, create_backplane
+from .outbound import ConnectionWriter
+from .codec import JSON, decode_frame
+from .whiteboard import StrokeCoalescer, WhiteboardLog, parse_points
+from .write_behind import WriteBehindBuffer
+from .live_quiz import LiveQuizzes
+from . import metrics
 import os
 
+logger = logging.getLogger(__name__)
+
+# Seconds a single socket may take to accept a frame before it is evicted
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+# Frames buffered per socket before drop policies kick in
+WS_OUTBOUND_QUEUE_SIZE = int(os.getenv("WS_OUTBOUND_QUEUE_SIZE", "256"))
+# Window over which one user's whiteboard segments are merged into a single frame
+WHITEBOARD_COALESCE_MS = float(os.getenv("WHITEBOARD_COALESCE_MS", "25"))
+# How often drawn strokes are written to the database
+WHITEBOARD_FLUSH_MS = float(os.getenv("WHITEBOARD_FLUSH_MS", "1000"))
+# Delta rows per session before they are folded into a snapshot
+WHITEBOARD_COMPACT_ROWS = int(os.getenv("WHITEBOARD_COMPACT_ROWS", "50"))
+# Live chat is stored in batches: every CHAT_FLUSH_MS or CHAT_BATCH_SIZE messages,
+# holding at most CHAT_MAX_PENDING unsaved messages if the database is down
+CHAT_FLUSH_MS = float(os.getenv("CHAT_FLUSH_MS", "500"))
+CHAT_BATCH_SIZE = int(os.getenv("CHAT_BATCH_SIZE", "200"))
+CHAT_MAX_PENDING = int(os.getenv("CHAT_MAX_PENDING", "10000"))
+# Live quiz totals are pushed to the teacher at most once per LIVE_QUIZ_PUSH_MS;
+# answers are saved every QUIZ_FLUSH_MS or QUIZ_BATCH_SIZE answers
+LIVE_QUIZ_PUSH_MS = float(os.getenv("LIVE_QUIZ_PUSH_MS", "250"))
+QUIZ_FLUSH_MS = float(os.getenv("QUIZ_FLUSH_MS", "500"))
+QUIZ_BATCH_SIZE = int(os.getenv("QUIZ_BATCH_SIZE", "500"))
+QUIZ_MAX_PENDING = int(os.getenv("QUIZ_MAX_PENDING", "10000"))
+
+
+async def _write_chat(rows: list):
+    async with SessionLocal() as db:
+        await crud.append_messages(db, rows)
+
+
+async def _write_quiz_responses(rows: list):
+    async with SessionLocal() as db:
+        await crud.append_responses(db, rows)
+
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, backplane: Backplane = None, policies: Dict[str, str] = None):
         # Store active connections by session_id -> set of WebSocket connections
         self.active_connections: Dict[int, Set[WebSocket]] = {}
         # Store user info by WebSocket connection
         self.connection_users: Dict[WebSocket, dict] = {}
-        # Store session participants
-        self.session_participants: Dict[int, list] = {}
+        # Index of (session_id, user_id) -> that user's sockets (one per tab/panel)
+        self.user_connections: Dict[Tuple[int, int], Set[WebSocket]] = {}
+        # Globally unique id per connection so exclusions survive the backplane
+        self.connection_ids: Dict[WebSocket, str] = {}
+        # One writer task and bounded queue per connection
+        self.writers: Dict[WebSocket, ConnectionWriter] = {}
+        # Wire format negotiated by each connection (JSON text or a binary codec)
+        self.codecs: Dict[WebSocket, object] = {}
+        self.policies = policies
+        self.whiteboard = StrokeCoalescer(WHITEBOARD_COALESCE_MS / 1000, self._flush_strokes)
+        self.whiteboard_log = WhiteboardLog(WHITEBOARD_FLUSH_MS / 1000, WHITEBOARD_COMPACT_ROWS)
+        self.chat_log = WriteBehindBuffer(_write_chat, CHAT_FLUSH_MS / 1000, CHAT_BATCH_SIZE, CHAT_MAX_PENDING, "chat log")
+        self.live_quiz = LiveQuizzes(LIVE_QUIZ_PUSH_MS / 1000, self._publish_tally, self._push_quiz_results)
+        self.quiz_log = WriteBehindBuffer(_write_quiz_responses, QUIZ_FLUSH_MS / 1000, QUIZ_BATCH_SIZE, QUIZ_MAX_PENDING, "quiz responses")
+        # Session participants live in the backplane so every worker sees them
+        self.backplane = backplane or create_backplane()
+        # Eviction tasks by socket; held so they are not garbage collected
+        # mid-flight, and so a socket is only evicted once
+        self._evictions: Dict[WebSocket, asyncio.Task] = {}
+        self._started = False
+        self._connection_seq = 0
+
+    async def start(self):
+        if not self._started:
+            self._started = True
+            await self.backplane.start(self._deliver_local)
+            self.whiteboard_log.start()
+            self.chat_log.start()
+            self.live_quiz.start()
+            self.quiz_log.start()
+
+    async def shutdown(self):
+        await self.whiteboard.close()
+        await self.whiteboard_log.close()
+        await self.chat_log.close()
+        await self.live_quiz.close()
+        await self.quiz_log.close()
+        if self._evictions:
+            await asyncio.gather(*self._evictions.values(), return_exceptions=True)
+        if self._started:
+            self._started = False
+            await self.backplane.close()
 
-    async def connect(self, websocket: WebSocket, session_id: int, user_info: dict):
-        await websocket.accept()
+    async def connect(self, websocket: WebSocket, session_id: int, user_info: dict, codec=JSON, subprotocol: str = None):
+        await self.start()
+        await websocket.accept(subprotocol=subprotocol)
         
         if session_id not in self.active_connections:
             self.active_connections[session_id] = set()
-            self.session_participants[session_id] = []
+            await self.backplane.subscribe(session_id)
         
+        self._connection_seq += 1
         self.active_connections[session_id].add(websocket)
         self.connection_users[websocket] = user_info
+        self.user_connections.setdefault((session_id, user_info['user_id']), set()).add(websocket)
+        self.connection_ids[websocket] = f"{self.backplane.worker_id}:{self._connection_seq}"
+        self.codecs[websocket] = codec
+        writer = ConnectionWriter(
+            websocket,
+            max_queue=WS_OUTBOUND_QUEUE_SIZE,
+            send_timeout=WS_SEND_TIMEOUT,
+            on_failure=lambda: self._schedule_evict(websocket, session_id),
+            policies=self.policies,
+        )
+        self.writers[websocket] = writer
+        writer.start()
         
-        # Add user to session participants
+        # Add user to session participants (one entry per user, however many sockets)
         participant_info = {
             'userId': user_info['user_id'],
             'userName': user_info['name'],
             'role': user_info['role']
         }
-        
-        # Check if user is already in participants list
-        existing_participant = next(
-            (p for p in self.session_participants[session_id] if p['userId'] == user_info['user_id']), 
-            None
-        )
-        if not existing_participant:
-            self.session_participants[session_id].append(participant_info)
+        participants = await self.backplane.add_participant(session_id, participant_info)
         
         # Notify all participants about the new user
         await self.broadcast_to_session(session_id, {
@@ -50,110 +141,248 @@ class ConnectionManager:
         }, exclude_websocket=websocket)
         
         # Send current participants list to the new user
-        await websocket.send_text(json.dumps({
+        await self.send_personal_message({
             'type': 'participants_list',
-            'participants': self.session_participants[session_id]
-        }))
+            'participants': participants
+        }, websocket)
         
         # Notify existing participants about the new user
         await self.broadcast_to_session(session_id, {
             'type': 'participants_list',
-            'participants': self.session_participants[session_id]
+            'participants': participants
         })
+        
+        # Late joiners get the board as one snapshot plus a short delta tail
+        board = await self.whiteboard_log.state(session_id)
+        if board['snapshot'] or board['deltas']:
+            await self.send_personal_message(board, websocket)
+        
+        # ...and the question of a quiz round that is still open
+        quiz = self.live_quiz.get(session_id)
+        if quiz and not quiz.closed:
+            await self.send_personal_message(quiz.started, websocket)
 
-    def disconnect(self, websocket: WebSocket, session_id: int):
-        if session_id in self.active_connections:
-            self.active_connections[session_id].discard(websocket)
-            
-            # Remove user from participants
-            user_info = self.connection_users.get(websocket)
-            if user_info:
-                self.session_participants[session_id] = [
-                    p for p in self.session_participants[session_id] 
-                    if p['userId'] != user_info['user_id']
-                ]
-                
-                # Notify others that user left
-                asyncio.create_task(self.broadcast_to_session(session_id, {
-                    'type': 'user_left',
-                    'userId': user_info['user_id'],
-                    'userName': user_info['name']
-                }))
-                
-                # Update participants list for remaining users
-                asyncio.create_task(self.broadcast_to_session(session_id, {
-                    'type': 'participants_list',
-                    'participants': self.session_participants[session_id]
-                }))
+    async def disconnect(self, websocket: WebSocket, session_id: int):
+        # Safe to call twice: an evicted socket is disconnected again by its endpoint
+        if websocket not in self.connection_users or session_id not in self.active_connections:
+            return
+        self.active_connections[session_id].discard(websocket)
+        self.connection_ids.pop(websocket, None)
+        user_info = self.connection_users.pop(websocket)
+        user_key = (session_id, user_info['user_id'])
+        self.user_connections[user_key].discard(websocket)
+        if not self.user_connections[user_key]:
+            del self.user_connections[user_key]
+        self.codecs.pop(websocket, None)
+        writer = self.writers.pop(websocket, None)
+        if writer:
+            writer.close()
+        
+        # Clean up empty sessions
+        if not self.active_connections[session_id]:
+            del self.active_connections[session_id]
+            self.whiteboard_log.forget(session_id)
+            self.live_quiz.forget(session_id)
+            await self.backplane.unsubscribe(session_id)
+        
+        # Remove user from participants
+        if user_info:
+            participants = await self.backplane.remove_participant(session_id, user_info['user_id'])
             
-            del self.connection_users[websocket]
+            # Notify others that user left
+            await self.broadcast_to_session(session_id, {
+                'type': 'user_left',
+                'userId': user_info['user_id'],
+                'userName': user_info['name']
+            })
             
-            # Clean up empty sessions
-            if not self.active_connections[session_id]:
-                del self.active_connections[session_id]
-                if session_id in self.session_participants:
-                    del self.session_participants[session_id]
+            # Update participants list for remaining users
+            await self.broadcast_to_session(session_id, {
+                'type': 'participants_list',
+                'participants': participants
+            })
 
     async def broadcast_to_session(self, session_id: int, message: dict, exclude_websocket: WebSocket = None):
-        if session_id in self.active_connections:
-            for connection in self.active_connections[session_id]:
-                if connection != exclude_websocket:
-                    try:
-                        await connection.send_text(json.dumps(message))
-                    except:
-                        # Remove broken connections
-                        self.active_connections[session_id].discard(connection)
-                        if connection in self.connection_users:
-                            del self.connection_users[connection]
+        await self.backplane.publish(session_id, {
+            'message': message,
+            'exclude': self.connection_ids.get(exclude_websocket)
+        })
 
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
+    async def send_to_user(self, session_id: int, user_id: int, message: dict):
+        """Deliver a message to every socket a user holds in a session, on any worker"""
+        await self.backplane.publish(session_id, {
+            'message': message,
+            'target': user_id
+        })
+
+    async def _flush_strokes(self, session_id: int, user_id: int, strokes: list, origin: WebSocket):
+        self.whiteboard_log.persist(session_id, strokes)
+        # The drawer has already rendered its own strokes locally
+        await self.broadcast_to_session(session_id, {
+            'type': 'whiteboard_batch',
+            'userId': user_id,
+            'strokes': strokes
+        }, exclude_websocket=origin)
+
+    async def start_quiz(self, session_id: int, teacher_id: int, quiz) -> dict:
+        """Open a live round on every worker; the correct answer stays out of the client frame"""
+        started = {
+            'type': 'quiz_started',
+            'quizId': quiz.id,
+            'question': quiz.question_text,
+            'options': quiz.options,
+        }
+        await self.backplane.publish(session_id, {
+            'message': started,
+            'quiz': {'correct_answer': quiz.correct_answer, 'teacher_id': teacher_id},
+        })
+        return started
+
+    async def _publish_tally(self, session_id: int, quiz_id: int, partial: dict):
+        await self.backplane.publish(session_id, {
+            'quiz_tally': {'quizId': quiz_id, 'worker': self.backplane.worker_id, 'partial': partial}
+        })
+
+    async def _push_quiz_results(self, session_id: int, teacher_id: int, results: dict):
+        for connection in list(self.user_connections.get((session_id, teacher_id), ())):
+            await self.send_personal_message(results, connection)
+
+    async def _deliver_local(self, session_id: int, envelope: dict):
+        tally = envelope.get('quiz_tally')
+        if tally is not None:
+            # Worker-to-worker only; merged totals reach the teacher on the next push
+            self.live_quiz.merge(session_id, tally['quizId'], tally['worker'], tally['partial'])
+            return
+        message = envelope['message']
+        # Keep this worker's copy of the board current, even with no recipients
+        if message.get('type') == 'whiteboard_batch':
+            self.whiteboard_log.apply(session_id, message['strokes'])
+        elif message.get('type') == 'whiteboard_clear':
+            self.whiteboard_log.reset(session_id)
+        elif message.get('type') == 'quiz_started':
+            self.live_quiz.open(session_id, message, envelope['quiz'])
+        elif message.get('type') == 'quiz_ended':
+            self.live_quiz.end(session_id, message['quizId'])
+        
+        exclude = envelope.get('exclude')
+        target = envelope.get('target')
+        if target is not None:
+            candidates = self.user_connections.get((session_id, target), ())
+        else:
+            candidates = self.active_connections.get(session_id, ())
+        recipients = [
+            connection for connection in candidates
+            if exclude is None or self.connection_ids.get(connection) != exclude
+        ]
+        if not recipients:
+            return
+        
+        # Serialize once per wire format; each socket's writer task does the
+        # actual send, so a slow client only delays itself
+        payloads = {}
+        for connection in recipients:
+            writer = self.writers.get(connection)
+            if not writer:
+                continue
+            codec = self.codecs.get(connection, JSON)
+            payload = payloads.get(codec.name)
+            if payload is None:
+                payload = payloads[codec.name] = codec.encode(message)
+            if not writer.enqueue(message.get('type'), payload):
+                self._schedule_evict(connection, session_id)
+
+    def _schedule_evict(self, websocket: WebSocket, session_id: int):
+        """Evict a socket in the background; the broadcasting sender never waits on it"""
+        if websocket in self._evictions:
+            return
+        task = asyncio.create_task(self._evict(websocket, session_id))
+        self._evictions[websocket] = task
+        task.add_done_callback(lambda _: self._evictions.pop(websocket, None))
+
+    async def _evict(self, websocket: WebSocket, session_id: int):
+        await self.disconnect(websocket, session_id)
         try:
-            await websocket.send_text(json.dumps(message))
-        except:
-            # Handle broken connection
+            await asyncio.wait_for(websocket.close(code=1011, reason="Send failed"), timeout=WS_SEND_TIMEOUT)
+        except Exception:
             pass
 
+    async def send_personal_message(self, message: dict, websocket: WebSocket):
+        # A broken connection is cleaned up by its own endpoint; one whose
+        # queue overflows is evicted, as in broadcast_to_session
+        writer = self.writers.get(websocket)
+        if writer:
+            if not writer.enqueue(message.get('type'), self.codecs.get(websocket, JSON).encode(message)):
+                writer.on_failure()
+        else:
+            try:
+                await asyncio.wait_for(websocket.send_text(JSON.encode(message)), timeout=WS_SEND_TIMEOUT)
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        """Outbound queue metrics for this worker"""
+        depths = [writer.depth for writer in self.writers.values()]
+        return {
+            'sessions': len(self.active_connections),
+            'connections': len(self.writers),
+            'queued_frames': sum(depths),
+            'max_queue_depth': max(depths, default=0),
+            'high_water_mark': max((w.high_water for w in self.writers.values()), default=0),
+            'sent_frames': sum(w.sent for w in self.writers.values()),
+            'dropped_frames': sum(w.dropped for w in self.writers.values()),
+            'evicting': len(self._evictions),
+            'chat_log': self.chat_log.stats(),
+            'live_quiz': self.live_quiz.stats(),
+            'quiz_log': self.quiz_log.stats(),
+        }
+
 manager = ConnectionManager()
 
-async def websocket_endpoint(websocket: WebSocket, session_id: int, token: str, db: Session):
-    try:
-        # Authenticate user
-        print(f"WS: Received token: {token[:30]}...") # Print first 30 chars of token
-        print(f"WS: Backend SECRET_KEY loaded: {os.getenv('SECRET_KEY')}") # Verify SECRET_KEY
+metrics.registry.gauge("ws_sessions", "Sessions with a socket on this worker",
+                       collect=lambda: len(manager.active_connections))
+metrics.registry.gauge("ws_connections", "Open session sockets on this worker", collect=lambda: len(manager.writers))
+metrics.registry.gauge("ws_participants", "Distinct users in sessions on this worker",
+                       collect=lambda: len(manager.user_connections))
+metrics.registry.gauge("ws_queued_frames", "Frames waiting in outbound queues on this worker",
+                       collect=lambda: sum(writer.depth for writer in manager.writers.values()))
+
+async def authorize_connection(session_id: int, token: str):
+    """Resolve the user behind a WebSocket token and check session access.
+
+    Returns (user, None, None) on success or (None, close_code, reason). The
+    database connection is only borrowed for these checks and is back in the
+    pool before the socket's message loop starts.
+    """
+    async with SessionLocal() as db:
         user = await get_current_user_ws(token, db)
         if not user:
-            print("WS: Authentication failed - user not found or token invalid")
-            await websocket.close(code=4001, reason="Authentication failed")
-            return
+            logger.info("Authentication failed for session %s", session_id)
+            return None, 4001, "Authentication failed"
         
-        print(f"WS: User {user.email} ({user.role}) authenticated for session {session_id}")
+        logger.debug("User %s (%s) authenticated for session %s", user.id, user.role, session_id)
 
-        # Verify user has access to this session
-        session = db.query(models.Session).filter(models.Session.id == session_id).first()
-        if not session:
-            print(f"WS: Session {session_id} not found")
-            await websocket.close(code=4004, reason="Session not found")
+        # Verify user has access to this session (cached; see access.py)
+        access = await session_access(db, user, session_id)
+        if access.reason == 'session_not_found':
+            logger.info("Session %s not found", session_id)
+            return None, 4004, "Session not found"
+        if access.reason == 'not_session_owner':
+            logger.info("Teacher %s not authorized for session %s (not owner)", user.id, session_id)
+            return None, 4003, "Not authorized for this session"
+        if access.reason == 'not_enrolled':
+            logger.info("Student %s not enrolled in class for session %s", user.id, session_id)
+            return None, 4003, "Not enrolled in this class"
+    return user, None, None
+
+async def websocket_endpoint(websocket: WebSocket, session_id: int, token: str, codec=JSON, subprotocol: str = None):
+    try:
+        # Authenticate user
+        user, close_code, reason = await authorize_connection(session_id, token)
+        if not user:
+            await websocket.close(code=close_code, reason=reason)
             return
         
-        # Check if user is teacher or enrolled student
-        if user.role == "teacher":
-            if session.teacher_id != user.id:
-                print(f"WS: Teacher {user.email} not authorized for session {session_id} (not owner)")
-                await websocket.close(code=4003, reason="Not authorized for this session")
-                return
-        else:
-            # Check if student is enrolled in the class
-            if session.class_id:
-                enrollment = db.query(models.ClassEnrollment).filter(
-                    models.ClassEnrollment.class_id == session.class_id,
-                    models.ClassEnrollment.student_id == user.id
-                ).first()
-                if not enrollment:
-                    print(f"WS: Student {user.email} not enrolled in class for session {session_id}")
-                    await websocket.close(code=4003, reason="Not enrolled in this class")
-                    return
-        
-        print(f"WS: User {user.email} authorized for session {session_id}")
+        logger.debug("User %s authorized for session %s", user.id, session_id)
 
         # Connect to the session
         user_info = {
@@ -162,32 +391,29 @@ async def websocket_endpoint(websocket: WebSocket, session_id: int, token: str,
             'role': user.role
         }
         
-        await manager.connect(websocket, session_id, user_info)
+        await manager.connect(websocket, session_id, user_info, codec, subprotocol)
         
         try:
             while True:
-                # Receive messages from client
-                data = await websocket.receive_text()
-                message = json.loads(data)
+                # Receive messages from client (text frames are JSON, binary
+                # frames use the negotiated codec)
+                frame = await websocket.receive()
+                if frame['type'] == 'websocket.disconnect':
+                    raise WebSocketDisconnect(frame.get('code', 1000))
+                message = decode_frame(codec, frame)
                 
                 # Handle different message types
                 if message['type'] in ['offer', 'answer', 'ice_candidate']:
                     # Forward signaling messages to target user
                     target_user_id = message.get('targetUserId')
                     if target_user_id:
-                        # Find the target user's websocket
-                        target_websocket = None
-                        for ws, user_data in manager.connection_users.items():
-                            if user_data['user_id'] == target_user_id:
-                                target_websocket = ws
-                                break
-                        
-                        if target_websocket:
-                            # Add sender info to the message
-                            message['fromUserId'] = user.id
-                            await manager.send_personal_message(message, target_websocket)
+                        # Add sender info to the message
+                        message['fromUserId'] = user.id
+                        await manager.send_to_user(session_id, target_user_id, message)
                 
                 elif message['type'] == 'chat_message':
+                    if not isinstance(message.get('message'), str) or not message['message']:
+                        continue
                     # Broadcast chat message to all participants in the session
                     chat_message = {
                         'type': 'chat_message',
@@ -197,36 +423,85 @@ async def websocket_endpoint(websocket: WebSocket, session_id: int, token: str,
                         'timestamp': message.get('timestamp')
                     }
                     await manager.broadcast_to_session(session_id, chat_message)
+                    # Stored by the worker the sender is connected to, in the next batch
+                    manager.chat_log.add({
+                        'session_id': session_id,
+                        'sender_id': user.id,
+                        'message_text': message['message'],
+                        'timestamp': datetime.utcnow(),
+                    })
+                
+                elif message['type'] == 'quiz_start' and user.role == 'teacher' and isinstance(message.get('quizId'), int):
+                    # One lookup per round instead of several per answer
+                    async with SessionLocal() as db:
+                        quiz = await crud.get_session_quiz(db, session_id, message.get('quizId'))
+                    if quiz:
+                        await manager.start_quiz(session_id, user.id, quiz)
+                
+                elif message['type'] == 'quiz_end' and user.role == 'teacher':
+                    quiz = manager.live_quiz.get(session_id)
+                    if quiz and quiz.quiz_id == message.get('quizId') and not quiz.closed:
+                        await manager.broadcast_to_session(session_id, {
+                            'type': 'quiz_ended',
+                            'quizId': quiz.quiz_id,
+                            'correctAnswer': quiz.correct_answer
+                        })
+                
+                elif message['type'] == 'quiz_answer' and user.role == 'student':
+                    # Counted in memory and saved with the next batch; no database work here
+                    correct = manager.live_quiz.answer(session_id, message.get('quizId'), user.id, message.get('answer'))
+                    if correct is not None:
+                        manager.quiz_log.add({
+                            'quiz_id': message['quizId'],
+                            'student_id': user.id,
+                            'selected_answer': message['answer'],
+                            'is_correct': correct,
+                            'timestamp': datetime.utcnow(),
+                        })
+                    await manager.send_personal_message({
+                        'type': 'quiz_answer_ack',
+                        'quizId': message.get('quizId'),
+                        'accepted': correct is not None
+                    }, websocket)
                 
                 elif message['type'] == 'whiteboard_draw':
-                    # Broadcast whiteboard drawing to all participants in the session
-                    whiteboard_message = {
-                        'type': 'whiteboard_draw',
-                        'x0': message['x0'],
-                        'y0': message['y0'],
-                        'x1': message['x1'],
-                        'y1': message['y1'],
-                        'color': message.get('color', '#000000'),
-                        'width': message.get('width', 2)
-                    }
-                    await manager.broadcast_to_session(session_id, whiteboard_message)
+                    # Single segment from older clients; coalesced like a batch
+                    points = parse_points([message.get('x0'), message.get('y0'), message.get('x1'), message.get('y1')])
+                    if points:
+                        await manager.whiteboard.add(
+                            session_id, user.id, points,
+                            message.get('color', '#000000'), message.get('width', 2), origin=websocket
+                        )
+                
+                elif message['type'] == 'whiteboard_batch':
+                    # Polyline of points drawn since the client's last frame
+                    points = parse_points(message.get('points'))
+                    if points:
+                        await manager.whiteboard.add(
+                            session_id, user.id, points,
+                            message.get('color', '#000000'), message.get('width', 2), origin=websocket
+                        )
                 
                 elif message['type'] == 'whiteboard_clear':
-                    # Broadcast whiteboard clear to all participants in the session
+                    # Strokes still being coalesced would land on the cleared board
+                    manager.whiteboard.discard_session(session_id)
                     clear_message = {
                         'type': 'whiteboard_clear'
                     }
                     await manager.broadcast_to_session(session_id, clear_message)
+                    manager.whiteboard_log.persist_clear(session_id)
                 
                 elif message['type'] == 'join':
                     # User joining is already handled in connect()
                     pass
                 
         except WebSocketDisconnect:
-            manager.disconnect(websocket, session_id)
+            pass
+        finally:
+            await manager.disconnect(websocket, session_id)
             
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        logger.exception("WebSocket error in session %s", session_id)
         try:
             await websocket.close(code=4000, reason="Internal server error")
         except:
@@ -0,0 +1,290 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from . import crud
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on coordinates accepted in one whiteboard_batch frame
+MAX_BATCH_POINTS = 4000
+
+# Called with (session_id, user_id, strokes, origin) when a window closes
+FlushHandler = Callable[[int, int, List[dict], Optional[object]], Awaitable[None]]
+
+
+def parse_points(points) -> Optional[List[float]]:
+    """Validate a flat [x0, y0, x1, y1, ...] polyline from a client"""
+    if not isinstance(points, list) or len(points) < 4 or len(points) % 2 or len(points) > MAX_BATCH_POINTS:
+        return None
+    if not all(isinstance(p, (int, float)) and not isinstance(p, bool) for p in points):
+        return None
+    return points
+
+
+class _Pending:
+    __slots__ = ('strokes', 'origin', 'task')
+
+    def __init__(self, origin):
+        self.strokes: List[dict] = []
+        self.origin = origin
+        self.task: Optional[asyncio.Task] = None
+
+
+class StrokeCoalescer:
+    """Merges whiteboard segments per user into polylines over a short window.
+
+    A fast pen stroke arrives as many tiny segments; within one window they
+    are chained into a single stroke and sent as one whiteboard_batch frame.
+    """
+
+    def __init__(self, window: float, on_flush: FlushHandler):
+        self.window = window
+        self.on_flush = on_flush
+        self._pending: Dict[Tuple[int, int], _Pending] = {}
+
+    async def add(self, session_id: int, user_id: int, points: List[float], color: str, width, origin=None):
+        key = (session_id, user_id)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _Pending(origin)
+        elif pending.origin is not origin:
+            # Segments from several sockets of one user: echo to all of them
+            pending.origin = None
+
+        last = pending.strokes[-1] if pending.strokes else None
+        if (last and last['color'] == color and last['width'] == width
+                and last['points'][-2] == points[0] and last['points'][-1] == points[1]):
+            last['points'].extend(points[2:])
+        else:
+            pending.strokes.append({'color': color, 'width': width, 'points': list(points)})
+
+        if self.window <= 0:
+            await self.flush(session_id, user_id)
+        elif pending.task is None:
+            pending.task = asyncio.create_task(self._flush_later(key))
+
+    async def _flush_later(self, key: Tuple[int, int]):
+        await asyncio.sleep(self.window)
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Let flush() see this window as closed rather than cancel itself
+            pending.task = None
+        await self.flush(*key)
+
+    async def flush(self, session_id: int, user_id: int):
+        pending = self._pending.pop((session_id, user_id), None)
+        if pending is None:
+            return
+        if pending.task is not None:
+            pending.task.cancel()
+        if pending.strokes:
+            await self.on_flush(session_id, user_id, pending.strokes, pending.origin)
+
+    def discard_session(self, session_id: int):
+        """Drop strokes not yet sent, e.g. because the board was cleared"""
+        for key in [k for k in self._pending if k[0] == session_id]:
+            pending = self._pending.pop(key)
+            if pending.task is not None:
+                pending.task.cancel()
+
+    async def close(self):
+        for key in list(self._pending):
+            await self.flush(*key)
+
+
+def compact_strokes(strokes: List[dict]) -> List[dict]:
+    """Chain strokes that continue one another with the same pen"""
+    compacted: List[dict] = []
+    for stroke in strokes:
+        last = compacted[-1] if compacted else None
+        if (last and last['color'] == stroke['color'] and last['width'] == stroke['width']
+                and last['points'][-2:] == stroke['points'][:2]):
+            last['points'].extend(stroke['points'][2:])
+        else:
+            compacted.append({'color': stroke['color'], 'width': stroke['width'], 'points': list(stroke['points'])})
+    return compacted
+
+
+class _Board:
+    __slots__ = ('snapshot', 'deltas', 'ready', 'loader')
+
+    def __init__(self):
+        self.snapshot: List[dict] = []
+        self.deltas: List[dict] = []
+        self.ready = asyncio.Event()
+        self.loader: Optional[asyncio.Task] = None
+
+
+class WhiteboardLog:
+    """Whiteboard history per session: snapshot + delta tail, in memory and in the DB.
+
+    Every worker keeps the boards of the sessions it serves in memory and
+    applies all strokes it delivers, so joining clients are answered without
+    a query. Strokes drawn on this worker are also queued and written to
+    WhiteboardData every flush interval, in one transaction per session
+    (clear, new delta row and compaction together); once a session has
+    accumulated `compact_rows` delta rows they are folded into a snapshot.
+    Strokes whose write fails stay queued for the next flush, unless their
+    session no longer exists.
+    """
+
+    def __init__(self, flush_interval: float, compact_rows: int, compact_strokes_after: int = 500):
+        self.flush_interval = flush_interval
+        self.compact_rows = compact_rows
+        self.compact_strokes_after = compact_strokes_after
+        self._boards: Dict[int, _Board] = {}
+        # Pending writes per session: lists of strokes, a None entry marks a clear
+        self._unflushed: Dict[int, list] = {}
+        self._delta_rows: Dict[int, int] = {}
+        # Sessions cleared by a broadcast while a flush is running
+        self._cleared: Optional[set] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        loaders = [board.loader for board in self._boards.values() if board.loader is not None]
+        await asyncio.gather(*loaders, return_exceptions=True)
+        await self.flush()
+
+    # -- in-memory view ---------------------------------------------------
+
+    async def state(self, session_id: int) -> dict:
+        """Snapshot plus delta tail for a joining client"""
+        board = self._boards.get(session_id)
+        if board is None:
+            board = self._boards[session_id] = _Board()
+            # Its own task, so a joiner that disconnects mid-load cannot cancel it
+            board.loader = asyncio.create_task(self._populate(session_id, board))
+        await board.ready.wait()
+        return {'type': 'whiteboard_state', 'snapshot': board.snapshot, 'deltas': board.deltas}
+
+    async def _populate(self, session_id: int, board: _Board):
+        try:
+            snapshot, deltas, rows = await self._load(session_id)
+            # Strokes delivered while loading are already in board.deltas
+            board.snapshot = snapshot
+            board.deltas = deltas + board.deltas
+            self._delta_rows[session_id] = rows
+        except Exception:
+            logger.exception("Failed to load whiteboard for session %s", session_id)
+            # Let the next join retry
+            if self._boards.get(session_id) is board:
+                self._boards.pop(session_id)
+        finally:
+            board.loader = None
+            board.ready.set()
+
+    def apply(self, session_id: int, strokes: List[dict]):
+        board = self._boards.get(session_id)
+        if board is None:
+            return
+        board.deltas.extend(strokes)
+        if len(board.deltas) > self.compact_strokes_after:
+            board.snapshot = compact_strokes(board.snapshot + board.deltas)
+            board.deltas = []
+
+    def reset(self, session_id: int):
+        # Strokes from before the clear must not be written after it
+        self._unflushed.pop(session_id, None)
+        if self._cleared is not None:
+            self._cleared.add(session_id)
+        board = self._boards.get(session_id)
+        if board is not None:
+            board.snapshot = []
+            board.deltas = []
+
+    def forget(self, session_id: int):
+        """Drop the in-memory board once no local socket needs it"""
+        self._boards.pop(session_id, None)
+        self._delta_rows.pop(session_id, None)
+
+    # -- persistence --------------------------------------------------------
+
+    def persist(self, session_id: int, strokes: List[dict]):
+        self._unflushed.setdefault(session_id, []).append(strokes)
+
+    def persist_clear(self, session_id: int):
+        # Anything drawn before the clear no longer needs to be written
+        self._unflushed[session_id] = [None]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush whiteboard log")
+
+    async def flush(self):
+        if not self._unflushed:
+            return
+        pending, self._unflushed = self._unflushed, {}
+        self._cleared = set()
+        try:
+            for session_id in list(pending):
+                try:
+                    await self._write(session_id, pending[session_id])
+                except Exception:
+                    logger.exception("Failed to write whiteboard for session %s", session_id)
+                    if await self._exists(session_id):
+                        continue
+                    logger.error("Session %s no longer exists; dropping its unsaved strokes", session_id)
+                del pending[session_id]
+        finally:
+            # Unwritten strokes go back ahead of any queued since, unless the
+            # board was cleared meanwhile
+            for session_id, entries in pending.items():
+                if session_id not in self._cleared:
+                    self._unflushed[session_id] = entries + self._unflushed.get(session_id, [])
+            self._cleared = None
+
+    async def _load(self, session_id: int):
+        async with SessionLocal() as db:
+            snapshot, deltas = await crud.get_whiteboard_tail(db, session_id)
+        strokes = [stroke for row in deltas for stroke in row.data_json.get('strokes', [])]
+        return (snapshot.data_json['strokes'] if snapshot else []), strokes, len(deltas)
+
+    async def _exists(self, session_id: int) -> bool:
+        try:
+            async with SessionLocal() as db:
+                return await crud.get_session(db, session_id) is not None
+        except Exception:
+            # Unreachable database: keep the strokes
+            return True
+
+    async def _write(self, session_id: int, entries: list):
+        rows = self._delta_rows.get(session_id, 0)
+        async with SessionLocal() as db:
+            if None in entries:
+                # Cleared: an empty snapshot supersedes all earlier rows
+                upto = await crud.max_whiteboard_id(db, session_id)
+                await crud.replace_whiteboard_history(db, session_id, [], upto)
+                rows = 0
+                entries = entries[len(entries) - entries[::-1].index(None):]
+            strokes = [stroke for batch in entries for stroke in batch]
+            if strokes:
+                await crud.append_whiteboard_rows(db, [(session_id, {'kind': 'delta', 'strokes': strokes})])
+                rows += 1
+                if rows >= self.compact_rows and await self._compact(db, session_id):
+                    rows = 0
+            await db.commit()
+        # A forgotten board's count is reloaded with the board
+        if session_id in self._boards:
+            self._delta_rows[session_id] = rows
+
+    async def _compact(self, db, session_id: int) -> bool:
+        snapshot, deltas = await crud.get_whiteboard_tail(db, session_id)
+        if not deltas:
+            return False
+        strokes = list(snapshot.data_json['strokes']) if snapshot else []
+        for row in deltas:
+            strokes.extend(row.data_json.get('strokes', []))
+        await crud.replace_whiteboard_history(db, session_id, compact_strokes(strokes), deltas[-1].id)
+        return True
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Generic, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class WriteBehindBuffer(Generic[T]):
+    """Collects rows in memory and hands them to `writer` in batches.
+
+    A batch is written once `max_batch` rows are waiting or `flush_interval`
+    seconds after the previous write, whichever comes first; add() never
+    waits for the database. A failed batch is put back and retried with the
+    next one. After `max_attempts` failures in a row it is written row by
+    row instead, and rows the database still refuses (say, a message for a
+    session deleted meanwhile) are dropped and counted as rejected; if no row
+    goes through, the database is down rather than the rows bad, and all are
+    kept. At most `max_pending` rows are held: beyond that the oldest are
+    dropped and counted, so a database outage cannot exhaust memory.
+    close() lets a write in progress finish, then writes whatever is still
+    buffered; a write cancelled from outside puts its rows back first.
+    """
+
+    def __init__(self, writer: Callable[[List[T]], Awaitable[None]], flush_interval: float,
+                 max_batch: int, max_pending: int, name: str = "write-behind", max_attempts: int = 3):
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.name = name
+        self.max_attempts = max_attempts
+        # Consecutive failures of the batch at the front of the queue
+        self._attempts = 0
+        self._pending: List[T] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.batches = 0
+        self.failures = 0
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            # Cancelling could interrupt a batch mid-write; let the loop finish it instead
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        while self._pending:
+            if not await self.flush():
+                logger.error("%s: %d rows lost at shutdown", self.name, len(self._pending))
+                break
+
+    def add(self, row: T):
+        self._pending.append(row)
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.dropped += overflow
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """Write everything buffered so far; returns False if a batch failed"""
+        async with self._lock:
+            while self._pending:
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+                try:
+                    await self.writer(batch)
+                except asyncio.CancelledError:
+                    self._pending[:0] = batch
+                    raise
+                except Exception:
+                    logger.exception("%s: failed to write %d rows", self.name, len(batch))
+                    self.failures += 1
+                    self._attempts += 1
+                    if self._attempts < self.max_attempts or not await self._write_rows(batch):
+                        # Keep order and retry on the next flush; add() enforces the bound
+                        self._pending[:0] = batch
+                        return False
+                    continue
+                self._attempts = 0
+                self.written += len(batch)
+                self.batches += 1
+        return True
+
+    async def _write_rows(self, batch: List[T]) -> bool:
+        """Write a repeatedly failing batch one row at a time, dropping the rows
+        that fail; returns False, keeping every row, if none could be written"""
+        self._attempts = 0
+        failed = []
+        for i, row in enumerate(batch):
+            try:
+                await self.writer([row])
+            except asyncio.CancelledError:
+                self._pending[:0] = batch[i:]
+                self.written += i - len(failed)
+                self.rejected += len(failed)
+                raise
+            except Exception:
+                failed.append(row)
+        if len(failed) == len(batch):
+            return False
+        self.written += len(batch) - len(failed)
+        self.batches += 1
+        if failed:
+            self.rejected += len(failed)
+            logger.error("%s: dropped %d rows the database rejected", self.name, len(failed))
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'pending': len(self._pending),
+            'written': self.written,
+            'batches': self.batches,
+            'failures': self.failures,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+        }
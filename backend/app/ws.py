@@ -1,7 +1,7 @@
-from fastapi import APIRouter, WebSocket, Query, Depends
-from .websocket import websocket_endpoint
-from .deps import get_db
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, WebSocket, Query
+from .deps import require_operator
+from .websocket import websocket_endpoint, manager
+from .codec import CODECS, negotiate
 
 router = APIRouter()
 
@@ -10,8 +10,21 @@ async def session_websocket(
     websocket: WebSocket, 
     session_id: int, 
     token: str = Query(...),
-    db: Session = Depends(get_db)
+    format: str = Query(None)
 ):
-    print(f"WS_ROUTER: Entered session_websocket for session {session_id} with token: {token[:30]}...")
-    """WebSocket endpoint for WebRTC signaling in video sessions"""
-    await websocket_endpoint(websocket, session_id, token, db)
+    """WebSocket endpoint for WebRTC signaling in video sessions.
+
+    The wire format is JSON text by default; `?format=msgpack` (or the
+    `codecrew.msgpack` subprotocol) switches server frames to binary.
+    """
+    codec, subprotocol = negotiate(format, websocket.scope.get('subprotocols'))
+    if codec is None:
+        await websocket.close(code=4415, reason=f"Unsupported format. Available: {', '.join(CODECS)}")
+        return
+    await websocket_endpoint(websocket, session_id, token, codec, subprotocol)
+
+
+@router.get("/ws/stats", dependencies=[Depends(require_operator)])
+def websocket_stats():
+    """Outbound queue depth and drop counters for this worker's sockets"""
+    return manager.stats()
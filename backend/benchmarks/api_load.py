@@ -0,0 +1,220 @@
+"""Latency and throughput of the REST API under concurrent load.
+
+Run from the backend directory:
+
+    python -m benchmarks.api_load [--url sqlite:///path.db] [--concurrency 16] [--requests 500]
+                                  [--only messages analytics ...] [--json run.json]
+                                  [--compare baseline.json] [--students 2000 ...]
+
+Seeds a database with benchmarks.seed (a throwaway SQLite file in /tmp by
+default; any other URL has its tables dropped and recreated), boots
+app.main in-process and drives each scenario through httpx's ASGI
+transport with `--concurrency` clients at once. The timings therefore cover
+routing, authentication, validation, queries and serialization, but no
+network or server process. Every request is made as a user allowed to make
+it, so errors in the report are real failures.
+
+Prints p50/p99 latency and requests per second per scenario. `--json`
+saves the run (with the commit it was made at); `--compare` prints each
+figure's change against a saved run from the same machine.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.seed import Scale  # noqa: E402
+
+DEFAULT_URL = "sqlite:////tmp/codecrew-load.db"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="untimed requests per scenario first")
+    parser.add_argument("--only", nargs="+", default=[], help="run scenarios whose name contains any of these")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--compare")
+    Scale.add_arguments(parser)
+    return parser.parse_args()
+
+
+def scenarios(seeded, tokens):
+    """name -> function of a Random returning (method, path, token, json body) for one request"""
+    with_quizzes = [session_id for session_id in seeded.session_ids if seeded.session_quizzes.get(session_id)]
+    with_students = [class_id for class_id in seeded.class_ids if seeded.class_students.get(class_id)]
+
+    def teacher(rng):
+        return tokens[rng.choice(seeded.teacher_ids)]
+
+    def student(rng):
+        return tokens[rng.choice(seeded.student_ids)]
+
+    def teacher_of(session_id):
+        return tokens[seeded.class_teachers[seeded.session_classes[session_id]]]
+
+    def student_in(rng, session_id):
+        students = seeded.class_students.get(seeded.session_classes[session_id]) or seeded.student_ids
+        return tokens[rng.choice(students)]
+
+    def as_teacher(path):
+        def make(rng):
+            session_id = rng.choice(seeded.session_ids)
+            return "GET", path.format(session_id), teacher_of(session_id), None
+        return make
+
+    def as_student(path):
+        def make(rng):
+            session_id = rng.choice(seeded.session_ids)
+            return "GET", path.format(session_id), student_in(rng, session_id), None
+        return make
+
+    def class_page(rng):
+        class_id = rng.choice(with_students)
+        return "GET", f"/classes/{class_id}", tokens[rng.choice(seeded.class_students[class_id])], None
+
+    def class_analytics(rng):
+        class_id = rng.choice(seeded.class_ids)
+        return "GET", f"/classes/{class_id}/analytics", tokens[seeded.class_teachers[class_id]], None
+
+    def answer(rng):
+        session_id = rng.choice(with_quizzes)
+        quiz_id = rng.choice(seeded.session_quizzes[session_id])
+        return ("POST", f"/sessions/{session_id}/quizzes/{quiz_id}/responses", student_in(rng, session_id),
+                {"selected_answer": rng.choice("ABCD")})
+
+    return {
+        "GET /users/me": lambda rng: ("GET", "/users/me", student(rng), None),
+        "GET /classes (teacher)": lambda rng: ("GET", "/classes", teacher(rng), None),
+        "GET /classes (student)": lambda rng: ("GET", "/classes", student(rng), None),
+        "GET /classes/{id}": class_page,
+        "GET /sessions": lambda rng: ("GET", "/sessions", teacher(rng), None),
+        "GET /sessions/{id}": as_student("/sessions/{}"),
+        "GET /sessions/{id}/messages": as_teacher("/sessions/{}/messages"),
+        "GET /sessions/{id}/quizzes": as_student("/sessions/{}/quizzes"),
+        "GET /sessions/{id}/analytics": as_teacher("/sessions/{}/analytics"),
+        "GET /classes/{id}/analytics": class_analytics,
+        "POST quiz response": answer,
+    }
+
+
+async def drive(client, make, requests: int, concurrency: int, rng):
+    timings, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            method, path, token, body = make(rng)
+            start = time.perf_counter()
+            response = await client.request(method, path, json=body, headers={"Authorization": f"Bearer {token}"})
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return timings, errors, time.perf_counter() - start
+
+
+def summarize(timings, errors, elapsed):
+    timings = sorted(timings)
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p99_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 3),
+        "rps": round(len(timings) / elapsed, 1),
+        "errors": errors,
+    }
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def change(new, old, lower_is_better=True):
+    pct = (new - old) / old * 100
+    better = pct < 0 if lower_is_better else pct > 0
+    return f"{pct:+.0f}%{'' if abs(pct) < 5 else ' better' if better else ' worse'}"
+
+
+async def main():
+    args = parse_args()
+    os.environ["DATABASE_URL"] = args.url
+    os.environ.setdefault("SECRET_KEY", "benchmark-only-secret-key-not-for-production")
+    # Keep the per-request access log of httpx and the app off the report
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if args.url.startswith("sqlite:///"):
+        for suffix in ("", "-wal", "-shm"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(args.url[len("sqlite:///"):] + suffix)
+
+    import httpx
+    from sqlalchemy import select
+    from app import models
+    from app.auth import create_access_token
+    from app.database import Base, engine
+    from app.main import app
+    from benchmarks.seed import seed_sync
+
+    scale = Scale.from_args(args)
+    start = time.perf_counter()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        seeded = await conn.run_sync(seed_sync, scale, args.seed)
+        users = (await conn.execute(select(models.User.id, models.User.email))).all()
+    print(f"Seeded {engine.dialect.name} in {time.perf_counter() - start:.1f}s: "
+          + ", ".join(f"{count} {name}" for name, count in seeded.rows.items()))
+    tokens = {user_id: create_access_token({"sub": email}) for user_id, email in users}
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    print(f"\n{'scenario':<30}{'p50 ms':>9}{'p99 ms':>9}{'req/s':>9}{'errors':>8}  "
+          f"(concurrency {args.concurrency}, {args.requests} requests)")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, make in scenarios(seeded, tokens).items():
+            if args.only and not any(part in name for part in args.only):
+                continue
+            rng = random.Random(args.seed)
+            await drive(client, make, args.warmup, args.concurrency, rng)
+            result = summarize(*await drive(client, make, args.requests, args.concurrency, rng))
+            results[name] = result
+            line = f"{name:<30}{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['rps']:>9.0f}{result['errors']:>8}"
+            old = baseline.get(name)
+            if old:
+                line += (f"  p50 {change(result['p50_ms'], old['p50_ms'])},"
+                         f" req/s {change(result['rps'], old['rps'], lower_is_better=False)}")
+            print(line)
+    await engine.dispose()
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"commit": commit(), "dialect": engine.dialect.name, "scale": scale.__dict__,
+                       "concurrency": args.concurrency, "requests": args.requests, "results": results}, f, indent=2)
+        print(f"\nSaved to {args.json_path}")
+    return 1 if any(result["errors"] for result in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,155 @@
+"""Query plans and latency of the hot read paths, without and with their indexes.
+
+Run from the backend directory:
+
+    python -m benchmarks.query_plans [--url sqlite:////tmp/codecrew-bench.db] [--repeat 200]
+                                     [--messages-per-session 100 ...]
+
+Seeds a database (a throwaway SQLite file by default; pass --url for
+Postgres, whose tables are dropped and recreated) with benchmarks.seed, then
+runs each crud read path twice: once with only the primary-key and email
+indexes the schema used to have, and once with every index in app.models.
+For each it prints the plan the database chose and the p50/p99 latency.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.seed import Scale  # noqa: E402
+
+DEFAULT_URL = "sqlite:////tmp/codecrew-bench.db"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--repeat", type=int, default=200)
+    Scale.add_arguments(parser)
+    return parser.parse_args()
+
+
+def hot_indexes(metadata):
+    """Indexes beyond each table's ix_<table>_id and the unique email index"""
+    return [
+        index for table in metadata.sorted_tables for index in table.indexes
+        if index.name not in (f"ix_{table.name}_id", "ix_users_email")
+    ]
+
+
+def read_paths(crud, seeded, rng):
+    """(label, coroutine factory) pairs; each factory takes a session"""
+    def pick(ids):
+        return rng.choice(ids)
+
+    return [
+        ("messages page", lambda db: crud.get_messages(db, pick(seeded.session_ids), None, 100)),
+        ("messages page (cursor)", lambda db: crud.get_messages(db, pick(seeded.session_ids), 50, 100)),
+        ("quizzes of session", lambda db: crud.get_quizzes(db, pick(seeded.session_ids), None, 100)),
+        ("quiz responses page", lambda db: crud.get_responses(db, pick(seeded.quiz_ids), None, 100)),
+        ("students page", lambda db: crud.get_all_students(db, pick(seeded.student_ids), 100)),
+        ("teacher sessions page", lambda db: crud.get_user_sessions(db, pick(seeded.teacher_ids), None, 100)),
+        ("teacher classes", lambda db: crud.get_teacher_classes(db, pick(seeded.teacher_ids))),
+        ("student classes", lambda db: crud.get_student_classes(db, pick(seeded.student_ids))),
+        ("enrollment check", lambda db: crud.get_enrollment(db, pick(seeded.class_ids), pick(seeded.student_ids))),
+        ("whiteboard tail", lambda db: crud.get_whiteboard_tail(db, pick(seeded.session_ids))),
+    ]
+
+
+async def explain(engine, statements):
+    """Plan lines for the statements one read path executed"""
+    dialect = engine.dialect.name
+    lines = []
+    async with engine.connect() as conn:
+        for statement, params in statements:
+            if dialect == "sqlite":
+                result = await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params)
+                lines.extend(row[-1] for row in result)
+            elif dialect == "postgresql":
+                result = await conn.exec_driver_sql("EXPLAIN " + statement, params)
+                lines.extend(row[0].strip() for row in result if "->" in row[0] or "Scan" in row[0])
+    return lines
+
+
+async def run_suite(label, engine, SessionLocal, crud, seeded, repeat, seed):
+    from sqlalchemy import event
+    captured = []
+
+    def capture(conn, cursor, statement, params, context, executemany):
+        captured.append((statement, params))
+
+    print(f"\n== {label}")
+    results = {}
+    for name, call in read_paths(crud, seeded, random.Random(seed)):
+        event.listen(engine.sync_engine, "before_cursor_execute", capture)
+        captured.clear()
+        async with SessionLocal() as db:
+            await call(db)
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+        plan = await explain(engine, list(captured))
+
+        timings = []
+        for _ in range(repeat):
+            async with SessionLocal() as db:
+                start = time.perf_counter()
+                await call(db)
+                timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p50 = statistics.median(timings)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        results[name] = (p50, p99)
+        print(f"{name:<24} p50 {p50:7.2f} ms  p99 {p99:7.2f} ms")
+        for line in plan:
+            print(f"{'':<26}{line}")
+    return results
+
+
+async def main():
+    args = parse_args()
+    os.environ["DATABASE_URL"] = args.url
+    os.environ.setdefault("SECRET_KEY", "benchmark-only")
+    from sqlalchemy.schema import CreateIndex, DropIndex
+    from app import crud
+    from app.database import Base, SessionLocal, engine
+    from benchmarks.seed import seed_sync
+
+    if args.url.startswith("sqlite:///"):
+        path = Path(args.url[len("sqlite:///"):])
+        if path.exists():
+            path.unlink()
+    scale = Scale.from_args(args)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        start = time.perf_counter()
+        seeded = await conn.run_sync(seed_sync, scale)
+    print(f"seeded in {time.perf_counter() - start:.1f}s: "
+          + ", ".join(f"{count} {name}" for name, count in seeded.rows.items()))
+
+    indexes = hot_indexes(Base.metadata)
+    async with engine.begin() as conn:
+        for index in indexes:
+            await conn.execute(DropIndex(index))
+        await conn.exec_driver_sql("ANALYZE")
+    before = await run_suite("without hot-path indexes", engine, SessionLocal, crud, seeded, args.repeat, 1)
+
+    async with engine.begin() as conn:
+        for index in indexes:
+            await conn.execute(CreateIndex(index))
+        await conn.exec_driver_sql("ANALYZE")
+    after = await run_suite("with hot-path indexes", engine, SessionLocal, crud, seeded, args.repeat, 1)
+    await engine.dispose()
+
+    print(f"\n{'read path':<24}{'p50 before':>12}{'p50 after':>12}{'speedup':>9}")
+    for name, (p50, _) in before.items():
+        print(f"{name:<24}{p50:>10.2f}ms{after[name][0]:>10.2f}ms{p50 / after[name][0]:>8.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,162 @@
+"""Synthetic CodeCrew data at a configurable scale, for benchmarks.
+
+Rows are generated deterministically from a seed and bulk-inserted with
+Core executemany, so a few hundred thousand rows load in seconds. The quiz
+analytics aggregates are filled to match the responses. Every account's
+password is "password".
+"""
+import random
+from collections import Counter
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+# bcrypt hash of "password" at cost 4; hashing per row would dominate seeding
+PASSWORD_HASH = "$2b$04$CIN9BOG4jkZ9ZmRFqkBz4.Xws0yX1TgI3d.yVpUl7PE4jD3wEvTIe"
+
+
+@dataclass
+class Scale:
+    teachers: int = 20
+    students: int = 2000
+    classes_per_teacher: int = 5
+    students_per_class: int = 40
+    sessions_per_class: int = 10
+    messages_per_session: int = 100
+    quizzes_per_session: int = 4
+    responses_per_quiz: int = 25
+
+    @classmethod
+    def add_arguments(cls, parser):
+        for field in fields(cls):
+            parser.add_argument(f"--{field.name.replace('_', '-')}", type=int, default=field.default)
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(**{field.name: getattr(args, field.name) for field in fields(cls)})
+
+
+@dataclass
+class Seeded:
+    teacher_ids: List[int]
+    student_ids: List[int]
+    class_ids: List[int]
+    session_ids: List[int]
+    quiz_ids: List[int]
+    rows: Dict[str, int]
+    # Who belongs where, for picking requests a user is allowed to make
+    class_teachers: Dict[int, int]
+    class_students: Dict[int, List[int]]
+    session_classes: Dict[int, int]
+    session_quizzes: Dict[int, List[int]]
+
+
+def _insert(conn, model, rows: List[dict], chunk: int = 5000):
+    for start in range(0, len(rows), chunk):
+        conn.execute(model.__table__.insert(), rows[start:start + chunk])
+
+
+def seed_sync(conn, scale: Scale, seed: int = 42) -> Seeded:
+    """Fill an empty schema; run with AsyncConnection.run_sync or a sync connection"""
+    # Imported here so callers can point DATABASE_URL somewhere first
+    from app import models
+
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 8, 9, 0)
+
+    users, teacher_ids, student_ids = [], [], []
+    for n in range(scale.teachers):
+        teacher_ids.append(len(users) + 1)
+        users.append({"id": len(users) + 1, "name": f"Teacher {n}", "email": f"teacher{n}@example.com",
+                      "hashed_password": PASSWORD_HASH, "role": "teacher"})
+    for n in range(scale.students):
+        student_ids.append(len(users) + 1)
+        users.append({"id": len(users) + 1, "name": f"Student {n}", "email": f"student{n}@example.com",
+                      "hashed_password": PASSWORD_HASH, "role": "student"})
+
+    classes, enrollments, sessions = [], [], []
+    for teacher_id in teacher_ids:
+        for _ in range(scale.classes_per_teacher):
+            class_id = len(classes) + 1
+            classes.append({"id": class_id, "name": f"Class {class_id}", "description": None,
+                            "teacher_id": teacher_id, "created_at": start})
+            for student_id in rng.sample(student_ids, min(scale.students_per_class, len(student_ids))):
+                enrollments.append({"class_id": class_id, "student_id": student_id, "enrolled_at": start})
+            for s in range(scale.sessions_per_class):
+                sessions.append({"id": len(sessions) + 1, "title": f"Lesson {s + 1}", "teacher_id": teacher_id,
+                                 "class_id": class_id, "session_type": "live",
+                                 "start_time": start + timedelta(days=s), "end_time": None})
+
+    class_students: Dict[int, List[int]] = {}
+    for row in enrollments:
+        class_students.setdefault(row["class_id"], []).append(row["student_id"])
+
+    messages, quizzes, responses = [], [], []
+    for session in sessions:
+        speakers = class_students.get(session["class_id"]) or [session["teacher_id"]]
+        for m in range(scale.messages_per_session):
+            messages.append({"session_id": session["id"], "sender_id": rng.choice(speakers),
+                             "message_text": f"message {m} in session {session['id']}",
+                             "timestamp": session["start_time"] + timedelta(seconds=m * 7)})
+        for q in range(scale.quizzes_per_session):
+            quiz_id = len(quizzes) + 1
+            quizzes.append({"id": quiz_id, "session_id": session["id"], "question_text": f"Question {q + 1}?",
+                            "options": ["A", "B", "C", "D"], "correct_answer": "A", "explanation": None,
+                            "created_by": session["teacher_id"]})
+            for student_id in rng.sample(speakers, min(scale.responses_per_quiz, len(speakers))):
+                answer = rng.choice("ABCD")
+                responses.append({"quiz_id": quiz_id, "student_id": student_id, "selected_answer": answer,
+                                  "is_correct": answer == "A", "timestamp": session["start_time"]})
+
+    for model, rows in ((models.User, users), (models.Class, classes), (models.ClassEnrollment, enrollments),
+                        (models.Session, sessions), (models.Message, messages), (models.Quiz, quizzes),
+                        (models.QuizResponse, responses)):
+        _insert(conn, model, rows)
+    _insert_aggregates(conn, models, quizzes, responses)
+    session_quizzes: Dict[int, List[int]] = {}
+    for quiz in quizzes:
+        session_quizzes.setdefault(quiz["session_id"], []).append(quiz["id"])
+    if conn.dialect.name == "postgresql":
+        # Rows carry explicit ids; move the sequences past them for later inserts
+        for table in ("users", "classes", "sessions", "quizzes"):
+            conn.exec_driver_sql(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT COALESCE(MAX(id), 1) FROM {table}))"
+            )
+
+    return Seeded(
+        teacher_ids=teacher_ids,
+        student_ids=student_ids,
+        class_ids=[row["id"] for row in classes],
+        session_ids=[row["id"] for row in sessions],
+        quiz_ids=[row["id"] for row in quizzes],
+        rows={"users": len(users), "classes": len(classes), "enrollments": len(enrollments),
+              "sessions": len(sessions), "messages": len(messages), "quizzes": len(quizzes),
+              "responses": len(responses)},
+        class_teachers={row["id"]: row["teacher_id"] for row in classes},
+        class_students=class_students,
+        session_classes={row["id"]: row["class_id"] for row in sessions},
+        session_quizzes=session_quizzes,
+    )
+
+
+def _insert_aggregates(conn, models, quizzes: List[dict], responses: List[dict]):
+    """quiz_stats, quiz_answer_stats and student_session_stats for the seeded responses"""
+    sessions = {quiz["id"]: quiz["session_id"] for quiz in quizzes}
+    quiz_rows: Dict[int, dict] = {}
+    answers, students, student_correct = Counter(), Counter(), Counter()
+    for row in responses:
+        session_id = sessions[row["quiz_id"]]
+        stats = quiz_rows.setdefault(row["quiz_id"], {"quiz_id": row["quiz_id"], "session_id": session_id,
+                                                      "responses": 0, "correct": 0})
+        stats["responses"] += 1
+        stats["correct"] += row["is_correct"]
+        answers[(row["quiz_id"], row["selected_answer"])] += 1
+        students[(session_id, row["student_id"])] += 1
+        student_correct[(session_id, row["student_id"])] += row["is_correct"]
+
+    _insert(conn, models.QuizStats, list(quiz_rows.values()))
+    _insert(conn, models.QuizAnswerStats, [{"quiz_id": quiz_id, "selected_answer": answer, "responses": n}
+                                           for (quiz_id, answer), n in answers.items()])
+    _insert(conn, models.StudentSessionStats, [{"session_id": session_id, "student_id": student_id, "responses": n,
+                                                "correct": student_correct[(session_id, student_id)]}
+                                               for (session_id, student_id), n in students.items()])
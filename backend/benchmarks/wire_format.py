@@ -0,0 +1,93 @@
+"""Compare WebSocket wire formats on representative session traffic.
+
+Run from the backend directory:
+
+    python -m benchmarks.wire_format [--iterations 20000]
+
+Reports bytes on the wire and encode/decode time per frame for every codec
+available in app.codec (JSON always; msgpack/cbor when installed).
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.codec import CODECS  # noqa: E402
+
+
+def sample_messages():
+    rng = random.Random(42)
+    points = []
+    x, y = 400.0, 300.0
+    for _ in range(60):
+        x += rng.uniform(-4, 4)
+        y += rng.uniform(-4, 4)
+        points.extend([round(x, 1), round(y, 1)])
+    return {
+        'whiteboard_batch': {
+            'type': 'whiteboard_batch',
+            'userId': 17,
+            'strokes': [{'color': '#1f2937', 'width': 2, 'points': points}],
+        },
+        'whiteboard_draw': {
+            'type': 'whiteboard_draw',
+            'x0': 412.5, 'y0': 288.0, 'x1': 415.0, 'y1': 290.5,
+            'color': '#000000', 'width': 2,
+        },
+        'ice_candidate': {
+            'type': 'ice_candidate',
+            'targetUserId': 3,
+            'fromUserId': 17,
+            'candidate': {
+                'candidate': 'candidate:842163049 1 udp 1677729535 203.0.113.7 50123 typ srflx '
+                             'raddr 192.168.1.20 rport 50123 generation 0 ufrag 4ZcD network-cost 999',
+                'sdpMid': '0',
+                'sdpMLineIndex': 0,
+            },
+        },
+        'chat_message': {
+            'type': 'chat_message',
+            'userId': 17,
+            'userName': 'Student Seventeen',
+            'message': 'Could you go over the last example again?',
+            'timestamp': '2024-03-04T10:15:00.000Z',
+        },
+    }
+
+
+def measure(codec, message, iterations):
+    encoded = codec.encode(message)
+    size = len(encoded.encode() if isinstance(encoded, str) else encoded)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        codec.encode(message)
+    encode_us = (time.perf_counter() - start) / iterations * 1e6
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        codec.decode(encoded)
+    decode_us = (time.perf_counter() - start) / iterations * 1e6
+    return size, encode_us, decode_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"codecs: {', '.join(CODECS)}  iterations: {args.iterations}")
+    print(f"{'message':<18}{'codec':<10}{'bytes':>8}{'vs json':>9}{'encode us':>11}{'decode us':>11}")
+    for name, message in sample_messages().items():
+        baseline = None
+        for codec in CODECS.values():
+            size, encode_us, decode_us = measure(codec, message, args.iterations)
+            baseline = baseline or size
+            print(f"{name:<18}{codec.name:<10}{size:>8}{size / baseline:>8.0%}{encode_us:>11.2f}{decode_us:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+"""Fan-out latency, drops and per-connection cost of the WebSocket hub under load.
+
+Run from the backend directory:
+
+    python -m benchmarks.ws_load [--sessions 1] [--participants 100] [--duration 10]
+                                 [--chat-rate 0.2] [--draw-rate 1] [--burst 20]
+                                 [--signal-rate 0.5] [--slow 0] [--format msgpack]
+                                 [--json run.json]
+
+Connects `--participants` simulated users (a teacher and students) to each of
+`--sessions` sessions through the app's own ASGI interface in this process,
+so the figures describe what one worker's ConnectionManager can carry. Each
+participant then sends, at random (Poisson) intervals, chat messages, bursts
+of `--burst` contiguous whiteboard_draw segments, and WebRTC offers and ICE
+candidates to a random peer. `--slow N` participants per session take
+`--slow-delay` ms to accept each frame, like clients on a poor link.
+
+Reports, per message kind, the latency from a frame being sent to each
+copy being received (p50/p90/p99/max), copies never received, frames the
+server dropped or clients it evicted, CPU seconds per second and per
+delivered frame, and resident memory added per connection. The simulated
+clients share the process, so CPU and memory are upper bounds for the
+server alone. Whiteboard latency includes the WHITEBOARD_COALESCE_MS window.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+DEFAULT_URL = "sqlite:////tmp/codecrew-ws-load.db"
+KINDS = ("chat", "whiteboard", "signaling")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--sessions", type=int, default=1)
+    parser.add_argument("--participants", type=int, default=100, help="per session, teacher included")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of traffic")
+    parser.add_argument("--chat-rate", type=float, default=0.2, help="chat messages per participant per second")
+    parser.add_argument("--draw-rate", type=float, default=1, help="whiteboard bursts per participant per second")
+    parser.add_argument("--burst", type=int, default=20, help="whiteboard_draw segments per burst")
+    parser.add_argument("--signal-rate", type=float, default=0.5, help="offers/ICE candidates per participant per second")
+    parser.add_argument("--slow", type=int, default=0, help="slow participants per session")
+    parser.add_argument("--slow-delay", type=float, default=50, help="ms a slow participant takes per frame")
+    parser.add_argument("--format", default="json", help="wire format the participants negotiate")
+    parser.add_argument("--drain", type=float, default=2, help="seconds to wait for in-flight frames")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path")
+    return parser.parse_args()
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process (Linux), or None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Recorder:
+    """Send times of tagged frames, and the latency of every copy received"""
+
+    def __init__(self):
+        self.sent: Dict[tuple, float] = {}
+        self.expected = defaultdict(int)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+
+    def send(self, kind: str, key: tuple, copies: int):
+        self.sent[key] = time.perf_counter()
+        self.expected[kind] += copies
+
+    def receive(self, kind: str, key: tuple, now: float):
+        sent = self.sent.get(key)
+        if sent is not None:
+            self.latencies[kind].append((now - sent) * 1000)
+
+
+class Participant:
+    """One simulated client, speaking ASGI to the app directly"""
+
+    def __init__(self, app, session_id: int, user_id: int, token: str, codec, recorder: Recorder,
+                 fmt: str, delay: float = 0):
+        self.app = app
+        self.session_id = session_id
+        self.user_id = user_id
+        self.codec = codec
+        self.recorder = recorder
+        self.delay = delay
+        query = {"token": token} if fmt == "json" else {"token": token, "format": fmt}
+        self.scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "http_version": "1.1",
+            "path": f"/ws/session/{session_id}", "raw_path": f"/ws/session/{session_id}".encode(),
+            "query_string": urlencode(query).encode(), "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 0), "server": ("bench", 80), "subprotocols": [],
+        }
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.closed_by_server = False
+        self.received = 0
+        self.task: Optional[asyncio.Task] = None
+        self.x = 0  # next whiteboard x coordinate; unique per participant stroke point
+
+    async def connect(self):
+        self.inbox.put_nowait({"type": "websocket.connect"})
+        self.task = asyncio.create_task(self.app(self.scope, self.inbox.get, self._send))
+        await self.accepted.wait()
+        if self.closed_by_server:
+            raise RuntimeError(f"user {self.user_id} was refused by session {self.session_id}")
+
+    def disconnect(self):
+        self.inbox.put_nowait({"type": "websocket.disconnect", "code": 1000})
+
+    def send(self, message: dict):
+        self.inbox.put_nowait({"type": "websocket.receive", "text": json.dumps(message)})
+
+    async def _send(self, event: dict):
+        if event["type"] == "websocket.accept":
+            self.accepted.set()
+        elif event["type"] == "websocket.close":
+            self.closed_by_server = True
+            self.accepted.set()
+        elif event["type"] == "websocket.send":
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            now = time.perf_counter()
+            self.received += 1
+            data = event.get("text") if event.get("text") is not None else event.get("bytes")
+            self._observe(self.codec.decode(data), now)
+
+    def _observe(self, message: dict, now: float):
+        kind = message.get("type")
+        if kind == "chat_message":
+            self.recorder.receive("chat", ("chat", message.get("message")), now)
+        elif kind in ("offer", "ice_candidate"):
+            self.recorder.receive("signaling", ("signal", message.get("sdp") or message.get("candidate")), now)
+        elif kind == "whiteboard_batch":
+            for stroke in message.get("strokes", ()):
+                # Every segment ends at a distinct x of its sender's stroke
+                for x in stroke["points"][2::2]:
+                    self.recorder.receive("whiteboard", ("draw", message.get("userId"), x), now)
+
+
+async def act(participant: Participant, peers: List[Participant], args, rng: random.Random, stop: float):
+    """Send a Poisson mix of chat, whiteboard bursts and signaling until `stop`"""
+    recorder = participant.recorder
+    rates = [args.chat_rate, args.draw_rate, args.signal_rate]
+    total = sum(rates)
+    if total <= 0:
+        return
+    others = [peer for peer in peers if peer is not participant]
+    seq = 0
+    while True:
+        await asyncio.sleep(rng.expovariate(total))
+        if time.perf_counter() >= stop or participant.closed_by_server:
+            return
+        seq += 1
+        kind = rng.choices(KINDS, rates)[0]
+        if kind == "chat":
+            text = f"{participant.user_id}:{seq}"
+            recorder.send("chat", ("chat", text), len(peers))
+            participant.send({"type": "chat_message", "message": text})
+        elif kind == "whiteboard":
+            y = participant.user_id
+            for _ in range(args.burst):
+                x = participant.x
+                participant.x += 1
+                recorder.send("whiteboard", ("draw", participant.user_id, x + 1), len(others))
+                participant.send({"type": "whiteboard_draw", "x0": x, "y0": y, "x1": x + 1, "y1": y})
+            participant.x += 1  # a gap, so the next burst is a new stroke
+        elif others:
+            target = rng.choice(others)
+            tag = f"{participant.user_id}:{seq}"
+            recorder.send("signaling", ("signal", tag), 1)
+            if rng.random() < 0.5:
+                participant.send({"type": "offer", "targetUserId": target.user_id, "sdp": tag})
+            else:
+                participant.send({"type": "ice_candidate", "targetUserId": target.user_id, "candidate": tag})
+
+
+async def lifespan(app, phase: str, state: dict):
+    """Run the app's startup or shutdown handlers through the ASGI lifespan protocol"""
+    if phase == "startup":
+        state["inbox"] = asyncio.Queue()
+        state["done"] = asyncio.Queue()
+
+        async def send(event):
+            await state["done"].put(event["type"])
+
+        state["task"] = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}},
+                                                state["inbox"].get, send))
+    await state["inbox"].put({"type": f"lifespan.{phase}"})
+    event = await state["done"].get()
+    if event.endswith("failed"):
+        raise RuntimeError(f"Application {phase} failed")
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None}
+    values = sorted(values)
+
+    def at(q):
+        return round(values[min(len(values) - 1, int(len(values) * q))], 2)
+
+    return {"p50_ms": round(statistics.median(values), 2), "p90_ms": at(0.90), "p99_ms": at(0.99),
+            "max_ms": round(values[-1], 2)}
+
+
+async def main():
+    args = parse_args()
+    os.environ["DATABASE_URL"] = args.url
+    os.environ.setdefault("SECRET_KEY", "benchmark-only-secret-key-not-for-production")
+    # Keep the app's log lines off the report
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if args.url.startswith("sqlite:///"):
+        for suffix in ("", "-wal", "-shm"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(args.url[len("sqlite:///"):] + suffix)
+
+    from app import models
+    from app.auth import create_access_token
+    from app.codec import CODECS
+    from app.database import Base, SessionLocal, engine
+    from app.main import app
+    from app.websocket import manager
+
+    if args.format not in CODECS:
+        sys.exit(f"Unknown format {args.format!r}; available: {', '.join(CODECS)}")
+    codec = CODECS[args.format]
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    rosters = []
+    async with SessionLocal() as db:
+        for s in range(args.sessions):
+            users = [models.User(name=f"Teacher {s}", email=f"teacher{s}@example.com", hashed_password="-", role="teacher")]
+            users += [models.User(name=f"Student {s}.{n}", email=f"student{s}.{n}@example.com", hashed_password="-",
+                                  role="student") for n in range(args.participants - 1)]
+            db.add_all(users)
+            await db.flush()
+            # Standalone session: every student may join without an enrollment
+            session = models.Session(title=f"Load {s}", teacher_id=users[0].id)
+            db.add(session)
+            await db.flush()
+            rosters.append((session.id, [(user.id, user.email) for user in users]))
+        await db.commit()
+
+    state = {}
+    await lifespan(app, "startup", state)
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    sessions: List[List[Participant]] = []
+
+    gc.collect()
+    rss_before = rss_bytes()
+    connect_start = time.perf_counter()
+    for session_id, users in rosters:
+        slow = set(rng.sample([user_id for user_id, _ in users[1:]], min(args.slow, len(users) - 1)))
+        participants = [
+            Participant(app, session_id, user_id, create_access_token({"sub": email}), codec, recorder,
+                        args.format, args.slow_delay / 1000 if user_id in slow else 0)
+            for user_id, email in users
+        ]
+        for participant in participants:
+            await participant.connect()
+        sessions.append(participants)
+    connect_seconds = time.perf_counter() - connect_start
+    # Let the join announcements drain before measuring
+    await asyncio.sleep(1)
+    gc.collect()
+    rss_after = rss_bytes()
+    connections = sum(len(participants) for participants in sessions)
+    received_before = sum(p.received for participants in sessions for p in participants)
+    # Joins replace queued participants_list frames, which count as drops
+    dropped_before = manager.stats()["dropped_frames"]
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    stop = wall_start + args.duration
+    await asyncio.gather(*(
+        act(participant, participants, args, random.Random(rng.random()), stop)
+        for participants in sessions for participant in participants
+    ))
+    traffic_seconds = time.perf_counter() - wall_start
+    await asyncio.sleep(args.drain)
+    cpu_seconds = time.process_time() - cpu_start
+    server = manager.stats()
+
+    for participants in sessions:
+        for participant in participants:
+            participant.disconnect()
+    await asyncio.gather(*(p.task for participants in sessions for p in participants), return_exceptions=True)
+    await lifespan(app, "shutdown", state)
+
+    delivered_frames = sum(p.received for participants in sessions for p in participants) - received_before
+    evicted = sum(p.closed_by_server for participants in sessions for p in participants)
+    results = {
+        "connections": connections,
+        "connect_seconds": round(connect_seconds, 2),
+        "memory_per_connection_kb": round((rss_after - rss_before) / connections / 1024, 1)
+        if rss_before is not None and rss_after is not None else None,
+        "cpu_seconds_per_second": round(cpu_seconds / (traffic_seconds + args.drain), 3),
+        "cpu_us_per_frame": round(cpu_seconds / delivered_frames * 1e6, 1) if delivered_frames else None,
+        "frames_delivered": delivered_frames,
+        "frames_per_second": round(delivered_frames / traffic_seconds),
+        "server_dropped_frames": server["dropped_frames"] - dropped_before,
+        "server_high_water_mark": server["high_water_mark"],
+        "evicted": evicted,
+        "kinds": {},
+    }
+    print(f"{connections} connections ({args.sessions} x {args.participants}, {args.slow} slow per session, "
+          f"{args.format}) in {connect_seconds:.1f}s; {args.duration:g}s of traffic")
+    print(f"\n{'kind':<12}{'expected':>9}{'received':>10}{'missing':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for kind in KINDS:
+        latencies = recorder.latencies[kind]
+        row = {"expected": recorder.expected[kind], "received": len(latencies),
+               "missing": max(0, recorder.expected[kind] - len(latencies)), **percentiles(latencies)}
+        results["kinds"][kind] = row
+        cells = "".join(f"{'-' if row[k] is None else row[k]:>9}" for k in ("p50_ms", "p90_ms", "p99_ms", "max_ms"))
+        print(f"{kind:<12}{row['expected']:>9}{row['received']:>10}{row['missing']:>9}{cells}")
+
+    print(f"\nframes delivered   {delivered_frames} ({results['frames_per_second']}/s)")
+    print(f"server dropped     {results['server_dropped_frames']} frames, evicted {evicted} clients, "
+          f"deepest queue {server['high_water_mark']}")
+    print(f"cpu                {results['cpu_seconds_per_second']} s/s, {results['cpu_us_per_frame']} us per frame "
+          "(clients included)")
+    if results["memory_per_connection_kb"] is not None:
+        print(f"memory             {results['memory_per_connection_kb']} KiB RSS per connection (clients included)")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nSaved to {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -7,7 +7,10 @@ while ! pg_isready -h db -p 5432 -U postgres -d codecrew; do
   sleep 2
 done
 
-echo "Database is ready! Starting application..."
+echo "Database is ready! Applying migrations..."
+alembic upgrade head || exit 1
+
+echo "Starting application..."
 
 # Start the application
 exec uvicorn app.main:app --host 0.0.0.0 --port 8000 
\ No newline at end of file
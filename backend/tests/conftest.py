@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# app.database reads its configuration at import time
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/codecrew-test.db")
+os.environ.setdefault("SECRET_KEY", "test-only-secret-key-not-for-production")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,51 @@
+import asyncio
+
+from sqlalchemy import event
+
+from app import crud, models
+from app.access import Access, access_cache
+from app.database import Base, SessionLocal, engine
+
+
+async def _decision_cached_before_commit(change):
+    """Cache an "allowed" decision between the change's flush and its commit,
+    as a concurrent check still reading the committed rows would"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    access_cache.clear()
+    async with SessionLocal() as db:
+        teacher = models.User(name="T", email="t@example.com", hashed_password="x", role="teacher")
+        student = models.User(name="S", email="s@example.com", hashed_password="x", role="student")
+        db.add_all([teacher, student])
+        await db.flush()
+        class_obj = models.Class(name="Algebra", teacher_id=teacher.id)
+        db.add(class_obj)
+        await db.flush()
+        session = models.Session(title="Week 1", teacher_id=teacher.id, class_id=class_obj.id)
+        db.add_all([session, models.ClassEnrollment(class_id=class_obj.id, student_id=student.id)])
+        await db.commit()
+        ids = {"teacher": teacher.id, "student": student.id, "class": class_obj.id, "session": session.id}
+
+        key = ('session', ids["session"], ids["student"])
+
+        def concurrent_check(flushed, flush_context):
+            access_cache.set(key, Access(True, 'student', None, ids["teacher"], ids["class"]), access_cache.now())
+
+        event.listen(db.sync_session, "after_flush", concurrent_check)
+        await change(db, ids)
+        event.remove(db.sync_session, "after_flush", concurrent_check)
+    await engine.dispose()
+    return access_cache.get(key, ids["student"], ids["session"])
+
+
+def test_removing_a_student_drops_decisions_made_before_commit():
+    cached = asyncio.run(_decision_cached_before_commit(
+        lambda db, ids: crud.remove_student_from_class(db, ids["class"], ids["student"])))
+    assert cached is None
+
+
+def test_deleting_a_session_drops_decisions_made_before_commit():
+    cached = asyncio.run(_decision_cached_before_commit(
+        lambda db, ids: crud.delete_session(db, ids["session"], ids["teacher"])))
+    assert cached is None
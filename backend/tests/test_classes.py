@@ -0,0 +1,71 @@
+import asyncio
+
+from sqlalchemy import event
+
+from app import crud, models
+from app.database import Base, SessionLocal, engine
+
+
+async def _seed(classes: int, sessions_per_class: int = 2):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as db:
+        teacher = models.User(name="Teacher", email="teacher@example.com", hashed_password="-", role="teacher")
+        other = models.User(name="Other", email="other@example.com", hashed_password="-", role="teacher")
+        student = models.User(name="Student", email="student@example.com", hashed_password="-", role="student")
+        db.add_all([teacher, other, student])
+        await db.flush()
+        for n in range(classes):
+            class_obj = models.Class(name=f"Class {n}", teacher_id=teacher.id)
+            db.add(class_obj)
+            await db.flush()
+            db.add(models.ClassEnrollment(class_id=class_obj.id, student_id=student.id))
+            db.add_all([
+                models.Session(title=f"Session {n}.{s}", teacher_id=teacher.id, class_id=class_obj.id)
+                for s in range(sessions_per_class)
+            ])
+        # Another teacher's class, whose enrollment must not be counted
+        foreign = models.Class(name="Elsewhere", teacher_id=other.id)
+        db.add(foreign)
+        await db.flush()
+        db.add(models.ClassEnrollment(class_id=foreign.id, student_id=student.id))
+        await db.commit()
+        return teacher.id, student.id
+
+
+async def _measure(sizes):
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    seen = {}
+    try:
+        for size in sizes:
+            teacher_id, student_id = await _seed(size)
+            async with SessionLocal() as db:
+                statements.clear()
+                taught = await crud.get_teacher_classes(db, teacher_id)
+                teacher_queries = len(statements)
+                statements.clear()
+                enrolled = await crud.get_student_classes(db, student_id)
+                seen[size] = {
+                    "teacher_queries": teacher_queries,
+                    "student_queries": len(statements),
+                    "classes": (len(taught), len(enrolled)),
+                    "student_counts": {c.student_count for c in taught},
+                    "sessions": {len(c.sessions) for c in taught},
+                }
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+        await engine.dispose()
+    return seen
+
+
+def test_class_listings_query_count_stays_flat():
+    seen = asyncio.run(_measure([1, 10, 30]))
+    assert len({s["teacher_queries"] for s in seen.values()}) == 1
+    assert len({s["student_queries"] for s in seen.values()}) == 1
+    for size, s in seen.items():
+        assert s["classes"] == (size, size + 1)
+        assert s["student_counts"] == {1}
+        assert s["sessions"] == {2}
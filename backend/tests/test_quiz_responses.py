@@ -0,0 +1,48 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from app import crud, models, schemas
+from app.database import Base, SessionLocal, engine
+
+
+async def _answer_twice():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as db:
+        teacher = models.User(name="T", email="t@example.com", hashed_password="x", role="teacher")
+        students = [models.User(name=f"S{i}", email=f"s{i}@example.com", hashed_password="x", role="student")
+                    for i in range(2)]
+        db.add_all([teacher, *students])
+        await db.flush()
+        session = models.Session(title="Algebra", teacher_id=teacher.id)
+        db.add(session)
+        await db.flush()
+        quiz = models.Quiz(session_id=session.id, question_text="1 + 1?", options=["1", "2"],
+                           correct_answer="2", created_by=teacher.id)
+        db.add(quiz)
+        await db.commit()
+        quiz_id, first, second = quiz.id, students[0].id, students[1].id
+
+        stored = await crud.record_response(db, quiz_id, first, schemas.QuizResponseCreate(selected_answer="2"))
+        stored = stored and stored.selected_answer
+        again = await crud.record_response(db, quiz_id, first, schemas.QuizResponseCreate(selected_answer="1"))
+        # A live batch repeating the first student's answer and answering twice for the second
+        await crud.append_responses(db, [
+            {"quiz_id": quiz_id, "student_id": student_id, "selected_answer": answer, "is_correct": answer == "2"}
+            for student_id, answer in ((first, "1"), (second, "2"), (second, "1"))
+        ])
+
+        rows = (await db.execute(select(func.count()).select_from(models.QuizResponse))).scalar_one()
+        totals = (await db.execute(select(models.QuizStats.responses, models.QuizStats.correct))).one()
+    await engine.dispose()
+    return stored, again, rows, tuple(totals)
+
+
+def test_each_student_answers_a_quiz_once():
+    stored, again, rows, totals = asyncio.run(_answer_twice())
+    assert stored == "2"
+    assert again is None
+    assert rows == 2
+    assert totals == (2, 2)
@@ -0,0 +1,38 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.database import Base, engine
+from app.main import app
+
+
+async def _reset_schema():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+
+def _login(client, email, role):
+    signup = client.post("/signup", json={"name": email, "email": email, "password": "pw", "role": role})
+    assert signup.status_code == 200, signup.text
+    token = client.post("/token", data={"username": email, "password": "pw"}).json()["access_token"]
+    return signup.json()["id"], {"Authorization": f"Bearer {token}"}
+
+
+def test_session_history_needs_session_access():
+    asyncio.run(_reset_schema())
+    with TestClient(app) as client:
+        _, teacher = _login(client, "teacher@example.com", "teacher")
+        student_id, student = _login(client, "student@example.com", "student")
+        _, outsider = _login(client, "outsider@example.com", "student")
+        class_id = client.post("/classes", json={"name": "Algebra"}, headers=teacher).json()["id"]
+        assert client.post(f"/classes/{class_id}/enroll/{student_id}", headers=teacher).status_code == 200
+        session_id = client.post("/sessions", json={"title": "Week 1", "class_id": class_id}, headers=teacher).json()["id"]
+
+        for path in ("messages", "messages/export", "quizzes"):
+            url = f"/sessions/{session_id}/{path}"
+            assert client.get(url, headers=teacher).status_code == 200
+            assert client.get(url, headers=student).status_code == 200
+            assert client.get(url, headers=outsider).status_code == 403
+            assert client.get(f"/sessions/{session_id + 1}/{path}", headers=teacher).status_code == 404
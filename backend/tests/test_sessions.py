@@ -0,0 +1,46 @@
+import asyncio
+
+from sqlalchemy import event, func, select
+
+from app import crud, models, schemas
+from app.database import Base, SessionLocal, engine
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _enforce_foreign_keys(dbapi_connection, connection_record):
+    # As Postgres does; SQLite ignores foreign keys unless asked
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+async def _delete_answered_session():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as db:
+        teacher = models.User(name="T", email="t@example.com", hashed_password="x", role="teacher")
+        student = models.User(name="S", email="s@example.com", hashed_password="x", role="student")
+        db.add_all([teacher, student])
+        await db.flush()
+        session = models.Session(title="Algebra", teacher_id=teacher.id)
+        db.add(session)
+        await db.flush()
+        quiz = models.Quiz(session_id=session.id, question_text="1 + 1?", options=["1", "2"],
+                           correct_answer="2", created_by=teacher.id)
+        db.add(quiz)
+        await db.commit()
+        await crud.record_response(db, quiz.id, student.id, schemas.QuizResponseCreate(selected_answer="2"))
+
+        deleted = await crud.delete_session(db, session.id, teacher.id)
+
+        left = [(await db.execute(select(func.count()).select_from(model))).scalar_one()
+                for model in (models.Session, models.QuizStats, models.StudentSessionStats)]
+    await engine.dispose()
+    return deleted, left
+
+
+def test_delete_session_with_responses_removes_its_analytics():
+    deleted, left = asyncio.run(_delete_answered_session())
+    assert deleted is True
+    assert left == [0, 0, 0]
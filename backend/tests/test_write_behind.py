@@ -0,0 +1,46 @@
+import asyncio
+
+from app.write_behind import WriteBehindBuffer
+
+
+def _slow_buffer(stored):
+    async def writer(rows):
+        await asyncio.sleep(0.2)
+        stored.extend(rows)
+
+    return WriteBehindBuffer(writer, flush_interval=0.01, max_batch=4, max_pending=100)
+
+
+def test_close_during_a_write_keeps_every_row():
+    async def run():
+        stored = []
+        buffer = _slow_buffer(stored)
+        buffer.start()
+        for i in range(10):
+            buffer.add(i)
+        await asyncio.sleep(0.05)  # the first batch is now being written
+        await buffer.close()
+        return stored, buffer.depth
+
+    stored, pending = asyncio.run(run())
+    assert stored == list(range(10))
+    assert pending == 0
+
+
+def test_cancelled_write_puts_its_rows_back():
+    async def run():
+        stored = []
+        buffer = _slow_buffer(stored)
+        for i in range(6):
+            buffer.add(i)
+        flush = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0.05)
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+        pending = buffer.depth
+        await buffer.close()
+        return stored, pending
+
+    stored, pending = asyncio.run(run())
+    assert pending == 6
+    assert stored == list(range(6))
@@ -13,4 +13,47 @@ api.interceptors.request.use(config => {
   return config;
 });
 
+// List endpoints are paginated: follow X-Next-Cursor until the last page
+export async function getAllPages(url, config = {}) {
+  const items = [];
+  let cursor;
+  do {
+    const params = { ...config.params, ...(cursor ? { cursor } : {}) };
+    const response = await api.get(url, { ...config, params });
+    items.push(...response.data);
+    cursor = response.headers['x-next-cursor'];
+  } while (cursor);
+  return { data: items };
+}
+
+// Starts a background question generation job and calls onQuestion for each
+// question as the server streams it; resolves with the job's final status
+export async function streamQuestionJob(body, onQuestion) {
+  const { data: job } = await api.post('/ai/jobs', body);
+  const token = localStorage.getItem('token');
+  const response = await fetch(`${api.defaults.baseURL}/ai/jobs/${job.job_id}/stream`, {
+    headers: token ? { Authorization: `Bearer ${token}` } : {},
+  });
+  if (!response.ok) throw new Error(`Generation stream failed (${response.status})`);
+
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = '';
+  let final = null;
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += value;
+    let end;
+    while ((end = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, end);
+      buffer = buffer.slice(end + 2);
+      const event = /^event: (.*)$/m.exec(block)?.[1];
+      const data = /^data: (.*)$/m.exec(block)?.[1];
+      if (event === 'question') onQuestion(JSON.parse(data).question);
+      else if (event === 'done') final = JSON.parse(data);
+    }
+  }
+  return final;
+}
+
 export default api;
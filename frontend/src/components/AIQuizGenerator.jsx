@@ -8,7 +8,7 @@ import {
   BookOpen, Calculator, Globe, History, Languages, 
   Plus, Edit, Trash2, Save 
 } from 'lucide-react';
-import API from '../api';
+import API, { streamQuestionJob } from '../api';
 
 const AIQuizGenerator = ({ sessionId, onQuestionsGenerated }) => {
   const [isGenerating, setIsGenerating] = useState(false);
@@ -52,23 +52,30 @@ const AIQuizGenerator = ({ sessionId, onQuestionsGenerated }) => {
     setError('');
     setSuccess('');
     
+    setGeneratedQuestions([]);
+    
     try {
-      const token = localStorage.getItem('token');
-      const response = await API.post('/ai/generate-questions', {
+      // Questions are shown one by one as the server parses them
+      let received = 0;
+      const job = await streamQuestionJob({
         subject,
         topic: topic || undefined,
         difficulty,
         grade_level: gradeLevel,
         count: questionCount
-      }, {
-        headers: { Authorization: `Bearer ${token}` }
+      }, question => {
+        received += 1;
+        setGeneratedQuestions(prev => [...prev, question]);
       });
       
-      setGeneratedQuestions(response.data.questions);
-      setSuccess(`Successfully generated ${response.data.questions.length} questions!`);
+      if (!job || job.status === 'failed') {
+        setError(job?.error || 'Failed to generate questions. Please try again.');
+      } else {
+        setSuccess(`Successfully generated ${received} questions!`);
+      }
     } catch (err) {
       console.error('Failed to generate questions:', err);
-      setError(err.response?.data?.detail || 'Failed to generate questions. Please try again.');
+      setError(err.response?.data?.detail || err.message || 'Failed to generate questions. Please try again.');
     } finally {
       setIsGenerating(false);
     }
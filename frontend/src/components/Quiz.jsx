@@ -3,7 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import { Button } from './ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from './ui/card';
 import { CheckCircle, XCircle, Loader2, FileText, Award, Plus } from 'lucide-react';
-import API from '../api';
+import API, { getAllPages } from '../api';
 
 export default function Quiz({ sessionId }) {
   const [quizzes, setQuizzes] = useState([]);
@@ -27,7 +27,7 @@ export default function Quiz({ sessionId }) {
   const fetchQuizzes = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await API.get(`/sessions/${sessionId}/quizzes`, {
+      const response = await getAllPages(`/sessions/${sessionId}/quizzes`, {
         headers: { Authorization: `Bearer ${token}` }
       });
       setQuizzes(response.data);
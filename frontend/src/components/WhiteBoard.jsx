@@ -35,7 +35,12 @@ export default function WhiteBoard({ sessionId }) {
     
     wsRef.current.onmessage = (e) => {
       const data = JSON.parse(e.data);
-      if (data.type === 'whiteboard_draw') {
+      if (data.type === 'whiteboard_state') {
+        // Board as it was when we joined: snapshot first, then the recent tail
+        [...data.snapshot, ...data.deltas].forEach(stroke => drawPolyline(ctx, stroke.points, stroke.color, stroke.width));
+      } else if (data.type === 'whiteboard_batch') {
+        data.strokes.forEach(stroke => drawPolyline(ctx, stroke.points, stroke.color, stroke.width));
+      } else if (data.type === 'whiteboard_draw') {
         drawLine(ctx, data.x0, data.y0, data.x1, data.y1, data.color, data.width);
       } else if (data.type === 'whiteboard_clear') {
         ctx.clearRect(0, 0, canvas.width, canvas.height);
@@ -54,6 +59,9 @@ export default function WhiteBoard({ sessionId }) {
 
     let drawing = false;
     let prev = {};
+    // Points drawn since the last frame sent, as a flat [x0, y0, x1, y1, ...] list
+    let pending = [];
+    let flushTimer = null;
     
     const getMousePos = (canvas, e) => {
       const rect = canvas.getBoundingClientRect();
@@ -74,6 +82,33 @@ export default function WhiteBoard({ sessionId }) {
       ctx.restore();
     };
 
+    const drawPolyline = (ctx, points, color, width) => {
+      ctx.save();
+      ctx.strokeStyle = color;
+      ctx.lineWidth = width;
+      ctx.beginPath();
+      ctx.moveTo(points[0], points[1]);
+      for (let i = 2; i < points.length; i += 2) {
+        ctx.lineTo(points[i], points[i + 1]);
+      }
+      ctx.stroke();
+      ctx.restore();
+    };
+
+    const flushPending = () => {
+      flushTimer = null;
+      if (pending.length >= 4 && wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+        wsRef.current.send(JSON.stringify({
+          type: 'whiteboard_batch',
+          points: pending,
+          color: ctx.strokeStyle,
+          width: ctx.lineWidth
+        }));
+      }
+      // The next batch continues from the last point sent
+      pending = pending.length ? pending.slice(-2) : [];
+    };
+
     const handleDown = (e) => {
       drawing = true;
       setIsDrawing(true);
@@ -87,23 +122,24 @@ export default function WhiteBoard({ sessionId }) {
       // Draw locally
       drawLine(ctx, prev.x, prev.y, pos.x, pos.y, ctx.strokeStyle, ctx.lineWidth);
       
-      // Send to server
-      if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
-        wsRef.current.send(JSON.stringify({
-          type: 'whiteboard_draw',
-          x0: prev.x,
-          y0: prev.y,
-          x1: pos.x,
-          y1: pos.y,
-          color: ctx.strokeStyle,
-          width: ctx.lineWidth
-        }));
+      // Batch points and send them at most once per frame
+      if (!pending.length) {
+        pending = [prev.x, prev.y];
+      }
+      pending.push(pos.x, pos.y);
+      if (!flushTimer) {
+        flushTimer = setTimeout(flushPending, 16);
       }
       
       prev = pos;
     };
 
     const handleUp = () => {
+      if (drawing) {
+        clearTimeout(flushTimer);
+        flushPending();
+        pending = [];
+      }
       drawing = false;
       setIsDrawing(false);
     };
@@ -114,6 +150,7 @@ export default function WhiteBoard({ sessionId }) {
     canvas.addEventListener('mouseleave', handleUp);
 
     return () => {
+      clearTimeout(flushTimer);
       if (wsRef.current) {
         wsRef.current.close();
       }
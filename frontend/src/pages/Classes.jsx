@@ -4,7 +4,7 @@ import { Input } from '../components/ui/input';
 import { Label } from '../components/ui/label';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '../components/ui/card';
 import { Plus, Users, BookOpen, Trash2, UserPlus, Video, FileText, PenTool, Play, Edit, MoreVertical } from 'lucide-react';
-import API from '../api';
+import API, { getAllPages } from '../api';
 
 export default function Classes() {
   const [classes, setClasses] = useState([]);
@@ -53,7 +53,7 @@ export default function Classes() {
   const fetchStudents = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await API.get('/students', {
+      const response = await getAllPages('/students', {
         headers: { Authorization: `Bearer ${token}` }
       });
       setStudents(response.data);
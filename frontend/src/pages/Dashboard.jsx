@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import API from '../api';
+import API, { getAllPages } from '../api';
 
 export default function Dashboard() {
   const [sessions, setSessions] = useState([]);
@@ -12,7 +12,7 @@ export default function Dashboard() {
   }, []);
 
   const fetchSessions = async () => {
-    const res = await API.get('/sessions'); // ensure backend implements GET /sessions
+    const res = await getAllPages('/sessions'); // ensure backend implements GET /sessions
     setSessions(res.data);
   };
 
@@ -8,7 +8,7 @@ import {
   Plus, Save, Trash2, Edit, Brain, Sparkles, Loader2, CheckCircle, 
   AlertCircle, ArrowLeft, FileText, BookOpen, Users, Settings, RefreshCw
 } from 'lucide-react';
-import API from '../api';
+import API, { getAllPages } from '../api';
 
 const QuizCreator = () => {
   const { sessionId } = useParams();
@@ -65,7 +65,7 @@ const QuizCreator = () => {
   const fetchExistingQuizzes = async () => {
     try {
       const token = localStorage.getItem('token');
-      const response = await API.get(`/sessions/${sessionId}/quizzes`, {
+      const response = await getAllPages(`/sessions/${sessionId}/quizzes`, {
         headers: { Authorization: `Bearer ${token}` }
       });
       